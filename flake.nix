@@ -40,6 +40,7 @@
               ]
               ++ (with python3.pkgs; [
                 docutils
+                filelock
                 huggingface-hub
                 (callPackage ./nix/kernel-abi-check.nix {})
                 mktestdocs
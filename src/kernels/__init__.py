@@ -1,35 +1,53 @@
 import importlib.metadata
-
+from importlib import import_module
+from typing import TYPE_CHECKING
 
 __version__ = importlib.metadata.version("kernels")
 
-from kernels.layer import (
-    CUDAProperties,
-    Device,
-    FuncRepository,
-    LayerRepository,
-    LocalFuncRepository,
-    LocalLayerRepository,
-    LockedFuncRepository,
-    LockedLayerRepository,
-    Mode,
-    kernelize,
-    register_kernel_mapping,
-    replace_kernel_forward_from_hub,
-    use_kernel_forward_from_hub,
-    use_kernel_func_from_hub,
-    use_kernel_mapping,
-)
-from kernels.utils import (
-    get_kernel,
-    get_local_kernel,
-    get_locked_kernel,
-    has_kernel,
-    install_kernel,
-    load_kernel,
-)
-from kernels.benchmark import Benchmark
-
+if TYPE_CHECKING:
+    from kernels.layer import (
+        CUDAProperties,
+        Device,
+        FuncRepository,
+        KernelizePlan,
+        LayerRepository,
+        LocalFuncRepository,
+        LocalLayerRepository,
+        LockedFuncRepository,
+        LockedLayerRepository,
+        Mode,
+        ModulePlan,
+        plan_kernelize,
+        replace_kernel_forward_from_hub,
+        use_kernel_forward_from_hub,
+        use_kernel_func_from_hub,
+    )
+    from kernels.layer.kernelize import (
+        kernelize,
+        prefetch_layers,
+        register_kernel_mapping,
+        use_kernel_mapping,
+    )
+    from kernels.utils import (
+        KernelSpec,
+        get_kernel,
+        get_local_kernel,
+        get_locked_kernel,
+        has_kernel,
+        has_kernels,
+        install_kernel,
+        invalidate_loaded_kernels,
+        load_kernel,
+        loaded_kernels_stats,
+    )
+    from kernels.environment import (
+        EnvironmentFingerprint,
+        current_environment,
+        use_environment,
+    )
+    from kernels.aio import aget_kernel, akernelize
+    from kernels.prefetch import prefetch_kernels
+    from kernels.benchmark import Benchmark
 
 from kernels._windows import _add_additional_dll_paths
 
@@ -40,23 +58,92 @@ __all__ = [
     "Benchmark",
     "CUDAProperties",
     "Device",
+    "EnvironmentFingerprint",
     "FuncRepository",
+    "KernelSpec",
+    "KernelizePlan",
     "LayerRepository",
     "LocalFuncRepository",
     "LocalLayerRepository",
     "LockedFuncRepository",
     "LockedLayerRepository",
     "Mode",
+    "ModulePlan",
+    "aget_kernel",
+    "akernelize",
+    "current_environment",
     "get_kernel",
     "get_local_kernel",
     "get_locked_kernel",
     "has_kernel",
+    "has_kernels",
     "install_kernel",
+    "invalidate_loaded_kernels",
     "kernelize",
     "load_kernel",
+    "loaded_kernels_stats",
+    "plan_kernelize",
+    "prefetch_kernels",
+    "prefetch_layers",
     "register_kernel_mapping",
     "replace_kernel_forward_from_hub",
     "use_kernel_forward_from_hub",
     "use_kernel_func_from_hub",
+    "use_environment",
     "use_kernel_mapping",
 ]
+
+# Public API, imported lazily on first use (PEP 562) so that `import kernels`
+# does not pull in Torch and the Hub client until they are needed.
+_LAZY_IMPORTS = {
+    "Benchmark": "kernels.benchmark",
+    "CUDAProperties": "kernels.layer",
+    "Device": "kernels.layer",
+    "EnvironmentFingerprint": "kernels.environment",
+    "FuncRepository": "kernels.layer",
+    "KernelSpec": "kernels.utils",
+    "KernelizePlan": "kernels.layer",
+    "LayerRepository": "kernels.layer",
+    "LocalFuncRepository": "kernels.layer",
+    "LocalLayerRepository": "kernels.layer",
+    "LockedFuncRepository": "kernels.layer",
+    "LockedLayerRepository": "kernels.layer",
+    "Mode": "kernels.layer",
+    "ModulePlan": "kernels.layer",
+    "aget_kernel": "kernels.aio",
+    "akernelize": "kernels.aio",
+    "current_environment": "kernels.environment",
+    "get_kernel": "kernels.utils",
+    "get_local_kernel": "kernels.utils",
+    "get_locked_kernel": "kernels.utils",
+    "has_kernel": "kernels.utils",
+    "has_kernels": "kernels.utils",
+    "install_kernel": "kernels.utils",
+    "invalidate_loaded_kernels": "kernels.utils",
+    "kernelize": "kernels.layer",
+    "load_kernel": "kernels.utils",
+    "loaded_kernels_stats": "kernels.utils",
+    "plan_kernelize": "kernels.layer",
+    "prefetch_kernels": "kernels.prefetch",
+    "prefetch_layers": "kernels.layer",
+    "register_kernel_mapping": "kernels.layer",
+    "replace_kernel_forward_from_hub": "kernels.layer",
+    "use_kernel_forward_from_hub": "kernels.layer",
+    "use_kernel_func_from_hub": "kernels.layer",
+    "use_environment": "kernels.environment",
+    "use_kernel_mapping": "kernels.layer",
+}
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module_name), name)
+    # Cache the attribute, so that `__getattr__` is only called once per name.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,166 @@
+import importlib.machinery
+import importlib.util
+import logging
+import marshal
+import os
+import py_compile
+import sys
+import tempfile
+import threading
+from importlib.abc import MetaPathFinder
+from pathlib import Path
+
+# Flags of a hash-based .pyc that is checked against its source (PEP 552).
+_CHECKED_HASH_FLAGS = 0b11
+
+
+def bytecode_dir(metadata_dir: Path) -> Path:
+    """Get the directory with precompiled kernel bytecode for this Python version."""
+    return metadata_dir / "pycache" / (sys.implementation.cache_tag or "unknown")
+
+
+def precompile(source_root: Path, variant_path: Path, pycache_dir: Path):
+    """
+    Compile the Python sources of a build variant into the bytecode directory.
+
+    Bytecode is stored outside of the Hub cache snapshot, so that compiling
+    does not add files to the hashed kernel files and works for read-only
+    snapshots.
+    """
+    for dirpath, _, filenames in os.walk(variant_path):
+        for filename in filenames:
+            if not filename.endswith(".py"):
+                continue
+            source_path = Path(dirpath) / filename
+            try:
+                py_compile.compile(
+                    str(source_path),
+                    cfile=str(_bytecode_path(source_root, pycache_dir, source_path)),
+                    doraise=True,
+                    invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+                )
+            except (OSError, py_compile.PyCompileError) as e:
+                logging.debug(f"Cannot precompile {source_path}: {e}")
+
+
+def register_package(package_name: str, source_root: Path, pycache_dir: Path):
+    """Load the modules of a kernel package with bytecode from the bytecode directory."""
+    with _PACKAGES_LOCK:
+        _PACKAGES[package_name] = (source_root, pycache_dir)
+        if _FINDER not in sys.meta_path:
+            sys.meta_path.insert(0, _FINDER)
+
+
+def spec_from_file_location(
+    module_name: str, file_path: Path, source_root: Path, pycache_dir: Path
+) -> importlib.machinery.ModuleSpec | None:
+    """Create a module spec whose loader uses the bytecode directory."""
+    return importlib.util.spec_from_file_location(
+        module_name,
+        file_path,
+        loader=_CachedBytecodeLoader(
+            module_name, str(file_path), source_root, pycache_dir
+        ),
+    )
+
+
+def _bytecode_path(source_root: Path, pycache_dir: Path, source_path: Path) -> Path:
+    # The snapshot path includes the repository and commit, so the bytecode
+    # of different kernel revisions does not clash.
+    relative_path = source_path.relative_to(source_root)
+    return pycache_dir / relative_path.with_suffix(".pyc")
+
+
+class _CachedBytecodeLoader(importlib.machinery.SourceFileLoader):
+    """
+    Source loader that reads and writes bytecode in the bytecode directory.
+
+    The default loader writes `__pycache__` directories next to the sources,
+    which fails for read-only caches.
+    """
+
+    def __init__(self, fullname: str, path: str, source_root: Path, pycache_dir: Path):
+        super().__init__(fullname, path)
+        self._bytecode_path = _bytecode_path(source_root, pycache_dir, Path(path))
+
+    def get_code(self, fullname):
+        source_path = self.get_filename(fullname)
+        source = self.get_data(source_path)
+        source_hash = importlib.util.source_hash(source)
+
+        try:
+            data = self._bytecode_path.read_bytes()
+        except OSError:
+            data = b""
+        if (
+            data[:4] == importlib.util.MAGIC_NUMBER
+            and int.from_bytes(data[4:8], "little") == _CHECKED_HASH_FLAGS
+            and data[8:16] == source_hash
+        ):
+            try:
+                return marshal.loads(memoryview(data)[16:])
+            except (EOFError, ValueError, TypeError):
+                pass
+
+        code = self.source_to_code(source, source_path)
+        if not sys.dont_write_bytecode:
+            self._write_bytecode(
+                importlib.util.MAGIC_NUMBER
+                + _CHECKED_HASH_FLAGS.to_bytes(4, "little")
+                + source_hash
+                + marshal.dumps(code)
+            )
+        return code
+
+    def _write_bytecode(self, data: bytes):
+        try:
+            self._bytecode_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self._bytecode_path.parent)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self._bytecode_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            # The bytecode directory might be read-only.
+            pass
+
+
+class _KernelFinder(MetaPathFinder):
+    """Finds submodules of kernel packages and loads them with cached bytecode."""
+
+    def find_spec(self, fullname, path, target=None):
+        package_name = fullname.partition(".")[0]
+        with _PACKAGES_LOCK:
+            package = _PACKAGES.get(package_name)
+        if package is None or path is None:
+            return None
+
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is None or not isinstance(
+            spec.loader, importlib.machinery.SourceFileLoader
+        ):
+            return spec
+
+        source_root, pycache_dir = package
+        assert spec.origin is not None
+        try:
+            Path(spec.origin).relative_to(source_root)
+        except ValueError:
+            return spec
+
+        return importlib.util.spec_from_file_location(
+            fullname,
+            spec.origin,
+            loader=_CachedBytecodeLoader(
+                fullname, spec.origin, source_root, pycache_dir
+            ),
+            submodule_search_locations=spec.submodule_search_locations,
+        )
+
+
+_PACKAGES: dict[str, tuple[Path, Path]] = {}
+_PACKAGES_LOCK = threading.Lock()
+_FINDER = _KernelFinder()
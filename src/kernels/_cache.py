@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from filelock import BaseFileLock, FileLock, SoftFileLock, Timeout
+from huggingface_hub import constants
+from huggingface_hub.file_download import repo_folder_name
+
+# Default time in seconds that Hub metadata (repository trees and refs) is
+# cached for.
+_DEFAULT_METADATA_TTL = 600
+
+# Default time in seconds to wait for another process that is installing
+# the same kernel.
+_DEFAULT_LOCK_TIMEOUT = 600
+
+
+def metadata_ttl() -> float:
+    """Get the time in seconds that Hub metadata is considered fresh."""
+    return float(os.environ.get("KERNELS_METADATA_TTL", _DEFAULT_METADATA_TTL))
+
+
+def lock_timeout() -> float:
+    """Get the time in seconds to wait for a cache lock."""
+    return float(os.environ.get("KERNELS_LOCK_TIMEOUT", _DEFAULT_LOCK_TIMEOUT))
+
+
+def dedupe_enabled() -> bool:
+    """Check whether downloaded kernels are added to the content-addressed blob store."""
+    return bool(int(os.environ.get("KERNELS_CACHE_DEDUPE", "0")))
+
+
+def precompile_enabled() -> bool:
+    """Check whether the Python sources of downloaded kernels are compiled to bytecode."""
+    return bool(int(os.environ.get("KERNELS_PRECOMPILE", "0")))
+
+
+def cache_root(cache_dir: str | None) -> Path:
+    """Get the directory in which Hub snapshots of kernels are stored."""
+    return Path(cache_dir) if cache_dir is not None else Path(constants.HF_HUB_CACHE)
+
+
+def metadata_dir(cache_dir: str | None) -> Path:
+    """
+    Get the directory in which kernels stores its own cache metadata.
+
+    When a dedicated kernels cache is used, the metadata is stored inside
+    it. Otherwise it is stored next to the Hub cache, so that it does not
+    show up as a corrupted repository in Hub cache scans.
+    """
+    if cache_dir is not None:
+        return Path(cache_dir) / ".kernels"
+    return Path(constants.HF_HOME) / "kernels"
+
+
+def snapshot_path(cache_dir: str | None, repo_id: str, sha: str) -> Path:
+    """Get the path of a Hub snapshot of a kernel repository."""
+    return (
+        cache_root(cache_dir)
+        / repo_folder_name(repo_id=repo_id, repo_type="model")
+        / "snapshots"
+        / sha
+    )
+
+
+def install_lock_path(cache_dir: str | None, repo_id: str) -> Path:
+    """
+    Get the path of the lock that is held while a kernel repository is modified.
+
+    The lock is per repository, since revisions of a repository share blobs.
+    """
+    return metadata_dir(cache_dir) / "locks" / f"{repo_id.replace('/', '--')}.lock"
+
+
+def usage_path(cache_dir: str | None, repo_id: str, sha: str, variant: str) -> Path:
+    """Get the path of the file whose modification time records the last use of a variant."""
+    return (
+        metadata_dir(cache_dir) / "usage" / repo_id.replace("/", "--") / sha / variant
+    )
+
+
+def touch(path: Path):
+    """Set the modification time of a file to now, creating it if necessary."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    except OSError:
+        pass
+
+
+def read_json(path: Path) -> Any | None:
+    """Read a JSON cache file, returns `None` if it is missing or corrupt."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: Path, data: Any):
+    """
+    Atomically write a JSON cache file.
+
+    Failures are ignored, since the cache is an optimization and the
+    cache directory might be read-only.
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            # mkstemp creates files that are only readable by the owner,
+            # use the default permissions so that shared caches work.
+            os.chmod(tmp_path, 0o666 & ~_get_umask())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+
+
+@lru_cache
+def _get_umask() -> int:
+    # The umask can only be read by setting it, so only do this once.
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+class CacheLock:
+    """
+    Cross-process lock on a cache entry.
+
+    Locking is best-effort. `flock` locks are used on local file systems.
+    On network file systems, where `flock` may hang or is not supported,
+    a soft lock (exclusive creation of the lock file) is used, with a
+    short timeout since soft locks outlive crashed processes. When the
+    cache directory is read-only or the lock cannot be acquired within the
+    timeout, the lock is not held and the caller continues without
+    coordination.
+    """
+
+    def __init__(self, path: Path, timeout: float | None = None):
+        self.path = path
+        self.timeout = lock_timeout() if timeout is None else timeout
+        self._lock: BaseFileLock | None = None
+        # Whether the lock could not be acquired because another process holds it.
+        self.contended = False
+
+    def __enter__(self) -> "CacheLock":
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            soft = _filesystem_type(self.path.parent) in _NETWORK_FILESYSTEMS
+            if not soft:
+                try:
+                    self._acquire(FileLock(str(self.path)), self.timeout)
+                except NotImplementedError:
+                    soft = True
+            if soft:
+                self._remove_stale_soft_lock()
+                self._acquire(
+                    SoftFileLock(str(self.path)),
+                    min(self.timeout, _SOFT_LOCK_TIMEOUT),
+                )
+        except Timeout:
+            self.contended = True
+            if self.timeout == 0:
+                return self
+            logging.warning(
+                f"Timed out waiting for cache lock `{self.path}`, continuing without lock"
+            )
+        except (OSError, NotImplementedError) as e:
+            logging.debug(f"Cannot acquire cache lock `{self.path}`: {e}")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._lock is not None:
+            try:
+                self._lock.release()
+            except OSError:
+                pass
+            self._lock = None
+
+    @property
+    def is_locked(self) -> bool:
+        return self._lock is not None
+
+    def _acquire(self, lock: BaseFileLock, timeout: float):
+        lock.acquire(timeout=timeout)
+        self._lock = lock
+
+    def _remove_stale_soft_lock(self):
+        # Soft locks of crashed processes are never released.
+        try:
+            if time.time() - self.path.stat().st_mtime > lock_timeout():
+                self.path.unlink()
+        except OSError:
+            pass
+
+
+# File systems on which `flock` may hang or does not coordinate between hosts.
+_NETWORK_FILESYSTEMS = {
+    "9p",
+    "beegfs",
+    "ceph",
+    "cifs",
+    "fuse.sshfs",
+    "gpfs",
+    "lustre",
+    "nfs",
+    "nfs4",
+    "smb3",
+    "smbfs",
+}
+
+# Time in seconds to wait for a soft lock.
+_SOFT_LOCK_TIMEOUT = 30
+
+
+def _filesystem_type(path: Path) -> str | None:
+    """Get the type of the file system that contains `path`, Linux only."""
+    try:
+        with open("/proc/self/mounts", "r") as f:
+            mounts = f.read().splitlines()
+    except OSError:
+        return None
+
+    real_path = os.path.realpath(path)
+    fs_type = None
+    mount_point_len = -1
+    for mount in mounts:
+        fields = mount.split()
+        if len(fields) < 3:
+            continue
+        mount_point = fields[1].replace("\\040", " ")
+        if (
+            real_path == mount_point
+            or real_path.startswith(mount_point.rstrip("/") + "/")
+        ) and len(mount_point) > mount_point_len:
+            fs_type = fields[2]
+            mount_point_len = len(mount_point)
+
+    return fs_type
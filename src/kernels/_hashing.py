@@ -0,0 +1,57 @@
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Read size for files that cannot be memory-mapped.
+_CHUNK_SIZE = 1 << 20
+
+
+def hash_blob(path: Path, blob_id: str | None = None) -> bytes:
+    """
+    Hash a blob in the Hub cache, without reading it into memory.
+
+    The hash type is determined from the ID of the blob, which defaults to
+    its file name: SHA-1 IDs are Git blobs and hashed as Git objects,
+    SHA-256 IDs are Git LFS blobs.
+    """
+    blob_filename = path.resolve().name if blob_id is None else blob_id
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+
+        if len(blob_filename) == 40:
+            # SHA-1 hashed, so a Git blob.
+            m = hashlib.sha1()
+            m.update(f"blob {size}\0".encode())
+        elif len(blob_filename) == 64:
+            # SHA-256 hashed, so a Git LFS blob.
+            m = hashlib.sha256()
+        else:
+            raise ValueError(f"Unexpected blob filename length: {len(blob_filename)}")
+
+        if size > 0:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # hashlib releases the GIL for large updates, so this
+                    # hashes in parallel when called from multiple threads.
+                    m.update(mm)
+                return m.digest()
+            except (OSError, ValueError):
+                # Not all file systems support mmap, fall back to reading
+                # the file in chunks.
+                f.seek(0)
+
+        while chunk := f.read(_CHUNK_SIZE):
+            m.update(chunk)
+
+    return m.digest()
+
+
+def hash_blobs(paths: list[Path], max_workers: int | None = None) -> list[bytes]:
+    """Hash blobs concurrently, returns the digests in the order of `paths`."""
+    if len(paths) <= 1:
+        return [hash_blob(path) for path in paths]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(hash_blob, paths))
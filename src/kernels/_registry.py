@@ -0,0 +1,101 @@
+import threading
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Callable, NamedTuple
+
+
+class KernelKey(NamedTuple):
+    repo_id: str
+    sha: str
+    variant: str
+
+
+@dataclass(frozen=True)
+class KernelRegistryStats:
+    """
+    Statistics of the process-wide registry of loaded kernels.
+
+    Args:
+        hits (`int`):
+            Number of kernel loads that were served from the registry.
+        misses (`int`):
+            Number of kernel loads that had to import the kernel module.
+        size (`int`):
+            Number of kernel modules currently in the registry.
+    """
+
+    hits: int
+    misses: int
+    size: int
+
+
+class KernelRegistry:
+    """
+    Thread-safe registry of kernel modules that were imported in this process.
+
+    Kernels are keyed by repository, commit SHA and build variant, so a
+    kernel is only imported once per process for a given revision.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modules: dict[KernelKey, ModuleType] = {}
+        # Per-key locks, so that concurrent loads of the same kernel import
+        # it once, without serializing loads of unrelated kernels.
+        self._key_locks: dict[KernelKey, threading.Lock] = {}
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: KernelKey) -> ModuleType | None:
+        with self._lock:
+            module = self._modules.get(key)
+            if module is not None:
+                self._hits += 1
+            return module
+
+    def get_or_load(self, key: KernelKey, load: Callable[[], ModuleType]) -> ModuleType:
+        with self._lock:
+            module = self._modules.get(key)
+            if module is not None:
+                self._hits += 1
+                return module
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # Another thread may have imported the kernel while we were
+                # waiting for the key lock.
+                module = self._modules.get(key)
+                if module is not None:
+                    self._hits += 1
+                    return module
+
+            try:
+                module = load()
+                with self._lock:
+                    self._misses += 1
+                    self._modules[key] = module
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+
+        return module
+
+    def invalidate(self, repo_id: str | None = None, sha: str | None = None) -> int:
+        """Remove kernels from the registry, returns the number of removed kernels."""
+        with self._lock:
+            keys = [
+                key
+                for key in self._modules
+                if (repo_id is None or key.repo_id == repo_id)
+                and (sha is None or key.sha == sha)
+            ]
+            for key in keys:
+                del self._modules[key]
+            return len(keys)
+
+    def stats(self) -> KernelRegistryStats:
+        with self._lock:
+            return KernelRegistryStats(
+                hits=self._hits, misses=self._misses, size=len(self._modules)
+            )
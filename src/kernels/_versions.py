@@ -1,13 +1,25 @@
-from huggingface_hub import HfApi
+import logging
+import threading
+import time
+from pathlib import Path
+
+from huggingface_hub import HfApi, constants
 from huggingface_hub.hf_api import GitRefInfo
 from packaging.specifiers import SpecifierSet
 from packaging.version import InvalidVersion, Version
 
+from kernels import tracing
+from kernels._cache import metadata_dir, metadata_ttl, read_json, write_json
+
+# Repositories for which the cached refs are being refreshed.
+_REVALIDATING: set[str] = set()
+_REVALIDATING_LOCK = threading.Lock()
+
 
 def _get_available_versions(repo_id: str) -> dict[Version, GitRefInfo]:
     """Get kernel versions that are available in the repository."""
     versions = {}
-    for tag in HfApi().list_repo_refs(repo_id).tags:
+    for tag in _get_tags(repo_id):
         if not tag.name.startswith("v"):
             continue
         try:
@@ -18,6 +30,66 @@ def _get_available_versions(repo_id: str) -> dict[Version, GitRefInfo]:
     return versions
 
 
+def _get_tags(repo_id: str) -> list[GitRefInfo]:
+    """
+    Get the tags of a repository, using the refs cache when possible.
+
+    Fresh cache entries are used as-is. Stale entries are used as well, but
+    they are refreshed in the background (stale-while-revalidate). In offline
+    mode, cached entries are used regardless of their age.
+    """
+    cache_path = _refs_cache_path(repo_id)
+    entry = read_json(cache_path)
+    if entry is not None:
+        tags = [GitRefInfo(**tag) for tag in entry["tags"]]
+        if constants.HF_HUB_OFFLINE or time.time() - entry["time"] < metadata_ttl():
+            return tags
+        _revalidate_tags(repo_id, cache_path)
+        return tags
+
+    return _fetch_tags(repo_id, cache_path)
+
+
+def _fetch_tags(repo_id: str, cache_path: Path) -> list[GitRefInfo]:
+    tags = HfApi().list_repo_refs(repo_id).tags
+    write_json(
+        cache_path,
+        {
+            "time": time.time(),
+            "tags": [
+                {"name": tag.name, "ref": tag.ref, "target_commit": tag.target_commit}
+                for tag in tags
+            ],
+        },
+    )
+    return tags
+
+
+def _revalidate_tags(repo_id: str, cache_path: Path):
+    with _REVALIDATING_LOCK:
+        if repo_id in _REVALIDATING:
+            return
+        _REVALIDATING.add(repo_id)
+
+    def revalidate():
+        try:
+            _fetch_tags(repo_id, cache_path)
+        except Exception as e:
+            logging.debug(f"Failed to refresh refs of `{repo_id}`: {e}")
+        finally:
+            with _REVALIDATING_LOCK:
+                _REVALIDATING.discard(repo_id)
+
+    threading.Thread(target=revalidate, daemon=True).start()
+
+
+def _refs_cache_path(repo_id: str) -> Path:
+    # Imported here, kernels.utils depends on this module.
+    from kernels.utils import CACHE_DIR
+
+    return metadata_dir(CACHE_DIR) / "refs" / f"{repo_id.replace('/', '--')}.json"
+
+
 def resolve_version_spec_as_ref(repo_id: str, version_spec: str) -> GitRefInfo:
     """
     Get the locks for a kernel with the given version spec.
@@ -45,6 +117,8 @@ def select_revision_or_version(
     elif revision is None and version is None:
         revision = "main"
     elif version is not None:
-        revision = resolve_version_spec_as_ref(repo_id, version).target_commit
+        with tracing.span("resolve_revision", repo_id=repo_id) as span:
+            revision = resolve_version_spec_as_ref(repo_id, version).target_commit
+            span.set(revision=revision)
     assert revision is not None
     return revision
@@ -0,0 +1,116 @@
+import asyncio
+import weakref
+from types import ModuleType
+from typing import TYPE_CHECKING
+
+from kernels.layer import Mode, kernelize
+from kernels.utils import get_kernel
+
+if TYPE_CHECKING:
+    import torch
+    from torch import nn
+
+# In-flight kernel loads per event loop, so that coroutines that request the
+# same kernel share the download and import.
+_IN_FLIGHT: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+async def aget_kernel(
+    repo_id: str,
+    revision: str | None = None,
+    version: str | None = None,
+    user_agent: str | dict | None = None,
+) -> ModuleType:
+    """
+    Load a kernel from the kernel hub without blocking the event loop.
+
+    This is the asynchronous variant of [`get_kernel`]. Revision resolution, downloading, validation
+    and importing of the kernel are done in a worker thread. Concurrent calls for the same kernel
+    share a single load.
+
+    Args:
+        repo_id (`str`):
+            The Hub repository containing the kernel.
+        revision (`str`, *optional*, defaults to `"main"`):
+            The specific revision (branch, tag, or commit) to download. Cannot be used together with `version`.
+        version (`str`, *optional*):
+            The kernel version to download. This can be a Python version specifier, such as `">=1.0.0,<2.0.0"`.
+            Cannot be used together with `revision`.
+        user_agent (`Union[str, dict]`, *optional*):
+            The `user_agent` info to pass to `snapshot_download()` for internal telemetry.
+
+    Returns:
+        `ModuleType`: The imported kernel module.
+
+    Example:
+        ```python
+        import asyncio
+
+        from kernels import aget_kernel
+
+        async def main():
+            activation, layer_norm = await asyncio.gather(
+                aget_kernel("kernels-community/activation"),
+                aget_kernel("kernels-community/triton-layer-norm"),
+            )
+
+        asyncio.run(main())
+        ```
+    """
+    loop = asyncio.get_running_loop()
+    in_flight = _IN_FLIGHT.setdefault(loop, {})
+
+    key = (repo_id, revision, version)
+    future = in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(
+            asyncio.to_thread(
+                get_kernel,
+                repo_id,
+                revision=revision,
+                version=version,
+                user_agent=user_agent,
+            )
+        )
+        in_flight[key] = future
+        future.add_done_callback(lambda _: in_flight.pop(key, None))
+
+    # Shield the shared load, so that cancellation of one waiter does not
+    # cancel the load for the other waiters.
+    return await asyncio.shield(future)
+
+
+async def akernelize(
+    model: "nn.Module",
+    *,
+    mode: Mode,
+    device: "str | torch.device | None" = None,
+    use_fallback: bool = True,
+) -> "nn.Module":
+    """
+    Replace layer forward methods with optimized kernel implementations without blocking the event loop.
+
+    This is the asynchronous variant of [`kernelize`]. Kernelization, including downloading and
+    importing kernels, is done in a worker thread using the kernel mapping of the calling context.
+
+    Args:
+        model (`nn.Module`):
+            The PyTorch model to kernelize.
+        mode ([`Mode`]): The mode that the kernel is going to be used in. For example,
+            `Mode.TRAINING | Mode.TORCH_COMPILE` kernelizes the model for training with
+            `torch.compile`.
+        device (`Union[str, torch.device]`, *optional*):
+            The device type to load kernels for. Supported device types are: "cuda", "mps", "npu", "rocm", "xpu".
+            The device type will be inferred from the model parameters when not provided.
+        use_fallback (`bool`, *optional*, defaults to `True`):
+            Whether to use the original forward method of modules when no compatible kernel could be found.
+            If set to `False`, an exception will be raised in such cases.
+
+    Returns:
+        `nn.Module`: The kernelized model with optimized kernel implementations.
+    """
+    # asyncio.to_thread propagates the context, so the worker thread sees
+    # the kernel mappings that are active in the calling coroutine.
+    return await asyncio.to_thread(
+        kernelize, model, mode=mode, device=device, use_fallback=use_fallback
+    )
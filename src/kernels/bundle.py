@@ -0,0 +1,438 @@
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, BinaryIO, ContextManager, Iterable, cast
+
+from huggingface_hub.file_download import repo_folder_name
+
+from kernels._cache import _get_umask, cache_root, snapshot_path
+from kernels._hashing import hash_blob
+from kernels.environment import EnvironmentFingerprint
+from kernels.lockfile import KernelLock, VariantLock
+from kernels.prefetch import prefetch_kernels
+
+# Name of the bundle index, which is always the first member of a bundle.
+_INDEX_NAME = "kernels-bundle.json"
+
+_BUNDLE_VERSION = 1
+
+# Blob IDs are Git blob (SHA-1) or Git LFS (SHA-256) hashes.
+_BLOB_ID_REGEX = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})$")
+
+# Hub repository IDs (`namespace/name`), which are used in cache paths.
+_REPO_ID_REGEX = re.compile(r"^(?!.*\.\.)[\w.-]+/[\w.-]+$")
+
+
+@dataclass(frozen=True)
+class BundledKernel:
+    """
+    A kernel revision in a kernel bundle.
+
+    Args:
+        repo_id (`str`):
+            The Hub repository containing the kernel.
+        sha (`str`):
+            The commit SHA of the revision.
+        variants (`tuple[str, ...]`):
+            The build variants of the revision in the bundle.
+    """
+
+    repo_id: str
+    sha: str
+    variants: tuple[str, ...]
+
+
+def export_bundle(
+    kernel_locks: Iterable[KernelLock],
+    output: Path | BinaryIO,
+    *,
+    all_variants: bool = False,
+    targets: Iterable[str | EnvironmentFingerprint] | None = None,
+    max_workers: int | None = None,
+    local_files_only: bool = False,
+) -> list[BundledKernel]:
+    """
+    Export locked kernels to a bundle for use on machines without Hub access.
+
+    The locked revisions are downloaded to the kernel cache first when necessary. Only the
+    build variants that would be loaded in the current or target environments are exported,
+    unless `all_variants` is set. The bundle is a tar archive that is written as a stream, so
+    `output` does not need to be seekable.
+
+    Args:
+        kernel_locks (`Iterable[KernelLock]`):
+            The kernels to export, e.g. the locks of a `kernels.lock` file.
+        output (`Union[Path, BinaryIO]`):
+            The path of the bundle, or a binary file object to write the bundle to.
+        all_variants (`bool`, *optional*, defaults to `False`):
+            Whether to export all build variants of the kernels.
+        targets (`Iterable[Union[str, EnvironmentFingerprint]]`, *optional*):
+            The environments to export kernels for, instead of the current environment.
+        max_workers (`int`, *optional*):
+            The maximum number of kernels to download concurrently.
+        local_files_only (`bool`, *optional*, defaults to `False`):
+            Whether to only export kernels that are in the kernel cache, without downloading from the Hub.
+
+    Returns:
+        `list[BundledKernel]`: The kernel revisions in the bundle.
+
+    Example:
+        ```python
+        from pathlib import Path
+
+        from kernels.bundle import export_bundle
+        from kernels.lockfile import LockfileIndex
+
+        export_bundle(LockfileIndex.load(Path("kernels.lock")), Path("kernels.tar"))
+        ```
+    """
+    kernel_locks = list(kernel_locks)
+    results = prefetch_kernels(
+        kernel_locks,
+        max_workers=max_workers,
+        all_variants=all_variants,
+        targets=targets,
+        local_files_only=local_files_only,
+    )
+
+    errors = [
+        f"`{result.repo_id}`: {result.error}" for result in results if not result.ok
+    ]
+    if errors:
+        raise ValueError(f"Cannot download kernels: {'; '.join(errors)}")
+
+    # Collect the build variants per locked revision.
+    variant_paths: dict[tuple[str, str], dict[str, Path]] = {}
+    for result in results:
+        assert result.path is not None and result.revision is not None
+        paths = (
+            [path for path in result.path.iterdir() if path.is_dir()]
+            if all_variants
+            else [result.path]
+        )
+        revision_variants = variant_paths.setdefault(
+            (result.repo_id, result.revision), {}
+        )
+        for path in paths:
+            revision_variants[path.name] = path
+
+    locks = {(lock.repo_id, lock.sha): lock for lock in kernel_locks}
+    index_kernels: list[dict] = []
+    blobs: dict[str, Path] = {}
+    for (repo_id, sha), revision_variants in variant_paths.items():
+        kernel_lock = locks[(repo_id, sha)]
+        index_variants = {}
+        for variant, variant_path in sorted(revision_variants.items()):
+            variant_lock = kernel_lock.variants.get(variant)
+            if variant_lock is None:
+                raise ValueError(
+                    f"No lock found for build variant of `{repo_id}`: {variant}"
+                )
+            files = {}
+            for rel_path, blob_path in _variant_blobs(variant_path):
+                files[rel_path] = blob_path.name
+                blobs.setdefault(blob_path.name, blob_path)
+            index_variants[variant] = {"hash": variant_lock.hash, "files": files}
+        index_kernels.append(
+            {"repo_id": repo_id, "sha": sha, "variants": index_variants}
+        )
+
+    index = json.dumps({"version": _BUNDLE_VERSION, "kernels": index_kernels}).encode(
+        "utf-8"
+    )
+
+    with _open(output, "wb") as f, tarfile.open(fileobj=f, mode="w|") as tar:
+        index_info = tarfile.TarInfo(_INDEX_NAME)
+        index_info.size = len(index)
+        tar.addfile(index_info, io.BytesIO(index))
+        for blob_id, blob_path in sorted(blobs.items()):
+            tar.add(blob_path, arcname=f"blobs/{blob_id}", recursive=False)
+
+    return [
+        BundledKernel(
+            repo_id=kernel["repo_id"],
+            sha=kernel["sha"],
+            variants=tuple(kernel["variants"]),
+        )
+        for kernel in index_kernels
+    ]
+
+
+def import_bundle(
+    bundle: Path | BinaryIO,
+    *,
+    kernel_locks: Iterable[KernelLock] | None = None,
+    max_workers: int | None = None,
+) -> list[BundledKernel]:
+    """
+    Import a kernel bundle into the kernel cache.
+
+    Blobs are verified against their hashes while the bundle is read, and build variants
+    are verified against the hashes of their locks. After importing, the kernels can be
+    loaded with [`load_kernel`] or locked layer repositories without access to the Hub.
+
+    The bundle index contains the hashes of the build variants. These hashes are only
+    trusted when `kernel_locks` is not given, in which case the bundle is as trustworthy
+    as its source. Pass the locks of the project to verify the bundle against them.
+
+    Args:
+        bundle (`Union[Path, BinaryIO]`):
+            The path of the bundle, or a binary file object to read the bundle from.
+        kernel_locks (`Iterable[KernelLock]`, *optional*):
+            The locks to verify the build variants against, e.g. the locks of a `kernels.lock`
+            file. Every kernel revision and build variant in the bundle must be locked.
+        max_workers (`int`, *optional*):
+            The maximum number of blobs to verify concurrently.
+
+    Returns:
+        `list[BundledKernel]`: The imported kernel revisions.
+
+    Example:
+        ```python
+        from pathlib import Path
+
+        from kernels.bundle import import_bundle
+        from kernels.lockfile import LockfileIndex
+
+        import_bundle(Path("kernels.tar"), kernel_locks=LockfileIndex.load(Path("kernels.lock")))
+        ```
+    """
+    from kernels.utils import CACHE_DIR, _index_variant
+
+    locks = (
+        None
+        if kernel_locks is None
+        else {(lock.repo_id, lock.sha): lock for lock in kernel_locks}
+    )
+
+    index = None
+    # Repositories that use a blob, blobs are removed once they are read.
+    blob_repos: dict[str, list[str]] = {}
+    verified: list[Future] = []
+    with (
+        _open(bundle, "rb") as f,
+        tarfile.open(fileobj=f, mode="r|*") as tar,
+        ThreadPoolExecutor(max_workers) as executor,
+    ):
+        for member in tar:
+            if index is None:
+                if member.name != _INDEX_NAME or not member.isfile():
+                    raise ValueError("Kernel bundle does not start with an index")
+                index = _read_index(tar.extractfile(member))
+                if locks is not None:
+                    _check_locked(index, locks)
+                for kernel in index["kernels"]:
+                    for variant in kernel["variants"].values():
+                        for blob_id in variant["files"].values():
+                            repos = blob_repos.setdefault(blob_id, [])
+                            if kernel["repo_id"] not in repos:
+                                repos.append(kernel["repo_id"])
+                continue
+
+            blob_id = member.name.removeprefix("blobs/")
+            if (
+                not member.isfile()
+                or member.name == blob_id
+                or _BLOB_ID_REGEX.match(blob_id) is None
+            ):
+                raise ValueError(f"Unexpected member in kernel bundle: {member.name}")
+            if blob_id not in blob_repos:
+                continue
+
+            blob_paths = [
+                _blob_path(CACHE_DIR, repo_id, blob_id)
+                for repo_id in blob_repos.pop(blob_id)
+            ]
+            if all(blob_path.exists() for blob_path in blob_paths):
+                continue
+
+            blob_paths[0].parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=blob_paths[0].parent, suffix=".incomplete"
+            )
+            blob_reader = tar.extractfile(member)
+            assert blob_reader is not None
+            with os.fdopen(fd, "wb") as blob_file:
+                shutil.copyfileobj(blob_reader, blob_file)
+            # mkstemp creates files that are only readable by the owner.
+            os.chmod(tmp_path, 0o666 & ~_get_umask())
+
+            # Verification is done concurrently with reading the rest of the bundle.
+            verified.append(
+                executor.submit(_verify_blob, Path(tmp_path), blob_id, blob_paths)
+            )
+
+        for future in verified:
+            future.result()
+
+    if index is None:
+        raise ValueError("Kernel bundle does not contain an index")
+    missing = ", ".join(
+        sorted(
+            blob_id
+            for blob_id, repos in blob_repos.items()
+            if not all(
+                _blob_path(CACHE_DIR, repo_id, blob_id).exists() for repo_id in repos
+            )
+        )
+    )
+    if missing:
+        raise ValueError(f"Kernel bundle is missing blobs: {missing}")
+
+    imported = []
+    for kernel in index["kernels"]:
+        repo_id, sha = kernel["repo_id"], kernel["sha"]
+        repo_path = snapshot_path(CACHE_DIR, repo_id, sha)
+        for variant, variant_entry in kernel["variants"].items():
+            variant_path = repo_path / "build" / variant
+            files = variant_entry["files"]
+            _check_variant_hash(repo_id, variant, files, variant_entry["hash"])
+            for rel_path, blob_id in files.items():
+                _link_blob(
+                    _blob_path(CACHE_DIR, repo_id, blob_id), variant_path / rel_path
+                )
+            _index_variant(
+                repo_id,
+                variant_path,
+                {variant: VariantLock(hash=variant_entry["hash"])},
+            )
+        imported.append(
+            BundledKernel(repo_id=repo_id, sha=sha, variants=tuple(kernel["variants"]))
+        )
+
+    return imported
+
+
+def _variant_blobs(variant_path: Path) -> list[tuple[str, Path]]:
+    """Get the relative paths and blob paths of the files of a build variant."""
+    files = []
+    for dirpath, _, filenames in os.walk(variant_path):
+        for filename in filenames:
+            file_abs = Path(dirpath) / filename
+            # Only files that are symlinked blobs are part of the kernel,
+            # e.g. bytecode files are created when importing a kernel.
+            if file_abs.is_symlink():
+                files.append(
+                    (file_abs.relative_to(variant_path).as_posix(), file_abs.resolve())
+                )
+    return sorted(files)
+
+
+def _read_index(f: IO[bytes] | None) -> dict:
+    assert f is not None
+    try:
+        index = json.load(f)
+    except ValueError as e:
+        raise ValueError(f"Invalid kernel bundle index: {e}")
+    if index.get("version") != _BUNDLE_VERSION:
+        raise ValueError(f"Unsupported kernel bundle version: {index.get('version')}")
+
+    from kernels.utils import _is_commit_sha
+
+    for kernel in index["kernels"]:
+        repo_id = kernel["repo_id"]
+        if not isinstance(repo_id, str) or _REPO_ID_REGEX.match(repo_id) is None:
+            raise ValueError(f"Invalid repository in kernel bundle: {repo_id}")
+        if not isinstance(kernel["sha"], str) or not _is_commit_sha(kernel["sha"]):
+            raise ValueError(f"Invalid commit SHA in kernel bundle: {kernel['sha']}")
+        for variant, variant_entry in kernel["variants"].items():
+            for rel_path in [variant, *variant_entry["files"]]:
+                if Path(rel_path).is_absolute() or ".." in Path(rel_path).parts:
+                    raise ValueError(f"Invalid path in kernel bundle: {rel_path}")
+
+    return index
+
+
+def _check_locked(index: dict, locks: dict[tuple[str, str], KernelLock]):
+    """Check that the build variants in a bundle index have the hashes of their locks."""
+    for kernel in index["kernels"]:
+        repo_id, sha = kernel["repo_id"], kernel["sha"]
+        kernel_lock = locks.get((repo_id, sha))
+        if kernel_lock is None:
+            raise ValueError(f"Kernel bundle contains unlocked `{repo_id}` at {sha}")
+        for variant, variant_entry in kernel["variants"].items():
+            variant_lock = kernel_lock.variants.get(variant)
+            if variant_lock is None:
+                raise ValueError(
+                    f"No lock found for build variant of `{repo_id}`: {variant}"
+                )
+            if variant_entry["hash"] != variant_lock.hash:
+                raise ValueError(
+                    f"Kernel bundle specifies `{repo_id}` variant {variant} with hash {variant_entry['hash']}, but it is locked with hash: {variant_lock.hash}"
+                )
+
+
+def _blob_path(cache_dir: str | None, repo_id: str, blob_id: str) -> Path:
+    return (
+        cache_root(cache_dir)
+        / repo_folder_name(repo_id=repo_id, repo_type="model")
+        / "blobs"
+        / blob_id
+    )
+
+
+def _verify_blob(tmp_path: Path, blob_id: str, blob_paths: list[Path]):
+    """Verify a blob against its ID and move it to the blob paths of all repositories."""
+    try:
+        digest = hash_blob(tmp_path, blob_id)
+        if digest.hex() != blob_id:
+            raise ValueError(
+                f"Blob {blob_id} in kernel bundle has hash: {digest.hex()}"
+            )
+        for blob_path in blob_paths[1:]:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(tmp_path, blob_path)
+            except FileExistsError:
+                pass
+            except OSError:
+                shutil.copyfile(tmp_path, blob_path)
+        os.replace(tmp_path, blob_paths[0])
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _check_variant_hash(
+    repo_id: str, variant: str, files: dict[str, str], expected_hash: str
+):
+    # The blobs are verified, so the hash of the variant can be computed from
+    # the blob IDs. This is the same hash as computed by `validate_kernel`.
+    m = hashlib.sha256()
+    for rel_path, blob_id in sorted(
+        (rel_path.encode("utf-8"), blob_id) for rel_path, blob_id in files.items()
+    ):
+        m.update(rel_path)
+        m.update(bytes.fromhex(blob_id))
+
+    computed_hash = f"sha256-{m.hexdigest()}"
+    if computed_hash != expected_hash:
+        raise ValueError(
+            f"Kernel bundle specifies `{repo_id}` variant {variant} with hash {expected_hash}, but its files have hash: {computed_hash}"
+        )
+
+
+def _link_blob(blob_path: Path, file_path: Path):
+    """Link a file in a snapshot to its blob, like the Hub cache does."""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    if file_path.is_symlink() or file_path.exists():
+        return
+    try:
+        os.symlink(os.path.relpath(blob_path, file_path.parent), file_path)
+    except OSError:
+        # Symlinks are not always supported on Windows.
+        shutil.copyfile(blob_path, file_path)
+
+
+def _open(path_or_file: Path | BinaryIO, mode: str) -> ContextManager[BinaryIO]:
+    if isinstance(path_or_file, Path):
+        return cast(BinaryIO, open(path_or_file, mode))
+    return nullcontext(path_or_file)
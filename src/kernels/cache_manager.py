@@ -0,0 +1,474 @@
+import logging
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+from huggingface_hub import CachedRevisionInfo, scan_cache_dir
+from huggingface_hub.errors import CacheNotFound
+
+from kernels._cache import (
+    CacheLock,
+    cache_root,
+    install_lock_path,
+    metadata_dir,
+    read_json,
+    usage_path,
+)
+from kernels._hashing import hash_blob
+from kernels.lockfile import LockfileIndex
+
+_SIZE_REGEX = re.compile(
+    r"^\s*(?P<size>\d+(?:\.\d+)?)\s*(?P<unit>[kmgtp]?)i?b?\s*$", re.I
+)
+
+# Blob IDs are Git blob (SHA-1) or Git LFS (SHA-256) hashes.
+_BLOB_ID_REGEX = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})$")
+
+_SIZE_UNITS = {
+    "": 1,
+    "k": 1 << 10,
+    "m": 1 << 20,
+    "g": 1 << 30,
+    "t": 1 << 40,
+    "p": 1 << 50,
+}
+
+
+@dataclass(frozen=True)
+class CachedKernel:
+    """
+    A revision of a kernel in the kernel cache.
+
+    Args:
+        repo_id (`str`):
+            The Hub repository containing the kernel.
+        sha (`str`):
+            The commit SHA of the revision.
+        refs (`frozenset[str]`):
+            Branches and tags that point to the revision.
+        variants (`tuple[str, ...]`):
+            The build variants of the revision that are in the cache.
+        size_on_disk (`int`):
+            The size of the revision's files in bytes. Files that are shared with other
+            revisions are included.
+        last_used (`float`):
+            Time when the revision was last loaded, as a Unix timestamp. When the revision
+            was never loaded by a version of `kernels` that records use, this is the time
+            that the revision was downloaded.
+        snapshot_path (`Path`):
+            The path of the revision's snapshot.
+    """
+
+    repo_id: str
+    sha: str
+    refs: frozenset[str]
+    variants: tuple[str, ...]
+    size_on_disk: int
+    last_used: float
+    snapshot_path: Path
+    _blobs: dict[tuple[int, int], int] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+
+
+@dataclass(frozen=True)
+class KernelCacheInfo:
+    """
+    Kernels in the kernel cache.
+
+    Args:
+        kernels (`list[CachedKernel]`):
+            The cached kernel revisions, least recently used first.
+        size_on_disk (`int`):
+            The total size of the cached kernels in bytes. Files that are shared between
+            revisions, including deduplicated files, are only counted once.
+    """
+
+    kernels: list[CachedKernel]
+    size_on_disk: int
+
+
+def scan_kernel_cache() -> KernelCacheInfo:
+    """
+    Scan the kernel cache.
+
+    Only repositories with kernel builds are included, so that other repositories in a
+    shared Hugging Face Hub cache are left alone.
+
+    Returns:
+        [`KernelCacheInfo`]: The kernels in the cache.
+    """
+    from kernels.utils import CACHE_DIR
+
+    try:
+        hf_cache_info = scan_cache_dir(cache_root(CACHE_DIR))
+    except CacheNotFound:
+        return KernelCacheInfo(kernels=[], size_on_disk=0)
+
+    kernels = []
+    for repo in hf_cache_info.repos:
+        if repo.repo_type != "model":
+            continue
+        for revision in repo.revisions:
+            build_path = revision.snapshot_path / "build"
+            if not build_path.is_dir():
+                continue
+            variants = tuple(
+                sorted(
+                    entry.name
+                    for entry in build_path.iterdir()
+                    if entry.name.startswith("torch")
+                )
+            )
+            if not variants:
+                continue
+
+            last_used = revision.last_modified
+            for variant in variants:
+                try:
+                    last_used = max(
+                        last_used,
+                        usage_path(
+                            CACHE_DIR, repo.repo_id, revision.commit_hash, variant
+                        )
+                        .stat()
+                        .st_mtime,
+                    )
+                except OSError:
+                    pass
+
+            kernels.append(
+                CachedKernel(
+                    repo_id=repo.repo_id,
+                    sha=revision.commit_hash,
+                    refs=frozenset(revision.refs),
+                    variants=variants,
+                    size_on_disk=revision.size_on_disk,
+                    last_used=last_used,
+                    snapshot_path=revision.snapshot_path,
+                    _blobs=_file_sizes(file.blob_path for file in revision.files),
+                )
+            )
+
+    kernels.sort(key=lambda kernel: (kernel.last_used, kernel.repo_id, kernel.sha))
+    return KernelCacheInfo(kernels=kernels, size_on_disk=_unique_size(kernels))
+
+
+def prune_kernel_cache(
+    max_size: int | str | None = None,
+    *,
+    lockfiles: Iterable[Path] = (),
+    protect: Iterable[tuple[str, str]] = (),
+    dry_run: bool = False,
+) -> list[CachedKernel]:
+    """
+    Evict the least recently used kernel revisions until the kernel cache fits in a size budget.
+
+    Args:
+        max_size (`Union[int, str]`, *optional*):
+            The size budget in bytes, or as a string with a unit such as `"10GB"`. Defaults to the
+            value of the `KERNELS_CACHE_MAX_SIZE` environment variable.
+        lockfiles (`Iterable[Path]`, *optional*):
+            Lockfiles whose locked revisions are never evicted.
+        protect (`Iterable[tuple[str, str]]`, *optional*):
+            Additional `(repo_id, sha)` pairs that are never evicted.
+        dry_run (`bool`, *optional*, defaults to `False`):
+            Only return the revisions that would be evicted.
+
+    Returns:
+        `list[CachedKernel]`: The evicted kernel revisions.
+
+    Example:
+        ```python
+        from pathlib import Path
+
+        from kernels.cache_manager import prune_kernel_cache
+
+        evicted = prune_kernel_cache("10GB", lockfiles=[Path("kernels.lock")], dry_run=True)
+        ```
+    """
+    if max_size is None:
+        max_size = os.environ.get("KERNELS_CACHE_MAX_SIZE")
+        if max_size is None:
+            raise ValueError(
+                "No cache size budget given and KERNELS_CACHE_MAX_SIZE is not set"
+            )
+    if isinstance(max_size, str):
+        max_size = parse_size(max_size)
+
+    pinned = set(protect)
+    for lockfile in lockfiles:
+        pinned.update(
+            (kernel_lock.repo_id, kernel_lock.sha)
+            for kernel_lock in LockfileIndex.load(lockfile)
+        )
+
+    cache_info = scan_kernel_cache()
+    size = cache_info.size_on_disk
+
+    # Number of remaining kernels that use each blob, so that the size of
+    # the cache can be updated for each eviction.
+    blob_refs: dict[tuple[int, int], int] = {}
+    for kernel in cache_info.kernels:
+        for blob in kernel._blobs:
+            blob_refs[blob] = blob_refs.get(blob, 0) + 1
+
+    evictor = None if dry_run else _Evictor()
+    evicted = []
+    for kernel in cache_info.kernels:
+        if size <= max_size:
+            break
+        if (kernel.repo_id, kernel.sha) in pinned:
+            continue
+        if evictor is not None and not evictor.evict(kernel):
+            continue
+        for blob, blob_size in kernel._blobs.items():
+            blob_refs[blob] -= 1
+            if blob_refs[blob] == 0:
+                size -= blob_size
+        evicted.append(kernel)
+
+    if evicted and not dry_run:
+        _prune_blob_store()
+
+    return evicted
+
+
+def dedupe_kernel_cache(*, dry_run: bool = False) -> int:
+    """
+    Deduplicate identical files of cached kernels.
+
+    Hub cache blobs are named by the hash of their contents, so the same file in
+    different kernel revisions or repositories has the same name. Each blob is hard
+    linked to an entry in a content-addressed blob store in the kernel cache, so that
+    identical blobs only take disk space once. Set `KERNELS_CACHE_DEDUPE=1` to
+    deduplicate kernels when they are downloaded.
+
+    Args:
+        dry_run (`bool`, *optional*, defaults to `False`):
+            Only compute the disk space that would be reclaimed.
+
+    Returns:
+        `int`: The disk space in bytes that was (or would be) reclaimed.
+
+    Example:
+        ```python
+        from kernels.cache_manager import dedupe_kernel_cache, format_size
+
+        print(format_size(dedupe_kernel_cache(dry_run=True)))
+        ```
+    """
+    blob_paths: dict[str, set[Path]] = {}
+    for kernel in scan_kernel_cache().kernels:
+        for file_path in kernel.snapshot_path.rglob("*"):
+            if file_path.is_symlink():
+                blob_path = file_path.resolve()
+                if _BLOB_ID_REGEX.match(blob_path.name) is not None:
+                    blob_paths.setdefault(blob_path.name, set()).add(blob_path)
+
+    store_dir = _blob_store_dir()
+    reclaimed = 0
+    for blob_id, paths in sorted(blob_paths.items()):
+        store_path = store_dir / blob_id
+        sizes = _file_sizes([store_path, *paths])
+        if len(sizes) > 1:
+            reclaimed += sum(sorted(sizes.values())[:-1])
+        if not dry_run:
+            for path in sorted(paths):
+                _link_to_blob_store(path)
+
+    if not dry_run:
+        _prune_blob_store()
+
+    return reclaimed
+
+
+def parse_size(size: str) -> int:
+    """Parse a size such as `"500MB"` or `"10G"` into bytes. Units are powers of 1024."""
+    match = _SIZE_REGEX.match(size)
+    if match is None:
+        raise ValueError(f"Invalid size: {size}")
+    return int(float(match.group("size")) * _SIZE_UNITS[match.group("unit").lower()])
+
+
+def format_size(size: float) -> str:
+    """Format a size in bytes for humans."""
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if size < 1024 or unit == "TB":
+            break
+        size /= 1024
+    return f"{size:.1f}{unit}" if unit != "B" else f"{int(size)}B"
+
+
+def format_time(timestamp: float) -> str:
+    """Format a Unix timestamp as the time since then."""
+    elapsed = time.time() - timestamp
+    for unit, seconds in [("d", 86400), ("h", 3600), ("m", 60)]:
+        if elapsed >= seconds:
+            return f"{int(elapsed // seconds)}{unit} ago"
+    return "just now"
+
+
+def _blob_store_dir() -> Path:
+    from kernels.utils import CACHE_DIR
+
+    return metadata_dir(CACHE_DIR) / "blobs"
+
+
+def _file_sizes(paths: Iterable[Path]) -> dict[tuple[int, int], int]:
+    """Get the sizes of files, keyed by file identity so that hard links are counted once."""
+    sizes = {}
+    for path in paths:
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        sizes[(st.st_dev, st.st_ino)] = st.st_size
+    return sizes
+
+
+def _unique_size(kernels: Iterable[CachedKernel]) -> int:
+    blobs: dict[tuple[int, int], int] = {}
+    for kernel in kernels:
+        blobs.update(kernel._blobs)
+    return sum(blobs.values())
+
+
+class _Evictor:
+    """Evicts kernel revisions from the cache while holding the lock of their repository."""
+
+    def __init__(self):
+        from kernels.utils import CACHE_DIR
+
+        self._cache_dir = CACHE_DIR
+        hf_cache_info = scan_cache_dir(cache_root(CACHE_DIR))
+        self._repos = {
+            repo.repo_id: repo
+            for repo in hf_cache_info.repos
+            if repo.repo_type == "model"
+        }
+        self._deleted: dict[str, set[CachedRevisionInfo]] = {}
+
+    def evict(self, kernel: CachedKernel) -> bool:
+        """Evict a kernel revision, returns `False` when its repository is in use."""
+        # Do not wait for the lock, the repository is being modified by an
+        # installation and will probably be used soon.
+        with CacheLock(
+            install_lock_path(self._cache_dir, kernel.repo_id), timeout=0
+        ) as lock:
+            if lock.contended:
+                logging.info(
+                    f"Not evicting {kernel.repo_id} ({kernel.sha}), it is being installed"
+                )
+                return False
+
+            # Revisions are deleted per repository, since a commit SHA can be
+            # shared by multiple repositories.
+            repo = self._repos.get(kernel.repo_id)
+            if repo is not None:
+                deleted = self._deleted.setdefault(kernel.repo_id, set())
+                revisions = {
+                    revision
+                    for revision in repo.revisions
+                    if revision.commit_hash == kernel.sha
+                }
+                deleted.update(revisions)
+                _delete_revisions(repo.repo_path, revisions, repo.revisions - deleted)
+
+            self._remove_metadata(kernel)
+
+        return True
+
+    def _remove_metadata(self, kernel: CachedKernel):
+        """Remove the metadata of a revision, so that it is not used for fast paths anymore."""
+        kernels_metadata_dir = metadata_dir(self._cache_dir)
+        repo_dir = kernel.repo_id.replace("/", "--")
+        for path in [
+            kernels_metadata_dir / "variants" / repo_dir / kernel.sha,
+            kernels_metadata_dir / "usage" / repo_dir / kernel.sha,
+        ]:
+            shutil.rmtree(path, ignore_errors=True)
+
+        revisions_dir = kernels_metadata_dir / "revisions" / repo_dir
+        if revisions_dir.is_dir():
+            for revision_path in revisions_dir.iterdir():
+                entry = read_json(revision_path)
+                if entry is not None and entry.get("sha") == kernel.sha:
+                    revision_path.unlink(missing_ok=True)
+
+
+def _delete_revisions(
+    repo_path: Path,
+    deleted: set[CachedRevisionInfo],
+    kept: frozenset[CachedRevisionInfo],
+):
+    if not kept:
+        shutil.rmtree(repo_path, ignore_errors=True)
+        return
+
+    kept_blobs = {file.blob_path for revision in kept for file in revision.files}
+    for revision in deleted:
+        shutil.rmtree(revision.snapshot_path, ignore_errors=True)
+        for ref in revision.refs:
+            (repo_path / "refs" / ref).unlink(missing_ok=True)
+        for file in revision.files:
+            if file.blob_path not in kept_blobs:
+                file.blob_path.unlink(missing_ok=True)
+
+
+def _link_to_blob_store(blob_path: Path) -> bool:
+    """
+    Replace a blob of the Hub cache by a hard link to the same blob in the blob store.
+
+    The blob is added to the store when the store does not have it yet. Blobs are only
+    added after they are verified against their name. Returns whether the blob is
+    linked to the store.
+    """
+    blob_id = blob_path.name
+    store_path = _blob_store_dir() / blob_id
+    try:
+        if not store_path.exists():
+            # Never spread a corrupted blob to other revisions.
+            if hash_blob(blob_path).hex() != blob_id:
+                logging.warning(f"Not deduplicating corrupted blob: {blob_path}")
+                return False
+            store_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(blob_path, store_path)
+                return True
+            except FileExistsError:
+                pass
+
+        if os.path.samefile(blob_path, store_path):
+            return True
+        if store_path.stat().st_size != blob_path.stat().st_size:
+            return False
+
+        # Replace the blob atomically, so that the blob is never missing.
+        tmp_path = blob_path.with_name(f".{blob_id}.dedupe")
+        tmp_path.unlink(missing_ok=True)
+        os.link(store_path, tmp_path)
+        os.replace(tmp_path, blob_path)
+        return True
+    except OSError as e:
+        # E.g. the blob store is on a different file system than the blob.
+        logging.debug(f"Cannot deduplicate blob {blob_path}: {e}")
+        return False
+
+
+def _prune_blob_store():
+    """Remove blobs from the blob store that are not used by the Hub cache anymore."""
+    store_dir = _blob_store_dir()
+    if not store_dir.is_dir():
+        return
+    for store_path in store_dir.iterdir():
+        try:
+            # The store holds the only link when no revision uses the blob.
+            if store_path.stat().st_nlink <= 1:
+                store_path.unlink()
+        except OSError:
+            pass
@@ -3,15 +3,13 @@ import dataclasses
 import json
 import re
 import sys
+import tarfile
 from pathlib import Path
 
 from huggingface_hub import create_repo, upload_folder, create_branch
 
 from kernels.compat import tomllib
-from kernels.lockfile import KernelLock, get_kernel_locks
-from kernels.utils import install_kernel, install_kernel_all_variants
-
-from .doc import generate_readme_for_kernel
+from kernels.lockfile import KernelLock, LockfileIndex, get_kernel_locks
 
 BUILD_VARIANT_REGEX = re.compile(r"^(torch\d+\d+|torch-(cpu|cuda|metal|rocm|xpu))")
 
@@ -58,8 +56,139 @@ def main():
         action="store_true",
         help="Download all build variants of the kernel",
     )
+    download_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=_positive_int,
+        default=1,
+        help="Number of kernels to download concurrently (default: 1)",
+    )
+    download_parser.add_argument(
+        "--target",
+        type=_build_variant,
+        action="append",
+        default=None,
+        help="Download the kernels for the environment of this build variant instead of the current environment, e.g. 'torch28-cxx11-cu128-x86_64-linux' (can be repeated)",
+    )
+    download_parser.add_argument(
+        "--precompile",
+        action="store_true",
+        help="Compile the Python sources of the kernels to bytecode for the current Python version",
+    )
     download_parser.set_defaults(func=download_kernels)
 
+    cache_parser = subparsers.add_parser("cache", help="Manage the kernel cache")
+    cache_subparsers = cache_parser.add_subparsers(required=True)
+
+    cache_ls_parser = cache_subparsers.add_parser(
+        "ls", help="List cached kernel revisions, least recently used first"
+    )
+    cache_ls_parser.set_defaults(func=list_cached_kernels)
+
+    cache_du_parser = cache_subparsers.add_parser(
+        "du", help="Show the disk usage of cached kernels"
+    )
+    cache_du_parser.set_defaults(func=cached_kernels_disk_usage)
+
+    cache_prune_parser = cache_subparsers.add_parser(
+        "prune",
+        help="Evict least recently used kernel revisions to fit in a size budget",
+    )
+    cache_prune_parser.add_argument(
+        "--max-size",
+        type=str,
+        default=None,
+        help="The size budget, e.g. '10GB' (default: KERNELS_CACHE_MAX_SIZE)",
+    )
+    cache_prune_parser.add_argument(
+        "--lockfile",
+        type=Path,
+        action="append",
+        default=[],
+        help="Never evict revisions locked in this kernels.lock file (can be repeated)",
+    )
+    cache_prune_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only show which revisions would be evicted",
+    )
+    cache_prune_parser.set_defaults(func=prune_cached_kernels)
+
+    cache_dedupe_parser = cache_subparsers.add_parser(
+        "dedupe",
+        help="Reclaim disk space by hard linking identical files of cached kernels",
+    )
+    cache_dedupe_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only show how much disk space would be reclaimed",
+    )
+    cache_dedupe_parser.set_defaults(func=dedupe_cached_kernels)
+
+    bundle_parser = subparsers.add_parser(
+        "bundle", help="Export and import locked kernels for offline use"
+    )
+    bundle_subparsers = bundle_parser.add_subparsers(required=True)
+
+    bundle_export_parser = bundle_subparsers.add_parser(
+        "export", help="Export the locked kernels of a project to a bundle"
+    )
+    bundle_export_parser.add_argument(
+        "project_dir",
+        type=Path,
+        help="The project directory",
+    )
+    bundle_export_parser.add_argument(
+        "--output",
+        "-o",
+        type=Path,
+        required=True,
+        help="The bundle to write, '-' for standard output",
+    )
+    bundle_export_parser.add_argument(
+        "--all-variants",
+        action="store_true",
+        help="Export all build variants of the kernels",
+    )
+    bundle_export_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=_positive_int,
+        default=1,
+        help="Number of kernels to download concurrently (default: 1)",
+    )
+    bundle_export_parser.add_argument(
+        "--target",
+        type=_build_variant,
+        action="append",
+        default=None,
+        help="Export the kernels for the environment of this build variant instead of the current environment (can be repeated)",
+    )
+    bundle_export_parser.set_defaults(func=export_kernel_bundle)
+
+    bundle_import_parser = bundle_subparsers.add_parser(
+        "import", help="Import a bundle into the kernel cache"
+    )
+    bundle_import_parser.add_argument(
+        "bundle",
+        type=Path,
+        help="The bundle to import, '-' for standard input",
+    )
+    bundle_import_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=_positive_int,
+        default=None,
+        help="Number of files to verify concurrently",
+    )
+    bundle_import_parser.add_argument(
+        "--lockfile",
+        type=Path,
+        default=None,
+        help="Verify the bundle against the kernels locked in this kernels.lock file",
+    )
+    bundle_import_parser.set_defaults(func=import_kernel_bundle)
+
     upload_parser = subparsers.add_parser("upload", help="Upload kernels to the Hub")
     upload_parser.add_argument(
         "kernel_dir",
@@ -108,9 +237,7 @@ def main():
         help="The kernel revision (branch, tag, or commit SHA, defaults to 'main')",
     )
     generate_readme_parser.set_defaults(
-        func=lambda args: generate_readme_for_kernel(
-            repo_id=args.repo_id, revision=args.revision
-        )
+        func=lambda args: generate_readme(repo_id=args.repo_id, revision=args.revision)
     )
 
     benchmark_parser = subparsers.add_parser(
@@ -147,7 +274,29 @@ def main():
     args.func(args)
 
 
+def _positive_int(value: str) -> int:
+    try:
+        n = int(value)
+    except ValueError:
+        n = 0
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value}")
+    return n
+
+
+def _build_variant(value: str) -> str:
+    from kernels.environment import EnvironmentFingerprint
+
+    try:
+        EnvironmentFingerprint.from_build_variant(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
 def download_kernels(args):
+    from kernels.prefetch import prefetch_kernels
+
     lock_path = args.project_dir / "kernels.lock"
 
     if not lock_path.exists():
@@ -157,33 +306,172 @@ def download_kernels(args):
     with open(args.project_dir / "kernels.lock", "r") as f:
         lock_json = json.load(f)
 
-    all_successful = True
-
-    for kernel_lock_json in lock_json:
-        kernel_lock = KernelLock.from_json(kernel_lock_json)
+    kernel_locks = [
+        KernelLock.from_json(kernel_lock_json) for kernel_lock_json in lock_json
+    ]
+    for kernel_lock in kernel_locks:
         print(
-            f"Downloading `{kernel_lock.repo_id}` at with SHA: {kernel_lock.sha}",
+            f"Prefetching `{kernel_lock.repo_id}` with SHA: {kernel_lock.sha}",
             file=sys.stderr,
         )
-        if args.all_variants:
-            install_kernel_all_variants(
-                kernel_lock.repo_id, kernel_lock.sha, variant_locks=kernel_lock.variants
+
+    if args.all_variants and args.target is not None:
+        print("--all-variants cannot be used together with --target", file=sys.stderr)
+        sys.exit(1)
+
+    results = prefetch_kernels(
+        kernel_locks,
+        max_workers=args.jobs,
+        all_variants=args.all_variants,
+        targets=args.target,
+        precompile=args.precompile,
+    )
+
+    all_successful = True
+    for result in results:
+        if result.error is not None:
+            target = "" if result.target is None else f" for {result.target}"
+            print(
+                f"Cannot download `{result.repo_id}`{target}: {result.error}",
+                file=sys.stderr,
             )
-        else:
-            try:
-                install_kernel(
-                    kernel_lock.repo_id,
-                    kernel_lock.sha,
-                    variant_locks=kernel_lock.variants,
-                )
-            except FileNotFoundError as e:
-                print(e, file=sys.stderr)
-                all_successful = False
+            all_successful = False
 
     if not all_successful:
         sys.exit(1)
 
 
+def list_cached_kernels(args):
+    from kernels.cache_manager import format_size, format_time, scan_kernel_cache
+
+    rows = [
+        [
+            kernel.repo_id,
+            kernel.sha[:8],
+            ",".join(sorted(kernel.refs)),
+            ",".join(kernel.variants),
+            format_size(kernel.size_on_disk),
+            format_time(kernel.last_used),
+        ]
+        for kernel in scan_kernel_cache().kernels
+    ]
+    _print_table(["REPO ID", "REVISION", "REFS", "VARIANTS", "SIZE", "LAST USED"], rows)
+
+
+def cached_kernels_disk_usage(args):
+    from kernels.cache_manager import format_size, scan_kernel_cache
+
+    cache_info = scan_kernel_cache()
+    repo_sizes: dict[str, int] = {}
+    for kernel in cache_info.kernels:
+        repo_sizes[kernel.repo_id] = repo_sizes.get(kernel.repo_id, 0) + (
+            kernel.size_on_disk
+        )
+
+    rows = [
+        [repo_id, format_size(size)] for repo_id, size in sorted(repo_sizes.items())
+    ]
+    _print_table(["REPO ID", "SIZE"], rows)
+    print(f"Total: {format_size(cache_info.size_on_disk)}")
+
+
+def prune_cached_kernels(args):
+    from kernels.cache_manager import format_size, prune_kernel_cache
+
+    try:
+        evicted = prune_kernel_cache(
+            args.max_size, lockfiles=args.lockfile, dry_run=args.dry_run
+        )
+    except ValueError as e:
+        print(f"Cannot prune kernel cache: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    action = "Would evict" if args.dry_run else "Evicted"
+    for kernel in evicted:
+        print(
+            f"{action} `{kernel.repo_id}` at {kernel.sha} ({format_size(kernel.size_on_disk)})"
+        )
+
+
+def export_kernel_bundle(args):
+    from kernels.bundle import export_bundle
+
+    lock_path = args.project_dir / "kernels.lock"
+    if not lock_path.exists():
+        print(f"No kernels.lock file found in: {args.project_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.all_variants and args.target is not None:
+        print("--all-variants cannot be used together with --target", file=sys.stderr)
+        sys.exit(1)
+
+    with open(lock_path, "r") as f:
+        kernel_locks = [
+            KernelLock.from_json(kernel_lock_json) for kernel_lock_json in json.load(f)
+        ]
+
+    output = sys.stdout.buffer if str(args.output) == "-" else args.output
+    try:
+        bundled = export_bundle(
+            kernel_locks,
+            output,
+            all_variants=args.all_variants,
+            targets=args.target,
+            max_workers=args.jobs,
+        )
+    except ValueError as e:
+        print(f"Cannot export kernel bundle: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    for kernel in bundled:
+        print(
+            f"Exported `{kernel.repo_id}` with SHA: {kernel.sha} ({', '.join(kernel.variants)})",
+            file=sys.stderr,
+        )
+
+
+def import_kernel_bundle(args):
+    from kernels.bundle import import_bundle
+
+    bundle = sys.stdin.buffer if str(args.bundle) == "-" else args.bundle
+    try:
+        kernel_locks = (
+            None if args.lockfile is None else LockfileIndex.load(args.lockfile)
+        )
+        imported = import_bundle(
+            bundle, kernel_locks=kernel_locks, max_workers=args.jobs
+        )
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print(f"Cannot import kernel bundle: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    for kernel in imported:
+        print(
+            f"Imported `{kernel.repo_id}` with SHA: {kernel.sha} ({', '.join(kernel.variants)})",
+            file=sys.stderr,
+        )
+
+
+def dedupe_cached_kernels(args):
+    from kernels.cache_manager import dedupe_kernel_cache, format_size
+
+    reclaimed = dedupe_kernel_cache(dry_run=args.dry_run)
+    action = "Would reclaim" if args.dry_run else "Reclaimed"
+    print(f"{action} {format_size(reclaimed)}")
+
+
+def _print_table(header: list[str], rows: list[list[str]]):
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+    for row in [header, *rows]:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+
+def generate_readme(*, repo_id: str, revision: str):
+    from kernels.doc import generate_readme_for_kernel
+
+    generate_readme_for_kernel(repo_id=repo_id, revision=revision)
+
+
 def lock_kernels(args):
     with open(args.project_dir / "pyproject.toml", "rb") as f:
         data = tomllib.load(f)
@@ -0,0 +1,234 @@
+import platform
+import re
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+
+from packaging.version import parse
+
+_BACKEND_NOARCH = {
+    "cann": "torch-npu",
+    "cpu": "torch-cpu",
+    "cuda": "torch-cuda",
+    "hip": "torch-rocm",
+    "metal": "torch-metal",
+    "xpu": "torch-xpu",
+}
+
+_BUILD_VARIANT_REGEX = re.compile(
+    r"^torch(?P<major>\d)(?P<minor>\d+)-(?:(?P<cxxabi>cxx\d+)-)?(?P<compute_framework>[a-z]+\d*)-(?P<cpu>[^-]+)-(?P<os>[a-z]+)$"
+)
+
+
+@dataclass(frozen=True)
+class EnvironmentFingerprint:
+    """
+    Description of the environment that kernel build variants are selected for.
+
+    The fingerprint of the current environment is computed once per process (see
+    [`current_environment`]). A different environment can be used with
+    [`use_environment`], for instance to resolve build variants for another target.
+
+    Args:
+        torch_version (`str`):
+            The Torch version, e.g. `"2.8.0+cu128"`.
+        backend (`str`):
+            The compute backend: `"cann"`, `"cpu"`, `"cuda"`, `"hip"`, `"metal"`, or `"xpu"`.
+        compute_framework (`str`):
+            The compute framework with its version, e.g. `"cu128"` or `"rocm64"`.
+        cpu (`str`):
+            The CPU architecture, e.g. `"x86_64"` or `"aarch64"`.
+        os (`str`):
+            The operating system, e.g. `"linux"`.
+        cxxabi (`str`, *optional*):
+            The C++ ABI of Torch (`"cxx11"` or `"cxx98"`). Only used on Linux.
+
+    Example:
+        ```python
+        from kernels import EnvironmentFingerprint
+
+        env = EnvironmentFingerprint.from_build_variant("torch28-cxx11-cu128-x86_64-linux")
+        assert env.build_variants == [
+            "torch28-cxx11-cu128-x86_64-linux",
+            "torch-cuda",
+            "torch-universal",
+        ]
+        ```
+    """
+
+    torch_version: str
+    backend: str
+    compute_framework: str
+    cpu: str
+    os: str
+    cxxabi: str | None = None
+
+    @classmethod
+    def from_build_variant(cls, variant: str) -> "EnvironmentFingerprint":
+        """Create the fingerprint of the environment that a build variant targets."""
+        match = _BUILD_VARIANT_REGEX.match(variant)
+        if match is None:
+            raise ValueError(f"Invalid build variant: {variant}")
+
+        compute_framework = match.group("compute_framework")
+        if compute_framework.startswith("cu"):
+            backend = "cuda"
+        elif compute_framework.startswith("rocm"):
+            backend = "hip"
+        elif compute_framework.startswith("cann"):
+            backend = "cann"
+        elif compute_framework.startswith("xpu"):
+            backend = "xpu"
+        elif compute_framework in ("cpu", "metal"):
+            backend = compute_framework
+        else:
+            raise ValueError(f"Unknown compute framework in build variant: {variant}")
+
+        return cls(
+            torch_version=f"{match.group('major')}.{match.group('minor')}",
+            backend=backend,
+            compute_framework=compute_framework,
+            cpu=match.group("cpu"),
+            os=match.group("os"),
+            cxxabi=match.group("cxxabi"),
+        )
+
+    @cached_property
+    def build_variant(self) -> str:
+        """The architecture-specific build variant."""
+        torch_version = parse(self.torch_version)
+        torch_tag = f"torch{torch_version.major}{torch_version.minor}"
+        if self.cxxabi is None:
+            return f"{torch_tag}-{self.compute_framework}-{self.cpu}-{self.os}"
+        return (
+            f"{torch_tag}-{self.cxxabi}-{self.compute_framework}-{self.cpu}-{self.os}"
+        )
+
+    @property
+    def build_variant_noarch(self) -> str:
+        """The architecture-independent build variant for the compute backend."""
+        return _BACKEND_NOARCH[self.backend]
+
+    @property
+    def build_variant_universal(self) -> str:
+        """The build variant that is compatible with any backend."""
+        # Once we support other frameworks, detection goes here.
+        return "torch-universal"
+
+    @property
+    def build_variants(self) -> list[str]:
+        """Compatible build variants in preferred order."""
+        return [
+            self.build_variant,
+            self.build_variant_noarch,
+            self.build_variant_universal,
+        ]
+
+
+_ENVIRONMENT_OVERRIDE: ContextVar[EnvironmentFingerprint | None] = ContextVar(
+    "_ENVIRONMENT_OVERRIDE", default=None
+)
+
+
+def current_environment() -> EnvironmentFingerprint:
+    """
+    Get the environment that kernel build variants are selected for.
+
+    This is the environment that is set with [`use_environment`], or the
+    detected environment of the current process otherwise.
+
+    Returns:
+        [`EnvironmentFingerprint`]: The fingerprint of the environment.
+    """
+    override = _ENVIRONMENT_OVERRIDE.get()
+    if override is not None:
+        return override
+    return _detect_environment()
+
+
+def use_environment(environment: EnvironmentFingerprint | str):
+    """
+    Context manager that selects build variants for the given environment.
+
+    Args:
+        environment (`Union[EnvironmentFingerprint, str]`):
+            The environment to use inside the context, or a build variant describing the environment.
+
+    Example:
+        ```python
+        from kernels import use_environment
+        from kernels.utils import build_variants
+
+        with use_environment("torch28-cxx11-cu128-x86_64-linux"):
+            assert build_variants()[0] == "torch28-cxx11-cu128-x86_64-linux"
+        ```
+    """
+    if isinstance(environment, str):
+        environment = EnvironmentFingerprint.from_build_variant(environment)
+
+    class ContextManager:
+        def __enter__(self):
+            self.token = _ENVIRONMENT_OVERRIDE.set(environment)
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            _ENVIRONMENT_OVERRIDE.reset(self.token)
+
+    return ContextManager()
+
+
+def _get_privateuse_backend_name() -> str | None:
+    import torch
+
+    if hasattr(torch._C, "_get_privateuse1_backend_name"):
+        return torch._C._get_privateuse1_backend_name()
+    return None
+
+
+@lru_cache
+def _detect_environment() -> EnvironmentFingerprint:
+    import torch
+
+    if torch.version.cuda is not None:
+        backend = "cuda"
+        cuda_version = parse(torch.version.cuda)
+        compute_framework = f"cu{cuda_version.major}{cuda_version.minor}"
+    elif torch.version.hip is not None:
+        backend = "hip"
+        rocm_version = parse(torch.version.hip.split("-")[0])
+        compute_framework = f"rocm{rocm_version.major}{rocm_version.minor}"
+    elif torch.backends.mps.is_available():
+        backend = "metal"
+        compute_framework = "metal"
+    elif hasattr(torch.version, "xpu") and torch.version.xpu is not None:
+        backend = "xpu"
+        version = torch.version.xpu
+        compute_framework = f"xpu{version[0:4]}{version[5:6]}"
+    elif _get_privateuse_backend_name() == "npu":
+        from torch_npu.utils.collect_env import get_cann_version  # type: ignore[import-not-found]
+
+        backend = "cann"
+        cann_version = get_cann_version()
+        compute_framework = f"cann{cann_version[0]}{cann_version[2]}"
+    else:
+        backend = "cpu"
+        compute_framework = "cpu"
+
+    cpu = platform.machine()
+    os = platform.system().lower()
+
+    cxxabi: str | None = None
+    if os == "darwin":
+        cpu = "aarch64" if cpu == "arm64" else cpu
+    elif os == "windows":
+        cpu = "x86_64" if cpu == "AMD64" else cpu
+    else:
+        cxxabi = "cxx11" if torch.compiled_with_cxx11_abi() else "cxx98"
+
+    return EnvironmentFingerprint(
+        torch_version=torch.__version__,
+        backend=backend,
+        compute_framework=compute_framework,
+        cpu=cpu,
+        os=os,
+        cxxabi=cxxabi,
+    )
@@ -7,6 +7,7 @@ from .func import (
 )
 from .kernelize import (
     kernelize,
+    prefetch_layers,
     register_kernel_mapping,
     use_kernel_mapping,
 )
@@ -18,18 +19,23 @@ from .layer import (
     use_kernel_forward_from_hub,
 )
 from .mode import Mode
+from .plan import KernelizePlan, ModulePlan, plan_kernelize
 
 __all__ = [
     "CUDAProperties",
     "Device",
     "FuncRepository",
+    "KernelizePlan",
     "LayerRepository",
     "LocalFuncRepository",
     "LocalLayerRepository",
     "LockedFuncRepository",
     "LockedLayerRepository",
     "Mode",
+    "ModulePlan",
     "kernelize",
+    "plan_kernelize",
+    "prefetch_layers",
     "register_kernel_mapping",
     "replace_kernel_forward_from_hub",
     "use_kernel_forward_from_hub",
@@ -127,6 +127,25 @@ class IntervalTree(Generic[T]):
 
         return node
 
+    def items(self) -> list[tuple[int, int, T]]:
+        """
+        Gets all intervals in the tree.
+
+        Returns:
+            The start, end, and data of all intervals, ordered by start.
+        """
+        results: list[tuple[int, int, T]] = []
+        self._items(self.root, results)
+        return results
+
+    def _items(self, node: _Node[T] | None, results: list[tuple[int, int, T]]) -> None:
+        """Recursive helper to collect all intervals in order."""
+        if node is None:
+            return
+        self._items(node.left, results)
+        results.append((node.start, node.end, node.data))
+        self._items(node.right, results)
+
     def search(self, point: int) -> list[T]:
         """
         Searches for all intervals that contain the given point.
@@ -165,6 +184,21 @@ class IntervalTree(Generic[T]):
         Returns:
             The data of the best-matching item, or None if no match is found.
         """
+        match = self.find_smallest_interval_with_range(point)
+        return None if match is None else match[2]
+
+    def find_smallest_interval_with_range(
+        self, point: int
+    ) -> tuple[int, int, T] | None:
+        """
+        Finds the item with the most specific (smallest) range for a given point.
+
+        Args:
+            point: The capability to look up.
+
+        Returns:
+            The start, end, and data of the best-matching item, or None if no match is found.
+        """
         matches: list[tuple[int, int, T]] = []
         self._find_with_intervals(self.root, point, matches)
 
@@ -175,8 +209,7 @@ class IntervalTree(Generic[T]):
         # there are multiple matches with the same interval size. This
         # is just to ensure that we can compare against a trivial
         # implementation in tests.
-        best_match = min(matches, key=lambda x: (x[1] - x[0], id(x[2])))
-        return best_match[2]
+        return min(matches, key=lambda x: (x[1] - x[0], id(x[2])))
 
     def _find_with_intervals(
         self,
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from collections.abc import Iterator, Mapping
+
+from .repos import DeviceRepos
+
+
+class _KernelMapping(Mapping[str, Mapping[str, DeviceRepos]]):
+    """
+    Kernel mapping from layer names to device repositories.
+
+    A mapping is a chain of overlays: layer names are looked up in the mapping
+    itself first and then in the mappings it extends. Overlays are never
+    modified in place, updates replace the layers of a mapping with a copy. So,
+    a mapping can be extended in O(1) and the extended mapping shares its
+    structure (including the repositories) with the mapping that it extends.
+    """
+
+    def __init__(
+        self,
+        layers: dict[str, dict[str, DeviceRepos]] | None = None,
+        parent: _KernelMapping | None = None,
+    ):
+        self._layers = {} if layers is None else layers
+        self._parent = parent
+
+    def extend(self) -> _KernelMapping:
+        """Create an empty mapping that extends a snapshot of this mapping."""
+        if not self._layers:
+            return _KernelMapping(parent=self._parent)
+        # The layers are never modified in place, so this is a snapshot.
+        return _KernelMapping(parent=_KernelMapping(self._layers, self._parent))
+
+    def update(self, layers: dict[str, dict[str, DeviceRepos]]):
+        """
+        Replace the device repositories of layers.
+
+        The device repositories are shared with mappings that extend this
+        mapping, so they must not be modified after the update.
+        """
+        self._layers = {**self._layers, **layers}
+
+    def __getitem__(self, layer_name: str) -> Mapping[str, DeviceRepos]:
+        mapping: _KernelMapping | None = self
+        while mapping is not None:
+            device_repos = mapping._layers.get(layer_name)
+            if device_repos is not None:
+                return device_repos
+            mapping = mapping._parent
+        raise KeyError(layer_name)
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        mapping: _KernelMapping | None = self
+        while mapping is not None:
+            for layer_name in mapping._layers:
+                if layer_name not in seen:
+                    seen.add(layer_name)
+                    yield layer_name
+            mapping = mapping._parent
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Type
+
+from .. import utils
+from .._cache import read_json, snapshot_path, write_json
+from ..environment import current_environment
+from .device import Device
+from .func import FuncRepository, LocalFuncRepository, LockedFuncRepository
+from .globals import _DISABLE_KERNEL_MAPPING, _KERNEL_MAPPING
+from .layer import (
+    LayerRepository,
+    LocalLayerRepository,
+    LockedLayerRepository,
+    _select_layer_repository,
+)
+from .mode import Mode
+from .repos import RepositoryProtocol, _find_capability
+
+if TYPE_CHECKING:
+    from torch import nn
+
+_PLAN_CACHE_VERSION = 1
+
+
+class _PlanCache:
+    """
+    File with the layers that `kernelize` selected for each layer class.
+
+    Layers that were loaded from the Hub are stored as the repository, commit
+    SHA, and build variant of their kernel, so that they can be imported from
+    the cache without resolving the mapping, revisions, or validating the
+    layer again. The plan is keyed by the environment, kernel mapping, and
+    `kernelize` arguments and is discarded when any of them change. Locked
+    repositories are keyed by their locked revision, so the plan is also
+    discarded when a lockfile changes. Mappings with repository types that
+    cannot be described by their kernel are not cached.
+    """
+
+    def __init__(
+        self, path: Path, *, mode: Mode, device_type: Device, use_fallback: bool
+    ):
+        self._path = path
+        self._mode = mode
+        self._device_type = device_type
+        self._key = _plan_key(
+            mode=mode, device_type=device_type, use_fallback=use_fallback
+        )
+
+        plan = None if self._key is None else read_json(path)
+        if (
+            isinstance(plan, dict)
+            and plan.get("version") == _PLAN_CACHE_VERSION
+            and plan.get("key") == self._key
+        ):
+            self._layers: dict[str, dict[str, Any]] = plan["layers"]
+        else:
+            self._layers = {}
+        self._changed = False
+
+    def replay(self, module_class: Type["nn.Module"]) -> Type["nn.Module"] | None:
+        """Get the layer for a class from the plan, `None` if it is not in the plan."""
+        entry = self._layers.get(_class_name(module_class))
+        if entry is None:
+            return None
+        if entry.get("fallback"):
+            return module_class
+
+        try:
+            layer = _load_pinned_layer(entry)
+        except Exception as e:
+            logging.debug(f"Cannot replay kernelize plan entry {entry}: {e}")
+            layer = None
+        if layer is None:
+            # The kernel was removed from the cache, resolve the layer again.
+            del self._layers[_class_name(module_class)]
+            self._changed = True
+        return layer
+
+    def record(self, module_class: Type["nn.Module"], layer: Type["nn.Module"]):
+        """Add the layer that was resolved for a class to the plan."""
+        if self._key is None:
+            return
+        if layer is module_class:
+            entry: dict[str, Any] = {"fallback": True}
+        else:
+            selection = _select_layer_repository(
+                str(module_class.kernel_layer_name),  # type: ignore[attr-defined]
+                mode=self._mode,
+                device_type=self._device_type,
+            )
+            layer_name = getattr(selection.repo, "layer_name", None)
+            pinned_kernel = _pinned_kernel(layer)
+            if (
+                selection.repo_mode is None
+                or layer_name is None
+                or pinned_kernel is None
+            ):
+                # Only layers from kernels in the Hub cache can be replayed.
+                return
+            repo_id, sha, variant = pinned_kernel
+            entry = {
+                "repo_id": repo_id,
+                "sha": sha,
+                "variant": variant,
+                "layer_name": layer_name,
+                "mode": selection.repo_mode.value,
+            }
+
+        self._layers[_class_name(module_class)] = entry
+        self._changed = True
+
+    def save(self):
+        """Write the plan if it was changed."""
+        if self._changed:
+            write_json(
+                self._path,
+                {
+                    "version": _PLAN_CACHE_VERSION,
+                    "key": self._key,
+                    "layers": self._layers,
+                },
+            )
+            self._changed = False
+
+
+def _class_name(cls: type) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _plan_key(*, mode: Mode, device_type: Device, use_fallback: bool) -> str | None:
+    """Get the key of the environment and mapping that a plan is valid for, `None` if uncacheable."""
+    mapping_hash = _mapping_hash()
+    if mapping_hash is None:
+        return None
+    capability = _find_capability() if device_type.type in ("cuda", "rocm") else None
+    key = {
+        "environment": dataclasses.asdict(current_environment()),
+        "mapping": mapping_hash,
+        "disable_kernel_mapping": _DISABLE_KERNEL_MAPPING,
+        "mode": mode.value,
+        "device": device_type.type,
+        "capability": capability,
+        "use_fallback": use_fallback,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _mapping_hash() -> str | None:
+    """Hash the kernel mapping of the current context, `None` if it cannot be hashed."""
+    m = hashlib.sha256()
+    for layer_name, device_repos in sorted(_KERNEL_MAPPING.get().items()):
+        for device_type, repos in sorted(device_repos.items()):
+            for capability_interval, mode_repos in repos.entries():
+                for repo_mode, repo in sorted(
+                    mode_repos.items(), key=lambda item: item[0].value
+                ):
+                    description = _describe_repo(repo)
+                    if description is None:
+                        logging.debug(
+                            f"Not caching kernelize plan, cannot describe repository: {repo}"
+                        )
+                        return None
+                    entry = [
+                        layer_name,
+                        device_type,
+                        capability_interval,
+                        repo_mode.value,
+                        description,
+                    ]
+                    m.update(json.dumps(entry).encode("utf-8"))
+    return m.hexdigest()
+
+
+def _describe_repo(repo: RepositoryProtocol) -> list[str | None] | None:
+    """Describe a repository by the kernel it loads, `None` for unknown repository types."""
+    repo_type = type(repo).__qualname__
+    if isinstance(repo, (LayerRepository, FuncRepository)):
+        return [repo_type, repo._repo_id, repo._revision, repo._version, _name(repo)]
+    if isinstance(repo, (LockedLayerRepository, LockedFuncRepository)):
+        try:
+            revision: str | None = repo._resolve_revision()
+        except (OSError, ValueError):
+            # `kernelize` fails or falls back for this repository.
+            revision = None
+        return [repo_type, repo._repo_id, revision, _name(repo)]
+    if isinstance(repo, (LocalLayerRepository, LocalFuncRepository)):
+        return [repo_type, str(repo._repo_path), repo._package_name, _name(repo)]
+    return None
+
+
+def _name(repo: RepositoryProtocol) -> str:
+    """Get the name of the layer or function of a repository."""
+    return getattr(repo, "layer_name", None) or getattr(repo, "func_name")
+
+
+def _pinned_kernel(layer: Type["nn.Module"]) -> tuple[str, str, str] | None:
+    """Get the repository, commit SHA, and build variant of the kernel of a layer."""
+    kernel = sys.modules.get(layer.__module__.partition(".")[0])
+    kernel_file = getattr(kernel, "__file__", None)
+    if kernel_file is None:
+        return None
+
+    for variant_path in Path(kernel_file).parents:
+        if variant_path.parent.name != "build":
+            continue
+        fields = utils._trace_fields(variant_path)
+        repo_id, sha, variant = fields["repo_id"], fields["revision"], fields["variant"]
+        if (
+            repo_id is None
+            or sha is None
+            or variant is None
+            or not utils._is_commit_sha(sha)
+        ):
+            return None
+        if os.path.abspath(_variant_path(repo_id, sha, variant)) != os.path.abspath(
+            variant_path
+        ):
+            # The kernel is not in the kernels cache.
+            return None
+        return repo_id, sha, variant
+
+    return None
+
+
+def _load_pinned_layer(entry: dict[str, Any]) -> Type["nn.Module"] | None:
+    """Import the layer of a plan entry, `None` if its kernel is not in the cache."""
+    repo_id = entry["repo_id"]
+    variant_path = _variant_path(repo_id, entry["sha"], entry["variant"])
+    if not variant_path.exists():
+        return None
+
+    kernel = utils._import_registered_kernel(
+        repo_id, utils.package_name_from_repo_id(repo_id), variant_path
+    )
+    return getattr(getattr(kernel, "layers", None), entry["layer_name"], None)
+
+
+def _variant_path(repo_id: str, sha: str, variant: str) -> Path:
+    return snapshot_path(utils.CACHE_DIR, repo_id, sha) / "build" / variant
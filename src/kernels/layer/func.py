@@ -9,8 +9,9 @@ from kernels.layer.repos import RepositoryProtocol
 
 from .._versions import select_revision_or_version
 from ..utils import (
-    _get_caller_locked_kernel,
+    _get_caller_package,
     _get_locked_kernel,
+    _get_package_locked_kernel,
     get_kernel,
     get_local_kernel,
 )
@@ -244,14 +245,18 @@ class LockedFuncRepository:
         self._repo_id = repo_id
         self._lockfile = lockfile
         self.func_name = func_name
-        self._revision = self._resolve_revision()
 
+        # The revision is resolved lazily, so that constructing a locked
+        # repository does not read any lockfiles. The calling package is
+        # recorded here, since it determines which lock is used.
+        self._package = _get_caller_package() if lockfile is None else None
+
+    @functools.lru_cache()
     def _resolve_revision(self) -> str:
         if self._lockfile is None:
-            locked_sha = _get_caller_locked_kernel(self._repo_id)
+            locked_sha = _get_package_locked_kernel(self._repo_id, self._package)
         else:
-            with open(self._lockfile, "r") as f:
-                locked_sha = _get_locked_kernel(self._repo_id, f.read())
+            locked_sha = _get_locked_kernel(self._repo_id, self._lockfile)
 
         if locked_sha is None:
             raise ValueError(f"Kernel `{self._repo_id}` is not locked")
@@ -259,7 +264,7 @@ class LockedFuncRepository:
         return locked_sha
 
     def load(self) -> Type["nn.Module"]:
-        kernel = get_kernel(repo_id=self._repo_id, revision=self._revision)
+        kernel = get_kernel(repo_id=self._repo_id, revision=self._resolve_revision())
         return _get_kernel_func(self, kernel)
 
     def __eq__(self, other):
@@ -267,14 +272,15 @@ class LockedFuncRepository:
             isinstance(other, LockedFuncRepository)
             and self.func_name == other.func_name
             and self._repo_id == other._repo_id
-            and self._revision == other._revision
+            and self._lockfile == other._lockfile
+            and self._package == other._package
         )
 
     def __hash__(self):
-        return hash((self.func_name, self._repo_id, self._revision))
+        return hash((self.func_name, self._repo_id, self._lockfile, self._package))
 
     def __str__(self) -> str:
-        return f"`{self._repo_id}` (revision: {self._revision}), function `{self.func_name}`"
+        return f"`{self._repo_id}` (revision: {self._resolve_revision()}), function `{self.func_name}`"
 
 
 def _get_kernel_func(
@@ -1,10 +1,10 @@
 import os
 from contextvars import ContextVar
 
-from .repos import DeviceRepos
+from ._mapping import _KernelMapping
 
 _DISABLE_KERNEL_MAPPING: bool = bool(int(os.environ.get("DISABLE_KERNEL_MAPPING", "0")))
 
-_KERNEL_MAPPING: ContextVar[dict[str, dict[str, DeviceRepos]]] = ContextVar(
-    "_KERNEL_MAPPING", default={}
+_KERNEL_MAPPING: ContextVar[_KernelMapping] = ContextVar(
+    "_KERNEL_MAPPING", default=_KernelMapping()
 )
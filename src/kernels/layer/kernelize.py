@@ -1,11 +1,25 @@
 from __future__ import annotations
 
-from copy import deepcopy
-from typing import TYPE_CHECKING
+import contextvars
+import inspect
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Type
 
 from .repos import DeviceRepos
+from ._mapping import _KernelMapping
 from .globals import _KERNEL_MAPPING
-from .layer import kernelize_layer
+from .. import tracing
+from ._plan_cache import _PlanCache
+from .layer import (
+    _CACHED_LAYER,
+    _get_layer_memoize,
+    _replace_forward,
+    _resolve_layer,
+    _select_layer_repository,
+)
 from .repos import RepositoryProtocol
 from .mode import Mode
 from .device import Device
@@ -81,11 +95,12 @@ def use_kernel_mapping(
 
     class ContextManager:
         def __enter__(self):
-            # Mappings always stack on previous mappings.
+            # Mappings always stack on previous mappings. The mapping of the
+            # context extends the current mapping without copying it.
             if inherit_mapping:
-                self.token = _KERNEL_MAPPING.set(deepcopy(_KERNEL_MAPPING.get()))
+                self.token = _KERNEL_MAPPING.set(_KERNEL_MAPPING.get().extend())
             else:
-                self.token = _KERNEL_MAPPING.set({})
+                self.token = _KERNEL_MAPPING.set(_KernelMapping())
             register_kernel_mapping(mapping)
 
         def __exit__(self, exc_type, exc_value, traceback):
@@ -153,25 +168,39 @@ def register_kernel_mapping(
         ```
     """
     if not inherit_mapping:
-        _KERNEL_MAPPING.set({})
-
-    # Merge with existing mappings.
-    for new_kernel, new_device_repos in mapping.items():
-        device_repo = _KERNEL_MAPPING.get().setdefault(new_kernel, {})
-        for new_device, new_repo in new_device_repos.items():
-            device = (
-                Device(type=new_device) if isinstance(new_device, str) else new_device
-            )
+        _KERNEL_MAPPING.set(_KernelMapping())
+
+    with _REGISTER_LOCK:
+        kernel_mapping = _KERNEL_MAPPING.get()
+
+        # Merge with existing mappings. Device repositories are shared with
+        # the mappings of other contexts, so they are copied before inserting.
+        layers: dict[str, dict[str, DeviceRepos]] = {}
+        for new_kernel, new_device_repos in mapping.items():
+            device_repo = dict(kernel_mapping.get(new_kernel, {}))
+            for new_device, new_repo in new_device_repos.items():
+                device = (
+                    Device(type=new_device)
+                    if isinstance(new_device, str)
+                    else new_device
+                )
 
-            if isinstance(new_repo, dict):
-                kernel_options = new_repo
-            else:
-                kernel_options = {Mode.FALLBACK: new_repo}
+                if isinstance(new_repo, dict):
+                    kernel_options = new_repo
+                else:
+                    kernel_options = {Mode.FALLBACK: new_repo}
 
-            feature_repos = device_repo.setdefault(
-                device.type, DeviceRepos.create_repo(device)
-            )
-            feature_repos.insert(device, kernel_options)
+                feature_repos = device_repo.get(device.type)
+                feature_repos = (
+                    DeviceRepos.create_repo(device)
+                    if feature_repos is None
+                    else feature_repos.copy()
+                )
+                feature_repos.insert(device, kernel_options)
+                device_repo[device.type] = feature_repos
+            layers[new_kernel] = device_repo
+
+        kernel_mapping.update(layers)
 
 
 def kernelize(
@@ -180,12 +209,15 @@ def kernelize(
     mode: Mode,
     device: str | "torch.device" | None = None,
     use_fallback: bool = True,
+    max_workers: int | None = None,
+    plan_cache: str | Path | None = None,
 ):
     """
     Replace layer forward methods with optimized kernel implementations.
 
     This function iterates over all modules in the model and replaces the `forward` method of extensible layers
-    for which kernels are registered using [`register_kernel_mapping`] or [`use_kernel_mapping`].
+    for which kernels are registered using [`register_kernel_mapping`] or [`use_kernel_mapping`]. The kernels
+    for the model's layers are loaded concurrently before any `forward` method is replaced.
 
     Args:
         model (`nn.Module`):
@@ -199,6 +231,14 @@ def kernelize(
         use_fallback (`bool`, *optional*, defaults to `True`):
             Whether to use the original forward method of modules when no compatible kernel could be found.
             If set to `False`, an exception will be raised in such cases.
+        max_workers (`int`, *optional*):
+            The maximum number of kernels to load concurrently. Uses the `ThreadPoolExecutor` default
+            when not provided.
+        plan_cache (`Union[str, Path]`, *optional*):
+            File to store the kernels that are selected for each layer class in. When the file exists,
+            the kernels are imported from the cache without resolving the kernel mapping, looking up
+            revisions or versions, or validating layers. The file is updated automatically when the
+            environment, kernel mapping, locked revisions, or arguments change.
 
     Returns:
         `nn.Module`: The kernelized model with optimized kernel implementations.
@@ -238,6 +278,198 @@ def kernelize(
         ```
     """
 
+    _validate_mode(mode)
+    device_type = _device_type(model, device)
+
+    with tracing.span("kernelize"):
+        layer_classes = _layer_classes(model.modules())
+
+        # The layer is the same for all instances of a class, so layers are
+        # resolved once per class rather than once per module.
+        layers: dict[type, Type[nn.Module]] = {}
+
+        plan = None
+        if plan_cache is not None:
+            plan = _PlanCache(
+                Path(plan_cache),
+                mode=mode,
+                device_type=device_type,
+                use_fallback=use_fallback,
+            )
+            for module_class in layer_classes:
+                layer = plan.replay(module_class)
+                if layer is not None:
+                    layers[module_class] = layer
+
+        # Load the kernels of all layer classes before patching any module, so
+        # that distinct kernels are downloaded and imported concurrently.
+        _load_layers(
+            layer_classes - layers.keys(),
+            mode=mode,
+            device_type=device_type,
+            max_workers=max_workers,
+        )
+
+        for _, module in model.named_modules():
+            module_class = type(module)
+            if module_class not in layer_classes:
+                continue
+
+            layer = layers.get(module_class)
+            if layer is None:
+                layer = _resolve_layer(
+                    module_class,
+                    mode=mode,
+                    device_type=device_type,
+                    use_fallback=use_fallback,
+                )
+                layers[module_class] = layer
+                if plan is not None:
+                    plan.record(module_class, layer)
+            _replace_forward(module, layer)
+
+        if plan is not None:
+            plan.save()
+
+    return model
+
+
+def prefetch_layers(
+    model: "nn.Module" | Type["nn.Module"],
+    *,
+    mode: Mode,
+    device: str | "torch.device" | None = None,
+    max_workers: int | None = None,
+) -> Future[None]:
+    """
+    Download and import the kernels for the extensible layers of a model in the background.
+
+    This can be used to overlap loading kernels with loading model weights. Once the returned
+    future is done, [`kernelize`] does not need to load kernels anymore. Errors while loading
+    kernels are not raised by the future, they are raised by [`kernelize`] instead.
+
+    Args:
+        model (`Union[nn.Module, Type[nn.Module]]`):
+            The model or model class to prefetch kernels for. For a model, the kernels of the extensible
+            layers in the model are loaded, so a model on the `meta` device can be used before its weights
+            are loaded. For a model class, the kernels of the extensible layers that are defined in the
+            Python modules of the class and its base classes are loaded.
+        mode ([`Mode`]):
+            The mode that the model will be kernelized for.
+        device (`Union[str, torch.device]`, *optional*):
+            The device type to load kernels for. Supported device types are: "cuda", "mps", "npu", "rocm", "xpu".
+            Must be provided for a model class, for a model it is inferred from the model parameters when
+            not provided.
+        max_workers (`int`, *optional*):
+            The maximum number of kernels to load concurrently. Uses the `ThreadPoolExecutor` default
+            when not provided.
+
+    Returns:
+        `Future[None]`: Future that is done when the kernels are loaded.
+
+    Example:
+        ```python
+        from transformers import AutoModelForCausalLM, LlamaForCausalLM
+
+        from kernels import Mode, kernelize, prefetch_layers
+
+        prefetch = prefetch_layers(LlamaForCausalLM, mode=Mode.INFERENCE, device="cuda")
+        model = AutoModelForCausalLM.from_pretrained("meta-llama/Llama-3.2-1B", device_map="cuda")
+        prefetch.result()
+
+        model = kernelize(model, mode=Mode.INFERENCE)
+        ```
+    """
+    _validate_mode(mode)
+
+    if isinstance(model, type):
+        if device is None:
+            raise ValueError(
+                "Cannot determine model device, provide as `device` argument to `prefetch_layers`."
+            )
+        device_type = _device_type(None, device)
+        layer_classes = _layer_classes_of_class(model)
+    else:
+        device_type = _device_type(model, device)
+        layer_classes = _layer_classes(model.modules())
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    # Context variables do not propagate to threads, copy the context so
+    # that the kernel mapping of the caller is used.
+    future = executor.submit(
+        contextvars.copy_context().run,
+        _load_layers,
+        layer_classes,
+        mode=mode,
+        device_type=device_type,
+        max_workers=max_workers,
+    )
+    executor.shutdown(wait=False)
+    return future
+
+
+def _load_layers(
+    layer_classes: Iterable[type],
+    *,
+    mode: Mode,
+    device_type: Device,
+    max_workers: int | None,
+):
+    """
+    Load the layers of extensible layer classes concurrently.
+
+    Errors are logged and ignored, they are raised when the layers are resolved
+    for patching, where `use_fallback` determines how they are handled.
+    """
+    repos: dict[RepositoryProtocol, type] = {}
+    for module_class in layer_classes:
+        selection = _select_layer_repository(
+            str(module_class.kernel_layer_name),  # type: ignore[attr-defined]
+            mode=mode,
+            device_type=device_type,
+        )
+        if selection.repo is not None and selection.repo not in _CACHED_LAYER:
+            repos.setdefault(selection.repo, module_class)
+
+    # A single layer is loaded when it is resolved.
+    if len(repos) <= 1:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            repo: executor.submit(
+                contextvars.copy_context().run, _get_layer_memoize, repo, module_class
+            )
+            for repo, module_class in repos.items()
+        }
+
+    for repo, future in futures.items():
+        exception = future.exception()
+        if exception is not None:
+            logging.debug(f"Cannot prefetch layer from repo {repo}: {exception}")
+
+
+def _layer_classes(modules: Iterable["nn.Module"]) -> set[type]:
+    """Get the extensible layer classes of modules."""
+    return {
+        type(module) for module in modules if hasattr(type(module), "kernel_layer_name")
+    }
+
+
+def _layer_classes_of_class(model_class: type) -> set[type]:
+    """Get the extensible layer classes defined in the Python modules of a model class."""
+    layer_classes = set()
+    for cls in inspect.getmro(model_class):
+        python_module = inspect.getmodule(cls)
+        if python_module is None:
+            continue
+        for _, member in inspect.getmembers(python_module, inspect.isclass):
+            if hasattr(member, "kernel_layer_name"):
+                layer_classes.add(member)
+    return layer_classes
+
+
+def _validate_mode(mode: Mode):
     if mode == Mode.FALLBACK:
         raise ValueError("Mode.FALLBACK can only be used to register kernel mappings.")
 
@@ -247,7 +479,12 @@ def kernelize(
     if Mode.INFERENCE not in mode and Mode.TRAINING not in mode:  # type: ignore[operator]
         raise ValueError("kernelize mode must contain Mode.INFERENCE or Mode.TRAINING.")
 
+
+def _device_type(
+    model: "nn.Module" | None, device: str | "torch.device" | None
+) -> Device:
     if device is None:
+        assert model is not None
         device_type = _find_device(model)
     elif isinstance(device, str):
         _validate_device_type(device)
@@ -256,17 +493,10 @@ def kernelize(
         device_type = Device(device.type)
 
     assert isinstance(device_type, Device)
+    return device_type
 
-    for _, module in model.named_modules():
-        module_class = type(module)
-        if not hasattr(module_class, "kernel_layer_name"):
-            continue
-
-        kernelize_layer(
-            module, mode=mode, device_type=device_type, use_fallback=use_fallback
-        )
 
-    return model
+_REGISTER_LOCK = threading.Lock()
 
 
 def _validate_device_type(device_type: str) -> None:
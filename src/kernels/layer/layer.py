@@ -6,14 +6,16 @@ import logging
 import warnings
 from pathlib import Path
 from types import MethodType, ModuleType
-from typing import TYPE_CHECKING, Protocol, Type
+from typing import TYPE_CHECKING, NamedTuple, Protocol, Type
 
 from .device import Device
 from .globals import _DISABLE_KERNEL_MAPPING, _KERNEL_MAPPING
+from .. import tracing
 from .._versions import select_revision_or_version
 from ..utils import (
-    _get_caller_locked_kernel,
+    _get_caller_package,
     _get_locked_kernel,
+    _get_package_locked_kernel,
     get_kernel,
     get_local_kernel,
 )
@@ -191,14 +193,18 @@ class LockedLayerRepository:
         self._repo_id = repo_id
         self._lockfile = lockfile
         self.layer_name = layer_name
-        self._revision = self._resolve_revision()
 
+        # The revision is resolved lazily, so that constructing a locked
+        # repository does not read any lockfiles. The calling package is
+        # recorded here, since it determines which lock is used.
+        self._package = _get_caller_package() if lockfile is None else None
+
+    @functools.lru_cache()
     def _resolve_revision(self) -> str:
         if self._lockfile is None:
-            locked_sha = _get_caller_locked_kernel(self._repo_id)
+            locked_sha = _get_package_locked_kernel(self._repo_id, self._package)
         else:
-            with open(self._lockfile, "r") as f:
-                locked_sha = _get_locked_kernel(self._repo_id, f.read())
+            locked_sha = _get_locked_kernel(self._repo_id, self._lockfile)
 
         if locked_sha is None:
             raise ValueError(f"Kernel `{self._repo_id}` is not locked")
@@ -206,7 +212,7 @@ class LockedLayerRepository:
         return locked_sha
 
     def load(self) -> Type["nn.Module"]:
-        kernel = get_kernel(repo_id=self._repo_id, revision=self._revision)
+        kernel = get_kernel(repo_id=self._repo_id, revision=self._resolve_revision())
         return _get_kernel_layer(self, kernel)
 
     def __eq__(self, other):
@@ -214,16 +220,15 @@ class LockedLayerRepository:
             isinstance(other, LockedLayerRepository)
             and self.layer_name == other.layer_name
             and self._repo_id == other._repo_id
-            and self._revision == other._revision
+            and self._lockfile == other._lockfile
+            and self._package == other._package
         )
 
     def __hash__(self):
-        return hash((self.layer_name, self._repo_id, self._revision))
+        return hash((self.layer_name, self._repo_id, self._lockfile, self._package))
 
     def __str__(self) -> str:
-        return (
-            f"`{self._repo_id}` (revision: {self._revision}), layer `{self.layer_name}`"
-        )
+        return f"`{self._repo_id}` (revision: {self._resolve_revision()}), layer `{self.layer_name}`"
 
 
 _CACHED_LAYER: dict[RepositoryProtocol, Type["nn.Module"]] = {}
@@ -298,65 +303,41 @@ def use_kernel_forward_from_hub(layer_name: str):
     return decorator
 
 
-def kernelize_layer(
-    module: "nn.Module", *, mode: Mode, device_type: Device, use_fallback
-):
-    module_class = type(module)
-    layer_name = module_class.kernel_layer_name  # type: ignore[attr-defined]
-
-    if _DISABLE_KERNEL_MAPPING:
-        _replace_forward(module, module_class)
-        return
-
-    kernel = _KERNEL_MAPPING.get().get(str(layer_name))
-
-    if kernel is None:
-        warnings.warn(
-            "\n"
-            f"No kernel mapping found for layer `{layer_name}`. "
-            f"Check if the layer name matches one of the kernels in the mapping or add the kernel "
-            f"you want to use to the mapping. Defaulting to original forward implementation."
-        )
-        if not use_fallback:
-            raise ValueError(f"No layer mapping for `{layer_name}`")
-        _replace_forward(module, module_class)
-        return
-
-    # Get kernel options for the device
-    property_repos = kernel.get(device_type.type)
-
-    if property_repos is None:
-        if not use_fallback:
-            raise ValueError(
-                f"No layer mapping for `{layer_name}` with device type `{device_type}`"
-            )
-        _replace_forward(module, module_class)
-        return
-
-    repos = property_repos.repos
+def _resolve_layer(
+    module_class: Type["nn.Module"],
+    *,
+    mode: Mode,
+    device_type: Device,
+    use_fallback: bool,
+) -> Type["nn.Module"]:
+    """
+    Resolve the layer whose forward replaces the forward of an extensible layer class.
 
-    if repos is None:
-        if not use_fallback:
-            raise ValueError(
-                f"No layer mapping for `{layer_name}` device `{device_type}` with the right properties"
-            )
-        _replace_forward(module, module_class)
-        return
+    Returns `module_class` itself when the original forward should be used.
+    The result is the same for all instances of a class, so it only needs to
+    be resolved once per class, mode, and device.
+    """
+    layer_name = module_class.kernel_layer_name  # type: ignore[attr-defined]
 
-    repo_with_mode = _select_repository(
-        repos,
-        mode=mode,
+    selection = _select_layer_repository(
+        str(layer_name), mode=mode, device_type=device_type
     )
-
-    if repo_with_mode is None:
-        if not use_fallback:
-            raise ValueError(
-                f"No repository for `{layer_name}` for configuration mode={mode}"
+    if selection.repo is None:
+        if selection.disabled:
+            return module_class
+        if not selection.mapped:
+            warnings.warn(
+                "\n"
+                f"No kernel mapping found for layer `{layer_name}`. "
+                f"Check if the layer name matches one of the kernels in the mapping or add the kernel "
+                f"you want to use to the mapping. Defaulting to original forward implementation."
             )
-        _replace_forward(module, module_class)
-        return
+        if not use_fallback:
+            raise ValueError(selection.reason)
+        return module_class
 
-    repo, repo_mode = repo_with_mode
+    repo, repo_mode = selection.repo, selection.repo_mode
+    assert repo_mode is not None
 
     logging.info(f"Using function/layer from repo {repo}")
     logging.debug(f"kernelize mode: {mode}, repo mode: {repo_mode}")
@@ -371,14 +352,79 @@ def kernelize_layer(
         layer_name=layer_name, module=layer, repo=repo, repo_mode=repo_mode
     )
 
-    _conditionally_replace_forward(
-        module=module,
+    return _select_forward_layer(
+        module_class=module_class,
         layer=layer,
         mode=mode,
         use_fallback=use_fallback,
     )
 
 
+class _LayerRepositorySelection(NamedTuple):
+    """
+    The repository selected for a layer name, or the reason why none was selected.
+    """
+
+    repo: RepositoryProtocol | None
+    repo_mode: Mode | None = None
+    # The capability interval that the repository was registered for.
+    capability_interval: tuple[int, int] | None = None
+    reason: str | None = None
+    # Whether the layer name is in the kernel mapping.
+    mapped: bool = True
+    # Whether kernel mappings are disabled.
+    disabled: bool = False
+
+
+def _select_layer_repository(
+    layer_name: str, *, mode: Mode, device_type: Device, capability: int | None = None
+) -> _LayerRepositorySelection:
+    """Select the repository for a layer from the kernel mapping, without loading it."""
+    if _DISABLE_KERNEL_MAPPING:
+        return _LayerRepositorySelection(
+            None, reason="Kernel mappings are disabled", disabled=True
+        )
+
+    kernel = _KERNEL_MAPPING.get().get(layer_name)
+
+    if kernel is None:
+        return _LayerRepositorySelection(
+            None, reason=f"No layer mapping for `{layer_name}`", mapped=False
+        )
+
+    # Get kernel options for the device
+    property_repos = kernel.get(device_type.type)
+
+    if property_repos is None:
+        return _LayerRepositorySelection(
+            None,
+            reason=f"No layer mapping for `{layer_name}` with device type `{device_type}`",
+        )
+
+    selected_repos = property_repos.select(capability)
+
+    if selected_repos is None:
+        return _LayerRepositorySelection(
+            None,
+            reason=f"No layer mapping for `{layer_name}` device `{device_type}` with the right properties",
+        )
+
+    repos, capability_interval = selected_repos
+    repo_with_mode = _select_repository(
+        repos,
+        mode=mode,
+    )
+
+    if repo_with_mode is None:
+        return _LayerRepositorySelection(
+            None,
+            reason=f"No repository for `{layer_name}` for configuration mode={mode}",
+        )
+
+    repo, repo_mode = repo_with_mode
+    return _LayerRepositorySelection(repo, repo_mode, capability_interval)
+
+
 def _get_kernel_layer(
     repo: LayerRepositoryProtocol, kernel: ModuleType
 ) -> Type["nn.Module"]:
@@ -435,14 +481,13 @@ def _validate_layer(*, check_cls, cls, repo: RepositoryProtocol):
             )
 
 
-def _conditionally_replace_forward(
+def _select_forward_layer(
     *,
-    module: "nn.Module",
+    module_class: Type["nn.Module"],
     layer: Type["nn.Module"],
     mode: Mode,
     use_fallback: bool,
-):
-    module_class = type(module)
+) -> Type["nn.Module"]:
 
     # Switch to fallback if the mode is not supported by the layer.
     # Note that this is useful even after _validate_layer_has_mode because
@@ -462,11 +507,11 @@ def _conditionally_replace_forward(
                 logging.info("Layer does not support torch.compile, using fallback")
             if needs_fallback_for_backward:
                 logging.info("Layer does not support backward, using fallback")
-            _replace_forward(module, module_class)
+            return module_class
         else:
             raise ValueError(f"Available kernel does not support mode: {mode}")
-    else:
-        _replace_forward(module, layer)
+
+    return layer
 
 
 def _replace_forward(module: "nn.Module", layer: Type["nn.Module"]):
@@ -509,7 +554,8 @@ def _get_layer_memoize(
         return layer
 
     layer = repo.load()
-    _validate_layer(check_cls=module_class, cls=layer, repo=repo)
+    with tracing.span("validate_layer", repo_id=getattr(repo, "_repo_id", None)):
+        _validate_layer(check_cls=module_class, cls=layer, repo=repo)
     _CACHED_LAYER[repo] = layer
 
     return layer
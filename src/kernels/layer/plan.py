@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from .device import Device
+from .kernelize import _device_type, _validate_mode
+from .layer import _LayerRepositorySelection, _select_layer_repository
+from .mode import Mode
+from .repos import RepositoryProtocol
+
+if TYPE_CHECKING:
+    import torch
+    from torch import nn
+
+
+@dataclass(frozen=True)
+class ModulePlan:
+    """
+    The kernel that [`kernelize`] selects for a module.
+
+    Args:
+        layer_name (`str`):
+            The name of the extensible layer that the module is an instance of.
+        repo ([`RepositoryProtocol`], *optional*):
+            The repository of the selected kernel, `None` if the module uses its original `forward`.
+        repo_mode ([`Mode`], *optional*):
+            The mode that the selected repository was registered for.
+        capability_interval (`tuple[int, int]`, *optional*):
+            The minimum and maximum capability that the selected repository was registered for.
+            `None` for device types without capabilities.
+        fallback_reason (`str`, *optional*):
+            The reason why the module uses its original `forward`, `None` if a kernel is selected.
+    """
+
+    layer_name: str
+    repo: RepositoryProtocol | None
+    repo_mode: Mode | None
+    capability_interval: tuple[int, int] | None
+    fallback_reason: str | None
+
+
+@dataclass(frozen=True)
+class KernelizePlan:
+    """
+    The kernels that [`kernelize`] selects for the modules of a model, see [`plan_kernelize`].
+
+    Args:
+        mode ([`Mode`]):
+            The mode that the model is kernelized for.
+        device ([`Device`]):
+            The device that the model is kernelized for.
+        modules (`dict[str, ModulePlan]`):
+            The plan for each extensible layer in the model, by fully-qualified module name.
+    """
+
+    mode: Mode
+    device: Device
+    modules: dict[str, ModulePlan]
+
+    @property
+    def n_kernelized(self) -> int:
+        """The number of modules for which a kernel is selected."""
+        return sum(plan.repo is not None for plan in self.modules.values())
+
+    @property
+    def n_fallback(self) -> int:
+        """The number of modules that use their original `forward`."""
+        return len(self.modules) - self.n_kernelized
+
+    @property
+    def repos(self) -> dict[RepositoryProtocol, int]:
+        """The selected repositories, with the number of modules that use them."""
+        return dict(
+            Counter(
+                plan.repo for plan in self.modules.values() if plan.repo is not None
+            )
+        )
+
+    @property
+    def fallback_reasons(self) -> dict[str, int]:
+        """The reasons for using the original `forward`, with the number of modules."""
+        return dict(
+            Counter(
+                plan.fallback_reason
+                for plan in self.modules.values()
+                if plan.fallback_reason is not None
+            )
+        )
+
+
+def plan_kernelize(
+    model: "nn.Module",
+    *,
+    mode: Mode,
+    device: str | "torch.device" | None = None,
+    capability: int | None = None,
+) -> KernelizePlan:
+    """
+    Get the kernels that [`kernelize`] would select for a model, without loading them.
+
+    The plan is made using the kernel mappings registered with [`register_kernel_mapping`] or
+    [`use_kernel_mapping`]. No kernels are downloaded or imported, so the plan cannot take into
+    account whether a kernel layer supports the mode (e.g. backward passes or `torch.compile`).
+    [`kernelize`] will still fall back to the original `forward` for such layers.
+
+    Args:
+        model (`nn.Module`):
+            The PyTorch model to plan kernelization for.
+        mode ([`Mode`]):
+            The mode that the model would be kernelized for.
+        device (`Union[str, torch.device]`, *optional*):
+            The device type to select kernels for. Supported device types are: "cuda", "mps", "npu", "rocm", "xpu".
+            The device type will be inferred from the model parameters when not provided.
+        capability (`int`, *optional*):
+            The CUDA or ROCm capability to select kernels for (e.g. 90 for compute capability 9.0).
+            Defaults to the capability of the current device. This makes it possible to plan for
+            other GPUs than the GPU of the current machine, or on a machine without GPU.
+
+    Returns:
+        [`KernelizePlan`]: The plan for each extensible layer in the model.
+
+    Example:
+        ```python
+        from kernels import Mode, plan_kernelize
+
+        plan = plan_kernelize(model, mode=Mode.INFERENCE, device="cuda", capability=90)
+        for name, module_plan in plan.modules.items():
+            print(name, module_plan.repo, module_plan.fallback_reason)
+        print(f"{plan.n_kernelized} kernelized, {plan.n_fallback} fallback")
+        ```
+    """
+    _validate_mode(mode)
+    device_type = _device_type(model, device)
+
+    selections: dict[type, _LayerRepositorySelection] = {}
+    modules = {}
+    for name, module in model.named_modules():
+        module_class = type(module)
+        if not hasattr(module_class, "kernel_layer_name"):
+            continue
+
+        layer_name = str(module_class.kernel_layer_name)
+        selection = selections.get(module_class)
+        if selection is None:
+            selection = _select_layer_repository(
+                layer_name, mode=mode, device_type=device_type, capability=capability
+            )
+            selections[module_class] = selection
+
+        modules[name] = ModulePlan(
+            layer_name=layer_name,
+            repo=selection.repo,
+            repo_mode=selection.repo_mode,
+            capability_interval=selection.capability_interval,
+            fallback_reason=selection.reason,
+        )
+
+    return KernelizePlan(mode=mode, device=device_type, modules=modules)
@@ -1,3 +1,4 @@
+import copy
 from abc import ABC, abstractmethod
 from typing import TYPE_CHECKING, Protocol, Type
 import sys
@@ -52,6 +53,36 @@ class DeviceRepos(ABC):
         """
         ...
 
+    def copy(self) -> "DeviceRepos":
+        """
+        Copy the repository set, so that repositories can be inserted without modifying this set.
+
+        The repositories themselves are not copied.
+        """
+        return copy.copy(self)
+
+    def select(
+        self, capability: int | None = None
+    ) -> tuple[dict[Mode, RepositoryProtocol], tuple[int, int] | None] | None:
+        """
+        Select the repositories for a device capability.
+
+        Returns the repositories together with the capability interval that
+        they were registered for. The interval is `None` for device types
+        without capabilities.
+        """
+        repos = self.repos
+        return None if repos is None else (repos, None)
+
+    def entries(
+        self,
+    ) -> list[tuple[tuple[int, int] | None, dict[Mode, RepositoryProtocol]]]:
+        """
+        Get all registered repositories with the capability interval they were registered for.
+        """
+        repos = self.repos
+        return [] if repos is None else [(None, repos)]
+
 
 class _CPURepos(DeviceRepos):
     _repos: dict[Mode, RepositoryProtocol]
@@ -147,6 +178,28 @@ class _CUDARepos(DeviceRepos):
         capability = _find_capability()
         return self.repos_by_capability.find_smallest_interval(capability)
 
+    def copy(self) -> "DeviceRepos":
+        repos = _CUDARepos()
+        for start, end, data in self.repos_by_capability.items():
+            repos.repos_by_capability.insert(start, end, data)
+        return repos
+
+    def select(
+        self, capability: int | None = None
+    ) -> tuple[dict[Mode, RepositoryProtocol], tuple[int, int] | None] | None:
+        if capability is None:
+            capability = _find_capability()
+        match = self.repos_by_capability.find_smallest_interval_with_range(capability)
+        return None if match is None else (match[2], (match[0], match[1]))
+
+    def entries(
+        self,
+    ) -> list[tuple[tuple[int, int] | None, dict[Mode, RepositoryProtocol]]]:
+        return [
+            ((start, end), repos)
+            for start, end, repos in self.repos_by_capability.items()
+        ]
+
     def insert(self, device: Device, repos: dict[Mode, RepositoryProtocol]):
         assert device.properties is None or isinstance(
             device.properties, CUDAProperties
@@ -178,6 +231,28 @@ class _ROCMRepos(DeviceRepos):
         capability = _find_capability()
         return self.repos_by_capability.find_smallest_interval(capability)
 
+    def copy(self) -> "DeviceRepos":
+        repos = _ROCMRepos()
+        for start, end, data in self.repos_by_capability.items():
+            repos.repos_by_capability.insert(start, end, data)
+        return repos
+
+    def select(
+        self, capability: int | None = None
+    ) -> tuple[dict[Mode, RepositoryProtocol], tuple[int, int] | None] | None:
+        if capability is None:
+            capability = _find_capability()
+        match = self.repos_by_capability.find_smallest_interval_with_range(capability)
+        return None if match is None else (match[2], (match[0], match[1]))
+
+    def entries(
+        self,
+    ) -> list[tuple[tuple[int, int] | None, dict[Mode, RepositoryProtocol]]]:
+        return [
+            ((start, end), repos)
+            for start, end, repos in self.repos_by_capability.items()
+        ]
+
     def insert(self, device: Device, repos: dict[Mode, RepositoryProtocol]):
         assert device.properties is None or isinstance(
             device.properties, ROCMProperties
@@ -1,6 +1,10 @@
 import hashlib
+import json
+import os
+import threading
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Iterator
 
 from huggingface_hub import HfApi
 
@@ -28,6 +32,64 @@ class KernelLock:
         return cls(repo_id=o["repo_id"], sha=o["sha"], variants=variants)
 
 
+class LockfileIndex:
+    """
+    Kernel locks of a lockfile, indexed by repository ID.
+
+    Use [`LockfileIndex.load`] to get the index of a lockfile on disk, the
+    lockfile is only parsed again when it is modified.
+    """
+
+    def __init__(self, kernel_locks: dict[str, KernelLock]):
+        self._kernel_locks = kernel_locks
+
+    @classmethod
+    def from_json(cls, lock_json: str) -> "LockfileIndex":
+        """Parse a lockfile. If a kernel is locked multiple times, the first lock is used."""
+        kernel_locks: dict[str, KernelLock] = {}
+        for kernel_lock_json in json.loads(lock_json):
+            kernel_lock = KernelLock.from_json(kernel_lock_json)
+            kernel_locks.setdefault(kernel_lock.repo_id, kernel_lock)
+        return cls(kernel_locks)
+
+    @classmethod
+    def load(cls, path: Path) -> "LockfileIndex":
+        """Get the index of the lockfile at `path`, memoized by path and modification time."""
+        path = Path(path).resolve()
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        with _LOCKFILE_INDEXES_LOCK:
+            cached = _LOCKFILE_INDEXES.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        with open(path, "r") as f:
+            index = cls.from_json(f.read())
+
+        with _LOCKFILE_INDEXES_LOCK:
+            _LOCKFILE_INDEXES[path] = (stamp, index)
+
+        return index
+
+    def get(self, repo_id: str) -> KernelLock | None:
+        """Get the lock of a kernel, `None` if the kernel is not locked."""
+        return self._kernel_locks.get(repo_id)
+
+    def __contains__(self, repo_id: object) -> bool:
+        return repo_id in self._kernel_locks
+
+    def __iter__(self) -> Iterator[KernelLock]:
+        return iter(self._kernel_locks.values())
+
+    def __len__(self) -> int:
+        return len(self._kernel_locks)
+
+
+_LOCKFILE_INDEXES: dict[Path, tuple[tuple[int, int], LockfileIndex]] = {}
+_LOCKFILE_INDEXES_LOCK = threading.Lock()
+
+
 def get_kernel_locks(repo_id: str, version_spec: str) -> KernelLock:
     """
     Get the locks for a kernel with the given version spec.
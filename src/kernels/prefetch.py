@@ -0,0 +1,222 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+from kernels._versions import select_revision_or_version
+from kernels.environment import EnvironmentFingerprint, use_environment
+from kernels.lockfile import KernelLock
+from kernels.utils import (
+    KernelSpec,
+    _precompile_variant,
+    install_kernel,
+    install_kernel_all_variants,
+)
+
+
+@dataclass
+class PrefetchResult:
+    """
+    Result of prefetching a single kernel.
+
+    Args:
+        repo_id (`str`):
+            The Hub repository containing the kernel.
+        revision (`str`, *optional*):
+            The revision that was downloaded. This is the requested revision if it could not be resolved.
+        path (`Path`, *optional*):
+            The path of the downloaded build variant, or the `build` directory when all variants
+            were downloaded. `None` if prefetching failed.
+        duration (`float`):
+            Time in seconds that it took to resolve, download, and validate the kernel.
+        error (`Exception`, *optional*):
+            The error that occurred while prefetching the kernel.
+        target (`str`, *optional*):
+            The build variant of the target environment that the kernel was prefetched for.
+            `None` when the kernel was prefetched for the current environment.
+    """
+
+    repo_id: str
+    revision: str | None
+    path: Path | None
+    duration: float
+    error: Exception | None = None
+    target: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+PrefetchSpec = str | KernelSpec | KernelLock
+
+
+def prefetch_kernels(
+    specs: Iterable[PrefetchSpec],
+    *,
+    max_workers: int | None = None,
+    all_variants: bool = False,
+    local_files_only: bool = False,
+    targets: Iterable[str | EnvironmentFingerprint] | None = None,
+    precompile: bool = False,
+) -> list[PrefetchResult]:
+    """
+    Download and validate multiple kernels concurrently.
+
+    Kernels are downloaded to the kernel cache, but they are not imported.
+    Identical kernel specifications are only downloaded once. Errors do not
+    stop prefetching of other kernels, they are returned in the results.
+
+    Args:
+        specs (`Iterable[Union[str, KernelSpec, KernelLock]]`):
+            The kernels to prefetch. A string is interpreted as a repository ID, using the `main` revision.
+            Kernels specified with a `KernelLock` are validated against the hashes in the lock.
+        max_workers (`int`, *optional*):
+            The maximum number of kernels to download concurrently. Uses the `ThreadPoolExecutor` default
+            when not provided.
+        all_variants (`bool`, *optional*, defaults to `False`):
+            Whether to download all build variants of the kernels rather than only the variant for the
+            current environment.
+        local_files_only (`bool`, *optional*, defaults to `False`):
+            Whether to only use local files and not download from the Hub.
+        targets (`Iterable[Union[str, EnvironmentFingerprint]]`, *optional*):
+            The environments to prefetch kernels for, instead of the current environment. An environment
+            can be given as a build variant such as `"torch28-cxx11-cu128-x86_64-linux"`. For each target,
+            the build variant that would be loaded in that environment is downloaded and validated. This
+            makes it possible to prepare a kernel cache for another machine, e.g. a GPU container image on
+            a CPU-only build host. Cannot be used together with `all_variants`.
+        precompile (`bool`, *optional*, defaults to `False`):
+            Whether to compile the Python sources of the kernels to bytecode for the current Python version.
+            The bytecode is stored in the kernel cache, outside of the kernel files, and used when the kernels
+            are imported. This makes the first import of a kernel faster, also when the cache is read-only.
+
+    Returns:
+        `list[PrefetchResult]`: The result for every distinct kernel (and target), in the order of `specs`.
+
+    Example:
+        ```python
+        from kernels import prefetch_kernels
+
+        results = prefetch_kernels(
+            ["kernels-community/activation", "kernels-community/triton-layer-norm"],
+            max_workers=4,
+        )
+        for result in results:
+            print(result.repo_id, result.revision, f"{result.duration:.2f}s", result.error)
+        ```
+    """
+    target_envs: list[EnvironmentFingerprint | None] = [None]
+    if targets is not None:
+        if all_variants:
+            raise ValueError(
+                "Either all variants or targets can be prefetched, not both."
+            )
+        target_envs = [
+            (
+                EnvironmentFingerprint.from_build_variant(target)
+                if isinstance(target, str)
+                else target
+            )
+            for target in targets
+        ]
+
+    unique_specs: dict[tuple[str, str | None, str | None], PrefetchSpec] = {}
+    for spec in specs:
+        key = _spec_key(spec)
+        # Prefer locks, so that duplicates are still validated against the lock.
+        if key not in unique_specs or (
+            isinstance(spec, KernelLock)
+            and not isinstance(unique_specs[key], KernelLock)
+        ):
+            unique_specs[key] = spec
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(
+            executor.map(
+                lambda job: _prefetch_kernel(
+                    job[0],
+                    all_variants=all_variants,
+                    local_files_only=local_files_only,
+                    target=job[1],
+                    precompile=precompile,
+                ),
+                [
+                    (spec, target)
+                    for spec in unique_specs.values()
+                    for target in target_envs
+                ],
+            )
+        )
+
+
+def _spec_key(spec: PrefetchSpec) -> tuple[str, str | None, str | None]:
+    if isinstance(spec, str):
+        return (spec, None, None)
+    elif isinstance(spec, KernelLock):
+        return (spec.repo_id, spec.sha, None)
+    return (spec.repo_id, spec.revision, spec.version)
+
+
+def _prefetch_kernel(
+    spec: PrefetchSpec,
+    *,
+    all_variants: bool,
+    local_files_only: bool,
+    target: EnvironmentFingerprint | None,
+    precompile: bool = False,
+) -> PrefetchResult:
+    if target is not None:
+        # The environment is set in the worker thread, since context
+        # variables are not propagated to thread pools.
+        with use_environment(target):
+            result = _prefetch_kernel(
+                spec,
+                all_variants=all_variants,
+                local_files_only=local_files_only,
+                target=None,
+                precompile=precompile,
+            )
+        result.target = target.build_variant
+        return result
+
+    repo_id, revision, version = _spec_key(spec)
+    variant_locks = spec.variants if isinstance(spec, KernelLock) else None
+
+    start = time.perf_counter()
+    try:
+        revision = select_revision_or_version(repo_id, revision, version)
+        if all_variants:
+            path = install_kernel_all_variants(
+                repo_id,
+                revision,
+                local_files_only=local_files_only,
+                variant_locks=variant_locks,
+            )
+        else:
+            _, path = install_kernel(
+                repo_id,
+                revision,
+                local_files_only=local_files_only,
+                variant_locks=variant_locks,
+            )
+        if precompile:
+            for variant_path in path.iterdir() if all_variants else [path]:
+                _precompile_variant(variant_path)
+    except Exception as e:
+        logging.debug(f"Failed to prefetch kernel `{repo_id}`: {e}")
+        return PrefetchResult(
+            repo_id=repo_id,
+            revision=revision,
+            path=None,
+            duration=time.perf_counter() - start,
+            error=e,
+        )
+
+    return PrefetchResult(
+        repo_id=repo_id,
+        revision=revision,
+        path=path,
+        duration=time.perf_counter() - start,
+    )
@@ -0,0 +1,239 @@
+import dataclasses
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, TextIO
+
+
+@dataclass(frozen=True)
+class LoadEvent:
+    """
+    A timed phase of loading a kernel.
+
+    Args:
+        phase (`str`):
+            The phase of loading a kernel: `"resolve_revision"`, `"download"`, `"validate_kernel"`,
+            `"validate_dependencies"`, `"import"`, or `"validate_layer"`. The `"kernelize"` phase
+            spans a complete [`kernelize`] call, including the loading of its kernels.
+        start (`float`):
+            Time when the phase started, as a Unix timestamp.
+        duration (`float`):
+            Duration of the phase in seconds.
+        repo_id (`str`, *optional*):
+            The Hub repository of the kernel.
+        revision (`str`, *optional*):
+            The revision of the kernel.
+        variant (`str`, *optional*):
+            The build variant of the kernel.
+        bytes (`int`, *optional*):
+            The size of the kernel files in bytes that were downloaded or validated.
+        error (`str`, *optional*):
+            The error that ended the phase, `None` if the phase succeeded.
+    """
+
+    phase: str
+    start: float
+    duration: float
+    repo_id: str | None = None
+    revision: str | None = None
+    variant: str | None = None
+    bytes: int | None = None
+    error: str | None = None
+
+
+LoadHook = Callable[[LoadEvent], None]
+
+
+def add_load_hook(hook: LoadHook):
+    """
+    Call a function with a [`LoadEvent`] after every phase of loading a kernel.
+
+    Hooks are called in the thread that loads the kernel. Exceptions raised by hooks
+    are logged and ignored. When no hooks are registered, loading phases are not timed.
+
+    Args:
+        hook (`Callable[[LoadEvent], None]`):
+            The function to call.
+
+    Example:
+        ```python
+        from kernels.tracing import add_load_hook, remove_load_hook
+
+        def log_event(event):
+            print(event.phase, event.repo_id, f"{event.duration:.3f}s")
+
+        add_load_hook(log_event)
+        remove_load_hook(log_event)
+        ```
+    """
+    global _HOOKS
+    with _HOOKS_LOCK:
+        _HOOKS = (*_HOOKS, hook)
+
+
+def remove_load_hook(hook: LoadHook):
+    """Remove a hook that was added with [`add_load_hook`]."""
+    global _HOOKS
+    with _HOOKS_LOCK:
+        hooks = list(_HOOKS)
+        hooks.remove(hook)
+        _HOOKS = tuple(hooks)
+
+
+class LoadEventRecorder:
+    """
+    Context manager that records the kernel loading events in its scope.
+
+    Example:
+        ```python
+        from kernels import get_kernel
+        from kernels.tracing import LoadEventRecorder
+
+        with LoadEventRecorder() as recorder:
+            get_kernel("kernels-community/activation")
+        recorder.print_summary()
+        ```
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events: list[LoadEvent] = []
+
+    def __call__(self, event: LoadEvent):
+        with self._lock:
+            self.events.append(event)
+
+    def __enter__(self) -> "LoadEventRecorder":
+        add_load_hook(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_load_hook(self)
+
+    def print_summary(self, file: TextIO | None = None):
+        """Print a summary of the recorded events, see [`print_load_summary`]."""
+        with self._lock:
+            events = list(self.events)
+        print_load_summary(events, file=file)
+
+
+def print_load_summary(events: Iterable[LoadEvent], file: TextIO | None = None):
+    """
+    Print the number of events, total and maximum duration, and bytes per loading phase.
+
+    Args:
+        events (`Iterable[LoadEvent]`):
+            The events to summarize.
+        file (`TextIO`, *optional*):
+            The file to print to. Defaults to standard error.
+    """
+    phases: dict[str, list[LoadEvent]] = {}
+    for event in events:
+        phases.setdefault(event.phase, []).append(event)
+
+    rows = [["PHASE", "COUNT", "ERRORS", "TOTAL", "MAX", "BYTES"]]
+    for phase, phase_events in phases.items():
+        durations = [event.duration for event in phase_events]
+        rows.append(
+            [
+                phase,
+                str(len(phase_events)),
+                str(sum(event.error is not None for event in phase_events)),
+                f"{sum(durations):.3f}s",
+                f"{max(durations):.3f}s",
+                str(sum(event.bytes or 0 for event in phase_events)),
+            ]
+        )
+
+    file = sys.stderr if file is None else file
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print(
+            "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip(),
+            file=file,
+        )
+
+
+def span(phase: str, **fields: Any) -> "_Span":
+    """
+    Time a phase of loading a kernel.
+
+    This returns a no-op context manager when no hooks are registered, so
+    that tracing is effectively free when disabled. Fields that are only
+    known at the end of the phase can be added with `_Span.set`, use
+    `_Span.enabled` to avoid computing them when tracing is disabled.
+    """
+    if not _HOOKS:
+        return _NOOP_SPAN
+    return _Span(phase, fields)
+
+
+class _Span:
+    enabled = True
+
+    def __init__(self, phase: str, fields: dict[str, Any]):
+        self._phase = phase
+        self._fields = fields
+
+    def set(self, **fields: Any):
+        self._fields.update(fields)
+
+    def __enter__(self) -> "_Span":
+        self._start = time.time()
+        self._perf_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event = LoadEvent(
+            phase=self._phase,
+            start=self._start,
+            duration=time.perf_counter() - self._perf_start,
+            error=None if exc is None else f"{exc_type.__name__}: {exc}",
+            **self._fields,
+        )
+        for hook in _HOOKS:
+            try:
+                hook(event)
+            except Exception as e:
+                logging.warning(f"Kernel load hook failed: {e}")
+
+
+class _NoopSpan(_Span):
+    enabled = False
+
+    def __init__(self):
+        pass
+
+    def set(self, **fields: Any):
+        pass
+
+    def __enter__(self) -> "_Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class _JsonLinesSink:
+    """Hook that appends events to a JSON lines file."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event: LoadEvent):
+        line = json.dumps(dataclasses.asdict(event)) + "\n"
+        with self._lock, open(self._path, "a") as f:
+            f.write(line)
+
+
+_HOOKS: tuple[LoadHook, ...] = ()
+_HOOKS_LOCK = threading.Lock()
+_NOOP_SPAN = _NoopSpan()
+
+if os.environ.get("KERNELS_TRACE_FILE"):
+    add_load_hook(_JsonLinesSink(os.environ["KERNELS_TRACE_FILE"]))
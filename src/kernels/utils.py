@@ -2,23 +2,55 @@ import ctypes
 import hashlib
 import importlib
 import importlib.metadata
-import inspect
 import json
 import logging
 import os
 import platform
+import re
 import sys
-from importlib.metadata import Distribution
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from types import ModuleType
-
-from huggingface_hub import file_exists, snapshot_download
-from packaging.version import parse
-
+from types import FrameType, ModuleType
+from typing import Callable, Iterable
+from urllib.parse import quote
+
+from huggingface_hub import HfApi, snapshot_download
+from huggingface_hub.errors import (
+    EntryNotFoundError,
+    GatedRepoError,
+    RepositoryNotFoundError,
+    RevisionNotFoundError,
+)
+
+from kernels._cache import (
+    CacheLock,
+    cache_root,
+    dedupe_enabled,
+    install_lock_path,
+    metadata_dir,
+    metadata_ttl,
+    precompile_enabled,
+    read_json,
+    snapshot_path,
+    touch,
+    usage_path,
+    write_json,
+)
+from kernels import _bytecode, tracing
+from kernels._bytecode import bytecode_dir
+from kernels._hashing import hash_blobs
+from kernels._registry import KernelKey, KernelRegistry, KernelRegistryStats
 from kernels._system import glibc_version
+from kernels.environment import (  # noqa: F401
+    _get_privateuse_backend_name,
+    current_environment,
+)
 from kernels._versions import select_revision_or_version
 from kernels.deps import validate_dependencies
-from kernels.lockfile import KernelLock, VariantLock
+from kernels.lockfile import LockfileIndex, VariantLock
 
 ENV_VARS_TRUE_VALUES = {"1", "ON", "YES", "TRUE"}
 
@@ -37,103 +69,61 @@ def _get_cache_dir() -> str | None:
 
 CACHE_DIR: str | None = _get_cache_dir()
 
+_COMMIT_SHA_REGEX = re.compile(r"^[0-9a-f]{40}$")
 
-def _get_privateuse_backend_name() -> str | None:
-    import torch
-
-    if hasattr(torch._C, "_get_privateuse1_backend_name"):
-        return torch._C._get_privateuse1_backend_name()
-    return None
+_KERNEL_REGISTRY = KernelRegistry()
 
 
 def backend() -> str:
-    import torch
-
-    if torch.version.cuda is not None:
-        return "cuda"
-    elif torch.version.hip is not None:
-        return "hip"
-    elif torch.backends.mps.is_available():
-        return "metal"
-    elif hasattr(torch.version, "xpu") and torch.version.xpu is not None:
-        return "xpu"
-    elif _get_privateuse_backend_name() == "npu":
-        return "cann"
-    else:
-        return "cpu"
+    return current_environment().backend
 
 
 def build_variant() -> str:
-    import torch
-
-    if torch.version.cuda is not None:
-        cuda_version = parse(torch.version.cuda)
-        compute_framework = f"cu{cuda_version.major}{cuda_version.minor}"
-    elif torch.version.hip is not None:
-        rocm_version = parse(torch.version.hip.split("-")[0])
-        compute_framework = f"rocm{rocm_version.major}{rocm_version.minor}"
-    elif torch.backends.mps.is_available():
-        compute_framework = "metal"
-    elif hasattr(torch.version, "xpu") and torch.version.xpu is not None:
-        version = torch.version.xpu
-        compute_framework = f"xpu{version[0:4]}{version[5:6]}"
-    elif _get_privateuse_backend_name() == "npu":
-        from torch_npu.utils.collect_env import get_cann_version  # type: ignore[import-not-found]
-
-        cann_major, cann_minor = get_cann_version()[0], get_cann_version()[2]
-        compute_framework = f"cann{cann_major}{cann_minor}"
-    else:
-        compute_framework = "cpu"
-
-    torch_version = parse(torch.__version__)
-    cpu = platform.machine()
-    os = platform.system().lower()
-
-    if os == "darwin":
-        cpu = "aarch64" if cpu == "arm64" else cpu
-        return f"torch{torch_version.major}{torch_version.minor}-{compute_framework}-{cpu}-{os}"
-    elif os == "windows":
-        cpu = "x86_64" if cpu == "AMD64" else cpu
-        return f"torch{torch_version.major}{torch_version.minor}-{compute_framework}-{cpu}-{os}"
-
-    cxxabi = "cxx11" if torch.compiled_with_cxx11_abi() else "cxx98"
-    return f"torch{torch_version.major}{torch_version.minor}-{cxxabi}-{compute_framework}-{cpu}-{os}"
+    return current_environment().build_variant
 
 
 def build_variant_noarch() -> str:
-    import torch
-
-    if torch.version.cuda is not None:
-        return "torch-cuda"
-    elif torch.version.hip is not None:
-        return "torch-rocm"
-    elif torch.backends.mps.is_available():
-        return "torch-metal"
-    elif hasattr(torch.version, "xpu") and torch.version.xpu is not None:
-        return "torch-xpu"
-    elif _get_privateuse_backend_name() == "npu":
-        return "torch-npu"
-    else:
-        return "torch-cpu"
+    return current_environment().build_variant_noarch
 
 
 def build_variant_universal() -> str:
-    # Once we support other frameworks, detection goes here.
-    return "torch-universal"
+    return current_environment().build_variant_universal
 
 
 def build_variants() -> list[str]:
     """Return compatible build variants in preferred order."""
-    return [build_variant(), build_variant_noarch(), build_variant_universal()]
+    return current_environment().build_variants
+
+
+@dataclass(frozen=True)
+class KernelSpec:
+    """
+    Specification of a kernel on the Hub.
+
+    Args:
+        repo_id (`str`):
+            The Hub repository containing the kernel.
+        revision (`str`, *optional*, defaults to `"main"`):
+            The specific revision (branch, tag, or commit) to download. Cannot be used together with `version`.
+        version (`str`, *optional*):
+            The kernel version to download. This can be a Python version specifier, such as `">=1.0.0,<2.0.0"`.
+            Cannot be used together with `revision`.
+    """
+
+    repo_id: str
+    revision: str | None = None
+    version: str | None = None
 
 
 def _import_from_path(module_name: str, variant_path: Path) -> ModuleType:
+    fields = _trace_fields(variant_path)
     metadata_path = variant_path / "metadata.json"
     if metadata_path.exists():
-        with open(metadata_path, "r") as f:
-            metadata = json.load(f)
-            deps = metadata.get("python-depends", [])
-            validate_dependencies(deps, backend())
+        with tracing.span("validate_dependencies", **fields):
+            with open(metadata_path, "r") as f:
+                metadata = json.load(f)
+                deps = metadata.get("python-depends", [])
+                validate_dependencies(deps, backend())
 
     file_path = variant_path / "__init__.py"
     if not file_path.exists():
@@ -145,17 +135,77 @@ def _import_from_path(module_name: str, variant_path: Path) -> ModuleType:
     # the path.
     path_hash = "{:x}".format(ctypes.c_size_t(hash(file_path)).value)
     module_name = f"{module_name}_{path_hash}"
-    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    source_root = _bytecode_source_root(file_path)
+    pycache_dir = bytecode_dir(metadata_dir(CACHE_DIR))
+    if source_root is None or not (precompile_enabled() or pycache_dir.is_dir()):
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+    else:
+        # Kernels in the cache use bytecode from a separate directory when
+        # precompilation is used, so that no files are written to (possibly
+        # read-only) snapshots.
+        _bytecode.register_package(module_name, source_root, pycache_dir)
+        spec = _bytecode.spec_from_file_location(
+            module_name, file_path, source_root, pycache_dir
+        )
     if spec is None:
         raise ImportError(f"Cannot load spec for {module_name} from {file_path}")
     module = importlib.util.module_from_spec(spec)
     if module is None:
         raise ImportError(f"Cannot load module {module_name} from spec")
     sys.modules[module_name] = module
-    spec.loader.exec_module(module)  # type: ignore
+    with tracing.span("import", **fields):
+        spec.loader.exec_module(module)  # type: ignore
     return module
 
 
+def _trace_fields(variant_path: Path) -> dict[str, str | None]:
+    """Get the repository, revision, and variant of a variant path for tracing."""
+    repo_path = variant_path.parent.parent
+    repo_dir = repo_path.parent.parent.name
+    return {
+        "repo_id": (
+            repo_dir.removeprefix("models--").replace("--", "/")
+            if repo_dir.startswith("models--")
+            else None
+        ),
+        "revision": repo_path.name,
+        "variant": variant_path.name,
+    }
+
+
+def _tree_size(path: Path) -> int:
+    """Get the total size of the files in a directory, following symlinks."""
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += (Path(dirpath) / filename).stat().st_size
+            except OSError:
+                pass
+    return size
+
+
+def _bytecode_source_root(file_path: Path) -> Path | None:
+    """Get the cache root when the file is in the kernel cache, `None` otherwise."""
+    source_root = Path(os.path.abspath(cache_root(CACHE_DIR)))
+    try:
+        Path(os.path.abspath(file_path)).relative_to(source_root)
+    except ValueError:
+        return None
+    return source_root
+
+
+def _precompile_variant(variant_path: Path):
+    """Compile the Python sources of a build variant to the bytecode directory."""
+    source_root = _bytecode_source_root(variant_path)
+    if source_root is not None:
+        _bytecode.precompile(
+            source_root,
+            Path(os.path.abspath(variant_path)),
+            bytecode_dir(metadata_dir(CACHE_DIR)),
+        )
+
+
 def install_kernel(
     repo_id: str,
     revision: str,
@@ -183,26 +233,275 @@ def install_kernel(
     Returns:
         `tuple[str, Path]`: A tuple containing the package name and the path to the variant directory.
     """
+    package_name, variant_path = _install_kernel(
+        repo_id,
+        revision,
+        local_files_only=local_files_only,
+        variant_locks=variant_locks,
+        user_agent=user_agent,
+    )
+    _record_kernel_use(repo_id, variant_path)
+    return package_name, variant_path
+
+
+def _install_kernel(
+    repo_id: str,
+    revision: str,
+    *,
+    local_files_only: bool,
+    variant_locks: dict[str, VariantLock] | None,
+    user_agent: str | dict | None,
+) -> tuple[str, Path]:
     package_name = package_name_from_repo_id(repo_id)
-    allow_patterns = [f"build/{variant}/*" for variant in build_variants()]
-    user_agent = _get_user_agent(user_agent=user_agent)
-    repo_path = Path(
-        snapshot_download(
+
+    revision = _resolve_installed_revision(repo_id, revision)
+    if _is_commit_sha(revision):
+        variant_path = _get_indexed_variant(repo_id, revision, variant_locks)
+        if variant_path is not None:
+            return package_name, variant_path
+
+    # Only one process downloads and validates a kernel revision at a time.
+    # Processes that waited for the lock reuse the indexed variant.
+    wait_start = time.time()
+    with CacheLock(_install_lock_path(repo_id)):
+        if _is_commit_sha(revision):
+            sha: str | None = revision
+        else:
+            # Branches and tags are reused when they were resolved while
+            # waiting for the lock.
+            sha = _get_installed_revision(repo_id, revision, since=wait_start)
+        if sha is not None:
+            variant_path = _get_indexed_variant(repo_id, sha, variant_locks)
+            if variant_path is not None:
+                return package_name, variant_path
+
+        variants = _select_download_variants(
+            repo_id, revision, local_files_only=local_files_only
+        )
+        user_agent = _get_user_agent(user_agent=user_agent)
+        repo_path = _download_variants(
             repo_id,
-            allow_patterns=allow_patterns,
-            cache_dir=CACHE_DIR,
-            revision=revision,
+            revision,
+            variants,
             local_files_only=local_files_only,
             user_agent=user_agent,
         )
-    )
+        candidates = build_variants()
+        if variants != candidates and not any(
+            (repo_path / "build" / variant).exists() for variant in variants
+        ):
+            # The variant was selected from a cached repository tree, which
+            # can be outdated for branches. Fall back to all candidates.
+            logging.info(
+                f"Build variant {variants[0]} of `{repo_id}` (revision: {revision}) not found, downloading all candidate variants"
+            )
+            repo_path = _download_variants(
+                repo_id,
+                revision,
+                candidates,
+                local_files_only=local_files_only,
+                user_agent=user_agent,
+            )
 
-    try:
-        return _find_kernel_in_repo_path(repo_path, package_name, variant_locks)
-    except FileNotFoundError:
-        raise FileNotFoundError(
-            f"Cannot install kernel from repo {repo_id} (revision: {revision})"
+        try:
+            package_name, variant_path = _find_kernel_in_repo_path(
+                repo_path, package_name, variant_locks
+            )
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Cannot install kernel from repo {repo_id} (revision: {revision})"
+            )
+
+        _index_variant(repo_id, variant_path, variant_locks)
+        if not _is_commit_sha(revision):
+            _record_installed_revision(
+                repo_id, revision, variant_path.parent.parent.name
+            )
+        if dedupe_enabled():
+            _dedupe_variant(variant_path)
+        if precompile_enabled():
+            _precompile_variant(variant_path)
+
+    _enforce_cache_budget(protect={(repo_id, variant_path.parent.parent.name)})
+
+    return package_name, variant_path
+
+
+def _download_variants(
+    repo_id: str,
+    revision: str,
+    variants: list[str],
+    *,
+    local_files_only: bool,
+    user_agent: str | dict | None,
+) -> Path:
+    """Download build variants of a kernel revision, returns the snapshot path."""
+    with tracing.span(
+        "download",
+        repo_id=repo_id,
+        revision=revision,
+        variant=variants[0] if len(variants) == 1 else None,
+    ) as download_span:
+        repo_path = Path(
+            snapshot_download(
+                repo_id,
+                allow_patterns=[f"build/{variant}/*" for variant in variants],
+                cache_dir=CACHE_DIR,
+                revision=revision,
+                local_files_only=local_files_only,
+                user_agent=user_agent,
+            )
         )
+        if download_span.enabled:
+            download_span.set(
+                bytes=sum(
+                    _tree_size(repo_path / "build" / variant) for variant in variants
+                )
+            )
+    return repo_path
+
+
+def _select_download_variants(
+    repo_id: str, revision: str, *, local_files_only: bool
+) -> list[str]:
+    """
+    Select the build variants to download.
+
+    Only the best build variant is downloaded when the variants of the
+    revision are known from the (cached) repository tree. Otherwise, all
+    candidate variants are downloaded and the best one is picked afterwards.
+    """
+    candidates = build_variants()
+    if local_files_only:
+        return candidates
+
+    try:
+        loadable_variants = _get_loadable_variants(repo_id, revision)
+    except Exception as e:
+        logging.debug(f"Cannot list build variants of `{repo_id}`: {e}")
+        return candidates
+
+    for variant in candidates:
+        if variant in loadable_variants:
+            return [variant]
+
+    return candidates
+
+
+def _install_lock_path(repo_id: str) -> Path:
+    return install_lock_path(CACHE_DIR, repo_id)
+
+
+def _installed_revision_path(repo_id: str, revision: str) -> Path:
+    return (
+        metadata_dir(CACHE_DIR)
+        / "revisions"
+        / repo_id.replace("/", "--")
+        / f"{quote(revision, safe='')}.json"
+    )
+
+
+def _record_installed_revision(repo_id: str, revision: str, sha: str):
+    """Record the commit that a branch or tag resolved to when it was installed."""
+    write_json(
+        _installed_revision_path(repo_id, revision), {"time": time.time(), "sha": sha}
+    )
+
+
+def _get_installed_revision(repo_id: str, revision: str, *, since: float) -> str | None:
+    """Get the commit that a branch or tag was installed as, if installed after `since`."""
+    entry = read_json(_installed_revision_path(repo_id, revision))
+    if entry is None or entry["time"] < since:
+        return None
+    return entry["sha"]
+
+
+def _resolve_installed_revision(repo_id: str, revision: str) -> str:
+    """
+    Resolve a branch or tag to the commit it was installed as.
+
+    Installed branches and tags are used without contacting the Hub until
+    they expire (see `KERNELS_METADATA_TTL`). Other revisions are returned
+    unchanged.
+    """
+    if _is_commit_sha(revision):
+        return revision
+    sha = _get_installed_revision(repo_id, revision, since=time.time() - metadata_ttl())
+    return revision if sha is None else sha
+
+
+def _variant_index_path(repo_id: str, sha: str, variant: str) -> Path:
+    return (
+        metadata_dir(CACHE_DIR)
+        / "variants"
+        / repo_id.replace("/", "--")
+        / sha
+        / f"{variant}.json"
+    )
+
+
+def _index_variant(
+    repo_id: str,
+    variant_path: Path,
+    variant_locks: dict[str, VariantLock] | None,
+):
+    """Record that a build variant of a commit was downloaded completely."""
+    sha = variant_path.parent.parent.name
+    if not _is_commit_sha(sha):
+        return
+
+    variant = variant_path.name
+    variant_lock = None if variant_locks is None else variant_locks.get(variant)
+    write_json(
+        _variant_index_path(repo_id, sha, variant),
+        {
+            # The variant is only valid for the same candidate variants,
+            # e.g. a newer Torch version could have a better match.
+            "candidates": build_variants(),
+            "hash": None if variant_lock is None else variant_lock.hash,
+        },
+    )
+
+
+def _get_indexed_variant(
+    repo_id: str,
+    sha: str,
+    variant_locks: dict[str, VariantLock] | None,
+) -> Path | None:
+    """
+    Get the path of a downloaded build variant of a commit from the index.
+
+    This avoids `snapshot_download`, which walks the snapshot and may do
+    network requests even when the commit was downloaded before.
+    """
+    candidates = build_variants()
+    for variant in candidates:
+        entry = read_json(_variant_index_path(repo_id, sha, variant))
+        if entry is None or entry.get("candidates") != candidates:
+            continue
+
+        repo_path = snapshot_path(CACHE_DIR, repo_id, sha)
+        variant_path = repo_path / "build" / variant
+        if not variant_path.exists():
+            # The snapshot was removed from the cache.
+            return None
+
+        if variant_locks is not None:
+            variant_lock = variant_locks.get(variant)
+            if variant_lock is None:
+                raise ValueError(f"No lock found for build variant: {variant}")
+            # The snapshot may have been modified since it was indexed, so
+            # it is always validated. The verification cache makes repeated
+            # validation of unchanged files cheap.
+            validate_kernel(
+                repo_path=repo_path, variant=variant, hash=variant_lock.hash
+            )
+            if entry.get("hash") != variant_lock.hash:
+                _index_variant(repo_id, variant_path, variant_locks)
+
+        return variant_path
+
+    return None
 
 
 def _find_kernel_in_repo_path(
@@ -249,42 +548,91 @@ def install_kernel_all_variants(
     local_files_only: bool = False,
     variant_locks: dict[str, VariantLock] | None = None,
 ) -> Path:
-    repo_path = Path(
-        snapshot_download(
-            repo_id,
-            allow_patterns="build/*",
-            cache_dir=CACHE_DIR,
-            revision=revision,
-            local_files_only=local_files_only,
-        )
-    )
+    with CacheLock(_install_lock_path(repo_id)):
+        with tracing.span(
+            "download", repo_id=repo_id, revision=revision
+        ) as download_span:
+            repo_path = Path(
+                snapshot_download(
+                    repo_id,
+                    allow_patterns="build/*",
+                    cache_dir=CACHE_DIR,
+                    revision=revision,
+                    local_files_only=local_files_only,
+                )
+            )
+            if download_span.enabled:
+                download_span.set(bytes=_tree_size(repo_path / "build"))
 
-    if variant_locks is not None:
-        for entry in (repo_path / "build").iterdir():
-            variant = entry.parts[-1]
+        if variant_locks is not None:
+            for entry in (repo_path / "build").iterdir():
+                variant = entry.parts[-1]
 
-            variant_lock = variant_locks.get(variant)
-            if variant_lock is None:
-                raise ValueError(f"No lock found for build variant: {variant}")
+                variant_lock = variant_locks.get(variant)
+                if variant_lock is None:
+                    raise ValueError(f"No lock found for build variant: {variant}")
 
-            validate_kernel(
-                repo_path=repo_path, variant=variant, hash=variant_lock.hash
-            )
+                validate_kernel(
+                    repo_path=repo_path, variant=variant, hash=variant_lock.hash
+                )
 
     return repo_path / "build"
 
 
+class LazyKernel(ModuleType):
+    """
+    Kernel module proxy that loads the kernel on first attribute access.
+
+    Instances are returned by [`get_kernel`] when `lazy=True`. Loading is
+    thread-safe: when multiple threads access the proxy before the kernel is
+    loaded, the kernel is loaded once.
+    """
+
+    def __init__(self, repo_id: str, load: Callable[[], ModuleType]):
+        super().__init__(package_name_from_repo_id(repo_id))
+        self._lazy_repo_id = repo_id
+        self._lazy_load = load
+        self._lazy_lock = threading.Lock()
+        self._lazy_module: ModuleType | None = None
+
+    def _load_kernel(self) -> ModuleType:
+        module = self._lazy_module
+        if module is not None:
+            return module
+
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                self._lazy_module = self._lazy_load()
+            return self._lazy_module
+
+    def __getattr__(self, name: str):
+        # Only called for attributes that are not set on the proxy itself.
+        if name.startswith("_lazy_"):
+            raise AttributeError(name)
+        return getattr(self._load_kernel(), name)
+
+    def __dir__(self):
+        return dir(self._load_kernel())
+
+    def __repr__(self) -> str:
+        if self._lazy_module is None:
+            return f"<lazy kernel '{self._lazy_repo_id}' (not loaded)>"
+        return f"<lazy kernel '{self._lazy_repo_id}' {self._lazy_module!r}>"
+
+
 def get_kernel(
     repo_id: str,
     revision: str | None = None,
     version: str | None = None,
     user_agent: str | dict | None = None,
+    lazy: bool = False,
 ) -> ModuleType:
     """
     Load a kernel from the kernel hub.
 
     This function downloads a kernel to the local Hugging Face Hub cache directory (if it was not downloaded before)
-    and then loads the kernel.
+    and then loads the kernel. A kernel is only imported once per process for a given commit, subsequent calls
+    return the module that was imported before (see [`invalidate_loaded_kernels`]).
 
     Args:
         repo_id (`str`):
@@ -296,6 +644,9 @@ def get_kernel(
             Cannot be used together with `revision`.
         user_agent (`Union[str, dict]`, *optional*):
             The `user_agent` info to pass to `snapshot_download()` for internal telemetry.
+        lazy (`bool`, *optional*, defaults to `False`):
+            Return a module proxy that only resolves, downloads, and imports the kernel on first
+            attribute access. This avoids the cost of loading kernels that end up unused.
 
     Returns:
         `ModuleType`: The imported kernel module.
@@ -311,11 +662,25 @@ def get_kernel(
         result = activation.silu_and_mul(out, x)
         ```
     """
-    revision = select_revision_or_version(repo_id, revision, version)
+    if lazy:
+        return LazyKernel(
+            repo_id,
+            lambda: get_kernel(
+                repo_id, revision=revision, version=version, user_agent=user_agent
+            ),
+        )
+
+    revision = _resolve_installed_revision(
+        repo_id, select_revision_or_version(repo_id, revision, version)
+    )
+    module = _get_registered_kernel(repo_id, revision)
+    if module is not None:
+        return module
+
     package_name, variant_path = install_kernel(
         repo_id, revision=revision, user_agent=user_agent
     )
-    return _import_from_path(package_name, variant_path)
+    return _import_registered_kernel(repo_id, package_name, variant_path)
 
 
 def get_local_kernel(repo_path: Path, package_name: str) -> ModuleType:
@@ -353,6 +718,9 @@ def has_kernel(
     """
     Check whether a kernel build exists for the current environment (Torch version and compute framework).
 
+    The build variants of a repository revision are retrieved with a single Hub request and cached in the
+    kernel cache (see the `KERNELS_METADATA_TTL` environment variable).
+
     Args:
         repo_id (`str`):
             The Hub repository containing the kernel.
@@ -366,20 +734,88 @@ def has_kernel(
         `bool`: `True` if a kernel is available for the current environment.
     """
     revision = select_revision_or_version(repo_id, revision, version)
+    loadable_variants = _get_loadable_variants(repo_id, revision)
+    return any(variant in loadable_variants for variant in build_variants())
+
+
+def has_kernels(
+    specs: Iterable[str | KernelSpec], *, max_workers: int | None = None
+) -> list[bool]:
+    """
+    Check whether kernel builds exist for the current environment for multiple kernels concurrently.
+
+    Args:
+        specs (`Iterable[Union[str, KernelSpec]]`):
+            The kernels to check. A string is interpreted as a repository ID, using the `main` revision.
+        max_workers (`int`, *optional*):
+            The maximum number of concurrent Hub requests. Uses the `ThreadPoolExecutor` default
+            when not provided.
+
+    Returns:
+        `list[bool]`: For each kernel in `specs`, whether it is available for the current environment.
+
+    Example:
+        ```python
+        from kernels import has_kernels
+
+        activation, layer_norm = has_kernels(
+            ["kernels-community/activation", "kernels-community/triton-layer-norm"]
+        )
+        ```
+    """
+    specs = [KernelSpec(spec) if isinstance(spec, str) else spec for spec in specs]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(
+            executor.map(
+                lambda spec: has_kernel(
+                    spec.repo_id, revision=spec.revision, version=spec.version
+                ),
+                specs,
+            )
+        )
+
+
+def _get_loadable_variants(repo_id: str, revision: str) -> set[str]:
+    """Get the build variants of a repository revision that contain a kernel module."""
+    cache_path = (
+        metadata_dir(CACHE_DIR)
+        / "trees"
+        / repo_id.replace("/", "--")
+        / f"{quote(revision, safe='')}.json"
+    )
+
+    entry = read_json(cache_path)
+    # Commits are immutable, so their trees never go stale.
+    if entry is not None and (
+        _is_commit_sha(revision) or time.time() - entry["time"] < metadata_ttl()
+    ):
+        return set(entry["variants"])
 
     package_name = package_name_from_repo_id(repo_id)
-    variant = build_variant()
+    try:
+        paths = {
+            entry.path
+            for entry in HfApi().list_repo_tree(
+                repo_id, path_in_repo="build", revision=revision, recursive=True
+            )
+        }
+    except GatedRepoError:
+        raise
+    except (EntryNotFoundError, RepositoryNotFoundError, RevisionNotFoundError):
+        # Cache negative results as well.
+        paths = set()
 
-    for variant in build_variants():
-        for init_file in ["__init__.py", f"{package_name}/__init__.py"]:
-            if file_exists(
-                repo_id,
-                revision=revision,
-                filename=f"build/{variant}/{init_file}",
-            ):
-                return True
+    loadable_variants = set()
+    for path in paths:
+        parts = path.split("/")
+        if len(parts) == 3 and parts[2] == "__init__.py":
+            loadable_variants.add(parts[1])
+        elif len(parts) == 4 and parts[2:] == [package_name, "__init__.py"]:
+            loadable_variants.add(parts[1])
+
+    write_json(cache_path, {"time": time.time(), "variants": sorted(loadable_variants)})
 
-    return False
+    return loadable_variants
 
 
 def load_kernel(repo_id: str, *, lockfile: Path | None) -> ModuleType:
@@ -400,32 +836,41 @@ def load_kernel(repo_id: str, *, lockfile: Path | None) -> ModuleType:
     if lockfile is None:
         locked_sha = _get_caller_locked_kernel(repo_id)
     else:
-        with open(lockfile, "r") as f:
-            locked_sha = _get_locked_kernel(repo_id, f.read())
+        locked_sha = _get_locked_kernel(repo_id, lockfile)
 
     if locked_sha is None:
         raise ValueError(
             f"Kernel `{repo_id}` is not locked. Please lock it with `kernels lock <project>` and then reinstall the project."
         )
 
+    module = _get_registered_kernel(repo_id, locked_sha)
+    if module is not None:
+        return module
+
     package_name = package_name_from_repo_id(repo_id)
 
+    variant_path = _get_indexed_variant(repo_id, locked_sha, variant_locks=None)
+    if variant_path is not None:
+        return _import_registered_kernel(repo_id, package_name, variant_path)
+
     allow_patterns = [f"build/{variant}/*" for variant in build_variants()]
-    repo_path = Path(
-        snapshot_download(
-            repo_id,
-            allow_patterns=allow_patterns,
-            cache_dir=CACHE_DIR,
-            revision=locked_sha,
-            local_files_only=True,
+    with tracing.span("download", repo_id=repo_id, revision=locked_sha):
+        repo_path = Path(
+            snapshot_download(
+                repo_id,
+                allow_patterns=allow_patterns,
+                cache_dir=CACHE_DIR,
+                revision=locked_sha,
+                local_files_only=True,
+            )
         )
-    )
 
     try:
         package_name, variant_path = _find_kernel_in_repo_path(
             repo_path, package_name, variant_locks=None
         )
-        return _import_from_path(package_name, variant_path)
+        _index_variant(repo_id, variant_path, variant_locks=None)
+        return _import_registered_kernel(repo_id, package_name, variant_path)
     except FileNotFoundError:
         raise FileNotFoundError(
             f"Locked kernel `{repo_id}` does not have applicable variant or was not downloaded with `kernels download <project>`"
@@ -450,60 +895,215 @@ def get_locked_kernel(repo_id: str, local_files_only: bool = False) -> ModuleTyp
     if locked_sha is None:
         raise ValueError(f"Kernel `{repo_id}` is not locked")
 
+    module = _get_registered_kernel(repo_id, locked_sha)
+    if module is not None:
+        return module
+
     package_name, variant_path = install_kernel(
         repo_id, locked_sha, local_files_only=local_files_only
     )
 
-    return _import_from_path(package_name, variant_path)
+    return _import_registered_kernel(repo_id, package_name, variant_path)
 
 
-def _get_caller_locked_kernel(repo_id: str) -> str | None:
-    for dist in _get_caller_distributions():
-        lock_json = dist.read_text("kernels.lock")
-        if lock_json is None:
-            continue
-        locked_sha = _get_locked_kernel(repo_id, lock_json)
-        if locked_sha is not None:
-            return locked_sha
+def _is_commit_sha(revision: str) -> bool:
+    return _COMMIT_SHA_REGEX.match(revision) is not None
+
+
+def _get_registered_kernel(repo_id: str, revision: str) -> ModuleType | None:
+    """Get an already-imported kernel for a revision if it is a commit SHA."""
+    # Branches and tags can move, so we can only look up commit SHAs without
+    # resolving the revision first.
+    if not _is_commit_sha(revision):
+        return None
+
+    for variant in build_variants():
+        module = _KERNEL_REGISTRY.get(
+            KernelKey(repo_id=repo_id, sha=revision, variant=variant)
+        )
+        if module is not None:
+            return module
+
     return None
 
 
-def _get_locked_kernel(repo_id: str, lock_json: str) -> str | None:
-    for kernel_lock_json in json.loads(lock_json):
-        kernel_lock = KernelLock.from_json(kernel_lock_json)
-        if kernel_lock.repo_id == repo_id:
+def _import_registered_kernel(
+    repo_id: str, package_name: str, variant_path: Path
+) -> ModuleType:
+    """Import a kernel from a snapshot, reusing the module if it was imported before."""
+    # Variant paths have the form <snapshot>/build/<variant>, where the
+    # snapshot directory is named after the commit SHA.
+    key = KernelKey(
+        repo_id=repo_id, sha=variant_path.parent.parent.name, variant=variant_path.name
+    )
+    _record_kernel_use(repo_id, variant_path)
+    return _KERNEL_REGISTRY.get_or_load(
+        key, lambda: _import_from_path(package_name, variant_path)
+    )
+
+
+# Kernel variants whose use was recorded by this process.
+_RECORDED_USES: set[tuple[str | None, str, str, str]] = set()
+
+
+def _record_kernel_use(repo_id: str, variant_path: Path):
+    """Record the use of a build variant for least-recently-used cache eviction."""
+    sha = variant_path.parent.parent.name
+    key = (CACHE_DIR, repo_id, sha, variant_path.name)
+    # Recording once per process is enough for eviction decisions.
+    if key in _RECORDED_USES:
+        return
+    _RECORDED_USES.add(key)
+    touch(usage_path(CACHE_DIR, repo_id, sha, variant_path.name))
+
+
+def _dedupe_variant(variant_path: Path):
+    """Hard link the blobs of a build variant to the content-addressed blob store."""
+    # Imported here, since the cache manager depends on this module.
+    from kernels.cache_manager import _link_to_blob_store
+
+    for dirpath, _, filenames in os.walk(variant_path):
+        for filename in filenames:
+            file_path = Path(dirpath) / filename
+            if file_path.is_symlink():
+                _link_to_blob_store(file_path.resolve())
+
+
+def _enforce_cache_budget(protect: set[tuple[str, str]]):
+    """Evict kernels when the cache exceeds `KERNELS_CACHE_MAX_SIZE`."""
+    if os.environ.get("KERNELS_CACHE_MAX_SIZE") is None:
+        return
+
+    # Imported here, since the cache manager depends on this module.
+    from kernels.cache_manager import prune_kernel_cache
+
+    # Kernels that were used by this process are never evicted.
+    protect = protect | {(repo_id, sha) for _, repo_id, sha, _ in _RECORDED_USES}
+    try:
+        prune_kernel_cache(protect=protect)
+    except Exception as e:
+        logging.warning(f"Cannot prune the kernel cache: {e}")
+
+
+def invalidate_loaded_kernels(repo_id: str | None = None) -> int:
+    """
+    Remove kernels from the process-wide registry of loaded kernels.
+
+    Kernels that are loaded with [`get_kernel`], [`get_locked_kernel`], or
+    [`load_kernel`] are stored in a registry, so that loading the same kernel
+    revision again returns the module that was imported before. After
+    invalidation, the next load of a kernel imports it again.
+
+    Args:
+        repo_id (`str`, *optional*):
+            Only invalidate kernels from this Hub repository. All kernels are
+            invalidated when not provided.
+
+    Returns:
+        `int`: The number of kernels that were removed from the registry.
+    """
+    return _KERNEL_REGISTRY.invalidate(repo_id=repo_id)
+
+
+def loaded_kernels_stats() -> KernelRegistryStats:
+    """
+    Get the hit/miss statistics of the process-wide registry of loaded kernels.
+
+    Returns:
+        `KernelRegistryStats`: The number of registry hits, misses, and loaded kernels.
+    """
+    return _KERNEL_REGISTRY.stats()
+
+
+def _get_caller_locked_kernel(repo_id: str) -> str | None:
+    return _get_package_locked_kernel(repo_id, _get_caller_package())
+
+
+def _get_package_locked_kernel(repo_id: str, package: str | None) -> str | None:
+    if package is None:
+        return None
+
+    for lockfile_index in _DISTRIBUTION_LOCKS.get(package):
+        kernel_lock = lockfile_index.get(repo_id)
+        if kernel_lock is not None:
             return kernel_lock.sha
     return None
 
 
-def _get_caller_distributions() -> list[Distribution]:
-    module = _get_caller_module()
-    if module is None:
-        return []
+def _get_locked_kernel(repo_id: str, lockfile: Path) -> str | None:
+    kernel_lock = LockfileIndex.load(lockfile).get(repo_id)
+    return None if kernel_lock is None else kernel_lock.sha
 
-    # Look up all possible distributions that this module could be from.
-    package = module.__name__.split(".")[0]
-    dist_names = importlib.metadata.packages_distributions().get(package)
-    if dist_names is None:
-        return []
 
-    return [importlib.metadata.distribution(dist_name) for dist_name in dist_names]
+class _DistributionLocks:
+    """
+    Index from top-level packages to the kernel locks of their distributions.
 
+    Finding the distributions of a package requires scanning all installed
+    distributions, so the index is built once and only rebuilt when
+    `sys.path` changes.
+    """
 
-def _get_caller_module() -> ModuleType | None:
-    stack = inspect.stack()
-    # Get first module in the stack that is not the current module.
-    first_module = inspect.getmodule(stack[0][0])
-    for frame in stack[1:]:
-        module = inspect.getmodule(frame[0])
-        if module is not None and module != first_module:
-            return module
-    return first_module
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sys_path: list[str] | None = None
+        self._package_distributions: dict[str, list[str]] = {}
+        self._package_locks: dict[str, list[LockfileIndex]] = {}
+
+    def get(self, package: str) -> list[LockfileIndex]:
+        """Get the kernel locks of all distributions that provide `package`."""
+        with self._lock:
+            if self._sys_path != sys.path:
+                self._sys_path = list(sys.path)
+                self._package_distributions = dict(
+                    importlib.metadata.packages_distributions()
+                )
+                self._package_locks = {}
+
+            package_locks = self._package_locks.get(package)
+            if package_locks is None:
+                package_locks = []
+                for dist_name in self._package_distributions.get(package, []):
+                    lock_json = importlib.metadata.distribution(dist_name).read_text(
+                        "kernels.lock"
+                    )
+                    if lock_json is not None:
+                        package_locks.append(LockfileIndex.from_json(lock_json))
+                self._package_locks[package] = package_locks
+
+            return package_locks
+
+
+_DISTRIBUTION_LOCKS = _DistributionLocks()
+
+
+def _get_caller_package() -> str | None:
+    """Get the top-level package of the first caller outside `kernels`."""
+    # Walk the frames directly, inspect.stack() is slow because it gets
+    # the source context of every frame.
+    frame: FrameType | None = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__")
+        if module is not None:
+            package = module.split(".")[0]
+            if package != "kernels":
+                return package
+        frame = frame.f_back
+    return None
+
+
+# Maximum number of build variant verifications that are remembered.
+_MAX_VERIFICATION_ENTRIES = 1024
 
 
 def validate_kernel(*, repo_path: Path, variant: str, hash: str):
-    """Validate the given build variant of a kernel against a hasht."""
+    """Validate the given build variant of a kernel against a hash."""
     variant_path = repo_path / "build" / variant
+    with tracing.span("validate_kernel", **_trace_fields(variant_path)) as span:
+        _validate_kernel(variant_path, hash, span)
+
+
+def _validate_kernel(variant_path: Path, hash: str, span: tracing._Span):
 
     # Get the file paths. The first element is a byte-encoded relative path
     # used for sorting. The second element is the absolute path.
@@ -523,20 +1123,28 @@ def validate_kernel(*, repo_path: Path, variant: str, hash: str):
                     )
                 )
 
-    m = hashlib.sha256()
+    files.sort()
 
-    for filename_bytes, full_path in sorted(files):
-        m.update(filename_bytes)
+    # Skip hashing when the same blobs were verified against the same hash
+    # before. Blobs are identified by their path and file metadata.
+    blob_stats = [_blob_stat(full_path) for _, full_path in files]
+    if span.enabled:
+        span.set(bytes=sum(blob_stat[1] for blob_stat in blob_stats))
+    cache_path = _verification_cache_path(variant_path)
+    cache_entry = read_json(cache_path)
+    if (
+        cache_entry is not None
+        and cache_entry.get("hash") == hash
+        and cache_entry.get("blobs") == blob_stats
+    ):
+        return
 
-        blob_filename = full_path.resolve().name
-        if len(blob_filename) == 40:
-            # SHA-1 hashed, so a Git blob.
-            m.update(git_hash_object(full_path.read_bytes()))
-        elif len(blob_filename) == 64:
-            # SHA-256 hashed, so a Git LFS blob.
-            m.update(hashlib.sha256(full_path.read_bytes()).digest())
-        else:
-            raise ValueError(f"Unexpected blob filename length: {len(blob_filename)}")
+    digests = hash_blobs([full_path for _, full_path in files])
+
+    m = hashlib.sha256()
+    for (filename_bytes, _), digest in zip(files, digests):
+        m.update(filename_bytes)
+        m.update(digest)
 
     computedHash = f"sha256-{m.hexdigest()}"
     if computedHash != hash:
@@ -544,6 +1152,51 @@ def validate_kernel(*, repo_path: Path, variant: str, hash: str):
             f"Lock file specifies kernel with hash {hash}, but downloaded kernel has hash: {computedHash}"
         )
 
+    write_json(cache_path, {"hash": hash, "blobs": blob_stats})
+    _prune_verification_cache(cache_path.parent)
+
+
+def _prune_verification_cache(cache_dir: Path):
+    """Remove verification entries of removed kernels and cap the number of entries."""
+    try:
+        entry_paths = list(cache_dir.glob("*.json"))
+    except OSError:
+        return
+
+    if len(entry_paths) <= _MAX_VERIFICATION_ENTRIES:
+        return
+
+    live_entries = []
+    for entry_path in entry_paths:
+        entry = read_json(entry_path)
+        blobs = [] if entry is None else entry.get("blobs", [])
+        try:
+            if all(os.path.exists(blob[0]) for blob in blobs) and blobs:
+                live_entries.append((entry_path.stat().st_mtime, entry_path))
+                continue
+            entry_path.unlink()
+        except OSError:
+            pass
+
+    # Remove the least recently verified entries when there are still too many.
+    live_entries.sort()
+    for _, entry_path in live_entries[: len(live_entries) - _MAX_VERIFICATION_ENTRIES]:
+        try:
+            entry_path.unlink()
+        except OSError:
+            pass
+
+
+def _blob_stat(path: Path) -> list:
+    blob_path = path.resolve()
+    stat = blob_path.stat()
+    return [str(blob_path), stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def _verification_cache_path(variant_path: Path) -> Path:
+    key = hashlib.sha256(str(variant_path.resolve()).encode("utf-8")).hexdigest()
+    return metadata_dir(CACHE_DIR) / "verified" / f"{key}.json"
+
 
 def git_hash_object(data: bytes, object_type: str = "blob"):
     """Calculate git SHA1 of data."""
@@ -1,9 +1,12 @@
+import hashlib
 import sys
+from dataclasses import dataclass
+from pathlib import Path
 
 import pytest
 import torch
 
-from kernels.utils import _get_privateuse_backend_name
+from kernels.utils import _get_privateuse_backend_name, git_hash_object
 
 has_cuda = (
     hasattr(torch.version, "cuda")
@@ -43,6 +46,64 @@ def device():
     return "cpu"
 
 
+@dataclass
+class FakeKernel:
+    repo_id: str
+    sha: str
+    variant: str
+    hash: str
+    cache_dir: Path
+    snapshot_path: Path
+
+
+def create_fake_kernel(
+    cache_dir: Path,
+    *,
+    repo_id: str = "kernels-test/fake",
+    sha: str = "0123456789abcdef0123456789abcdef01234567",
+    variant: str = "torch-universal",
+    files: dict[str, str] | None = None,
+) -> FakeKernel:
+    """Create a kernel in the Hub cache layout, without using the network."""
+    if files is None:
+        files = {"__init__.py": "def version():\n    return '0.1.0'\n"}
+
+    repo_path = cache_dir / f"models--{repo_id.replace('/', '--')}"
+    blobs_path = repo_path / "blobs"
+    blobs_path.mkdir(parents=True, exist_ok=True)
+    snapshot_path = repo_path / "snapshots" / sha
+    (repo_path / "refs").mkdir(parents=True, exist_ok=True)
+    (repo_path / "refs" / "main").write_text(sha)
+
+    m = hashlib.sha256()
+    for filename, content in sorted(files.items()):
+        data = content.encode("utf-8")
+        blob_id = git_hash_object(data).hex()
+        (blobs_path / blob_id).write_bytes(data)
+
+        file_path = snapshot_path / "build" / variant / filename
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.symlink_to(blobs_path / blob_id)
+
+        m.update(filename.encode("utf-8"))
+        m.update(bytes.fromhex(blob_id))
+
+    return FakeKernel(
+        repo_id=repo_id,
+        sha=sha,
+        variant=variant,
+        hash=f"sha256-{m.hexdigest()}",
+        cache_dir=cache_dir,
+        snapshot_path=snapshot_path,
+    )
+
+
+@pytest.fixture
+def fake_kernel(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+    return create_fake_kernel(tmp_path)
+
+
 def pytest_runtest_setup(item):
     if "cuda_only" in item.keywords and not has_cuda:
         pytest.skip("skipping CUDA-only test on host without CUDA")
@@ -0,0 +1,56 @@
+import asyncio
+
+import torch.nn as nn
+
+import kernels.aio
+from kernels import (
+    Mode,
+    aget_kernel,
+    akernelize,
+    invalidate_loaded_kernels,
+    use_kernel_forward_from_hub,
+    use_kernel_mapping,
+)
+from kernels.utils import get_kernel, install_kernel
+
+
+def test_aget_kernel_shares_load(fake_kernel, monkeypatch):
+    # Add the kernel to the index, so that it can be loaded without network.
+    install_kernel(fake_kernel.repo_id, fake_kernel.sha, local_files_only=True)
+    invalidate_loaded_kernels()
+
+    n_calls = 0
+
+    def counting_get_kernel(*args, **kwargs):
+        nonlocal n_calls
+        n_calls += 1
+        return get_kernel(*args, **kwargs)
+
+    monkeypatch.setattr(kernels.aio, "get_kernel", counting_get_kernel)
+
+    async def load():
+        return await asyncio.gather(
+            aget_kernel(fake_kernel.repo_id, revision=fake_kernel.sha),
+            aget_kernel(fake_kernel.repo_id, revision=fake_kernel.sha),
+        )
+
+    kernel1, kernel2 = asyncio.run(load())
+    assert kernel1 is kernel2
+    assert kernel1.version() == "0.1.0"
+    assert n_calls == 1
+
+    invalidate_loaded_kernels()
+
+
+def test_akernelize_uses_context_mapping():
+    @use_kernel_forward_from_hub("AsyncIdentity")
+    class Identity(nn.Module):
+        def forward(self, x):
+            return x
+
+    async def run():
+        with use_kernel_mapping({"AsyncIdentity": {}}, inherit_mapping=False):
+            return await akernelize(Identity(), mode=Mode.INFERENCE, device="cpu")
+
+    model = asyncio.run(run())
+    assert model(42) == 42
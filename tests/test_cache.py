@@ -0,0 +1,821 @@
+import io
+import json
+import os
+import stat
+import sys
+import tarfile
+import threading
+import time
+from dataclasses import dataclass
+
+import pytest
+from conftest import create_fake_kernel
+from filelock import SoftFileLock
+from huggingface_hub.errors import EntryNotFoundError
+from huggingface_hub.hf_api import GitRefInfo, GitRefs
+
+from kernels import (
+    KernelSpec,
+    has_kernel,
+    has_kernels,
+    prefetch_kernels,
+    use_environment,
+)
+from kernels import _versions
+from kernels._bytecode import _CachedBytecodeLoader, bytecode_dir
+from kernels._cache import CacheLock, read_json, usage_path, write_json
+from kernels.cache_manager import (
+    dedupe_kernel_cache,
+    parse_size,
+    prune_kernel_cache,
+    scan_kernel_cache,
+)
+from kernels._versions import select_revision_or_version
+from kernels.bundle import export_bundle, import_bundle
+from kernels.lockfile import KernelLock, VariantLock
+from kernels.utils import (
+    _import_from_path,
+    _index_variant,
+    _install_lock_path,
+    _record_installed_revision,
+    _verification_cache_path,
+    build_variants,
+    install_kernel,
+    validate_kernel,
+)
+
+
+def _no_snapshot_download(*args, **kwargs):
+    raise AssertionError("snapshot_download should not be called")
+
+
+def test_commit_fast_path(fake_kernel, monkeypatch):
+    _, variant_path = install_kernel(
+        fake_kernel.repo_id, fake_kernel.sha, local_files_only=True
+    )
+    assert variant_path == fake_kernel.snapshot_path / "build" / fake_kernel.variant
+
+    monkeypatch.setattr("kernels.utils.snapshot_download", _no_snapshot_download)
+
+    _, indexed_path = install_kernel(fake_kernel.repo_id, fake_kernel.sha)
+    assert indexed_path == variant_path
+
+    # Validation against a lock still happens on the fast path.
+    variant_locks = {fake_kernel.variant: VariantLock(hash=fake_kernel.hash)}
+    _, indexed_path = install_kernel(
+        fake_kernel.repo_id, fake_kernel.sha, variant_locks=variant_locks
+    )
+    assert indexed_path == variant_path
+
+    with pytest.raises(ValueError, match="Lock file specifies kernel with hash"):
+        install_kernel(
+            fake_kernel.repo_id,
+            fake_kernel.sha,
+            variant_locks={fake_kernel.variant: VariantLock(hash="sha256-00")},
+        )
+
+
+def test_commit_fast_path_validates_modified_snapshot(fake_kernel, monkeypatch):
+    variant_locks = {fake_kernel.variant: VariantLock(hash=fake_kernel.hash)}
+    install_kernel(
+        fake_kernel.repo_id,
+        fake_kernel.sha,
+        local_files_only=True,
+        variant_locks=variant_locks,
+    )
+
+    # Modify a file of the indexed and locked variant.
+    init_path = (
+        fake_kernel.snapshot_path / "build" / fake_kernel.variant / "__init__.py"
+    )
+    init_path.resolve().write_text("def version():\n    return '6.6.6'\n")
+
+    monkeypatch.setattr("kernels.utils.snapshot_download", _no_snapshot_download)
+    with pytest.raises(ValueError, match="Lock file specifies kernel with hash"):
+        install_kernel(
+            fake_kernel.repo_id, fake_kernel.sha, variant_locks=variant_locks
+        )
+
+
+def test_commit_fast_path_removed_snapshot(fake_kernel, monkeypatch):
+    install_kernel(fake_kernel.repo_id, fake_kernel.sha, local_files_only=True)
+
+    for path in sorted(fake_kernel.snapshot_path.rglob("*"), reverse=True):
+        path.unlink() if not path.is_dir() else path.rmdir()
+
+    def snapshot_download(*args, **kwargs):
+        raise FileNotFoundError("not in cache")
+
+    # A removed snapshot must not be served from the index.
+    monkeypatch.setattr("kernels.utils.snapshot_download", snapshot_download)
+    with pytest.raises(FileNotFoundError, match="not in cache"):
+        install_kernel(fake_kernel.repo_id, fake_kernel.sha)
+
+
+def test_prefetch_kernels(fake_kernel, tmp_path):
+    other_kernel = create_fake_kernel(tmp_path, repo_id="kernels-test/other")
+    lock = KernelLock(
+        repo_id=fake_kernel.repo_id,
+        sha=fake_kernel.sha,
+        variants={fake_kernel.variant: VariantLock(hash=fake_kernel.hash)},
+    )
+
+    results = prefetch_kernels(
+        [
+            lock,
+            KernelSpec(repo_id=other_kernel.repo_id, revision=other_kernel.sha),
+            # Duplicate, should only be prefetched once.
+            KernelSpec(repo_id=other_kernel.repo_id, revision=other_kernel.sha),
+            KernelSpec(repo_id="kernels-test/non-existing", revision=other_kernel.sha),
+        ],
+        max_workers=4,
+        local_files_only=True,
+    )
+
+    assert [result.repo_id for result in results] == [
+        fake_kernel.repo_id,
+        other_kernel.repo_id,
+        "kernels-test/non-existing",
+    ]
+    assert results[0].ok
+    assert results[0].path == fake_kernel.snapshot_path / "build" / "torch-universal"
+    assert results[1].ok
+    assert results[1].revision == other_kernel.sha
+    assert not results[2].ok
+    assert results[2].path is None
+    assert all(result.duration >= 0 for result in results)
+
+
+def test_validate_kernel(fake_kernel, monkeypatch):
+    validate_kernel(
+        repo_path=fake_kernel.snapshot_path,
+        variant=fake_kernel.variant,
+        hash=fake_kernel.hash,
+    )
+
+    with pytest.raises(ValueError, match="Lock file specifies kernel with hash"):
+        validate_kernel(
+            repo_path=fake_kernel.snapshot_path,
+            variant=fake_kernel.variant,
+            hash="sha256-00",
+        )
+
+
+def test_prefetch_kernels_prefers_locks(fake_kernel):
+    bad_lock = KernelLock(
+        repo_id=fake_kernel.repo_id,
+        sha=fake_kernel.sha,
+        variants={fake_kernel.variant: VariantLock(hash="sha256-invalid")},
+    )
+
+    # The lock is used even though an unlocked spec for the same revision
+    # comes first.
+    (result,) = prefetch_kernels(
+        [KernelSpec(repo_id=fake_kernel.repo_id, revision=fake_kernel.sha), bad_lock],
+        local_files_only=True,
+    )
+    assert isinstance(result.error, ValueError)
+
+
+def test_validate_kernel_large_files(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+    data = "x" * (3 << 20)
+    kernel = create_fake_kernel(
+        tmp_path, files={"__init__.py": "", "ops/_ops.py": data, "ops/empty.py": ""}
+    )
+    validate_kernel(
+        repo_path=kernel.snapshot_path, variant=kernel.variant, hash=kernel.hash
+    )
+
+
+def test_validate_kernel_prunes_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("kernels.utils._MAX_VERIFICATION_ENTRIES", 2)
+
+    kernels = [
+        create_fake_kernel(tmp_path, repo_id=f"kernels-test/kernel-{i}")
+        for i in range(4)
+    ]
+    for kernel in kernels:
+        validate_kernel(
+            repo_path=kernel.snapshot_path, variant=kernel.variant, hash=kernel.hash
+        )
+
+    verified = {path.name for path in (tmp_path / ".kernels" / "verified").iterdir()}
+    assert verified == {
+        _verification_cache_path(kernel.snapshot_path / "build" / kernel.variant).name
+        for kernel in kernels[-2:]
+    }
+
+
+def test_validate_kernel_is_memoized(fake_kernel, monkeypatch):
+    validate_kernel(
+        repo_path=fake_kernel.snapshot_path,
+        variant=fake_kernel.variant,
+        hash=fake_kernel.hash,
+    )
+
+    def hash_blobs(*args, **kwargs):
+        raise AssertionError("verified blobs should not be hashed again")
+
+    with monkeypatch.context() as m:
+        m.setattr("kernels.utils.hash_blobs", hash_blobs)
+        validate_kernel(
+            repo_path=fake_kernel.snapshot_path,
+            variant=fake_kernel.variant,
+            hash=fake_kernel.hash,
+        )
+
+    # Changing a blob invalidates the verification.
+    init_path = (
+        fake_kernel.snapshot_path / "build" / fake_kernel.variant / "__init__.py"
+    )
+    init_path.resolve().write_text("def version():\n    return '0.2.0.dev0'\n")
+    with pytest.raises(ValueError, match="Lock file specifies kernel with hash"):
+        validate_kernel(
+            repo_path=fake_kernel.snapshot_path,
+            variant=fake_kernel.variant,
+            hash=fake_kernel.hash,
+        )
+
+
+class FakeHfApi:
+    trees: dict = {}
+    n_calls = 0
+
+    def list_repo_tree(self, repo_id, path_in_repo, revision, recursive):
+        FakeHfApi.n_calls += 1
+        tree = FakeHfApi.trees.get(repo_id)
+        if tree is None:
+            raise EntryNotFoundError("Entry not found")
+        return [RepoPath(path) for path in tree]
+
+
+@dataclass
+class RepoPath:
+    path: str
+
+
+def test_has_kernel_tree_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("kernels.utils.HfApi", FakeHfApi)
+    FakeHfApi.n_calls = 0
+    FakeHfApi.trees = {
+        "kernels-test/universal": [
+            "build/torch-universal/__init__.py",
+            "build/torch-universal/_ops.py",
+        ],
+        "kernels-test/compat-layout": [
+            "build/torch-universal/compat_layout/__init__.py",
+        ],
+        "kernels-test/other-backend": [
+            "build/torch-other/__init__.py",
+        ],
+    }
+
+    assert has_kernel("kernels-test/universal")
+    assert has_kernel("kernels-test/compat-layout")
+    assert not has_kernel("kernels-test/other-backend")
+    assert not has_kernel("kernels-test/non-existing")
+    assert FakeHfApi.n_calls == 4
+
+    # Positive and negative results are served from the cache.
+    assert has_kernels(
+        [
+            "kernels-test/universal",
+            KernelSpec("kernels-test/compat-layout"),
+            "kernels-test/other-backend",
+            "kernels-test/non-existing",
+        ],
+        max_workers=4,
+    ) == [True, True, False, False]
+    assert FakeHfApi.n_calls == 4
+
+    # Expired entries are fetched again.
+    monkeypatch.setenv("KERNELS_METADATA_TTL", "0")
+    assert has_kernel("kernels-test/universal")
+    assert FakeHfApi.n_calls == 5
+
+
+class FakeRefsApi:
+    tags: list = []
+    n_calls = 0
+
+    def list_repo_refs(self, repo_id):
+        FakeRefsApi.n_calls += 1
+        return GitRefs(branches=[], converts=[], tags=list(FakeRefsApi.tags))
+
+
+def _tag(version: str, commit: str) -> GitRefInfo:
+    return GitRefInfo(
+        name=f"v{version}", ref=f"refs/tags/v{version}", target_commit=commit
+    )
+
+
+def test_version_refs_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("kernels._versions.HfApi", FakeRefsApi)
+    FakeRefsApi.n_calls = 0
+    FakeRefsApi.tags = [_tag("0.1.0", "a" * 40), _tag("0.2.0", "b" * 40)]
+
+    repo_id = "kernels-test/versions"
+    assert select_revision_or_version(repo_id, None, "<1") == "b" * 40
+    assert select_revision_or_version(repo_id, None, "<0.2") == "a" * 40
+    assert FakeRefsApi.n_calls == 1
+
+    # Stale refs are used, but refreshed in the background.
+    FakeRefsApi.tags.append(_tag("0.3.0", "c" * 40))
+    monkeypatch.setenv("KERNELS_METADATA_TTL", "0")
+    assert select_revision_or_version(repo_id, None, "<1") == "b" * 40
+    deadline = time.monotonic() + 10
+    while _versions._REVALIDATING and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert FakeRefsApi.n_calls == 2
+
+    # Offline, versions are resolved from the cached refs alone.
+    monkeypatch.setattr("huggingface_hub.constants.HF_HUB_OFFLINE", True)
+    assert select_revision_or_version(repo_id, None, "<1") == "c" * 40
+    assert FakeRefsApi.n_calls == 2
+
+
+@pytest.mark.parametrize("branch", [False, True])
+def test_install_lock_single_flight(fake_kernel, monkeypatch, branch):
+    revision = "main" if branch else fake_kernel.sha
+    lock_path = _install_lock_path(fake_kernel.repo_id)
+    result = {}
+
+    def install():
+        result["variant_path"] = install_kernel(
+            fake_kernel.repo_id, revision, local_files_only=True
+        )[1]
+
+    with CacheLock(lock_path) as lock:
+        assert lock.is_locked
+
+        # Another installer waits for the lock.
+        thread = threading.Thread(target=install)
+        thread.start()
+        thread.join(timeout=0.2)
+        assert thread.is_alive()
+
+        # Install the kernel, like the process holding the lock would.
+        variant_path = fake_kernel.snapshot_path / "build" / fake_kernel.variant
+        _index_variant(fake_kernel.repo_id, variant_path, variant_locks=None)
+        if branch:
+            _record_installed_revision(fake_kernel.repo_id, revision, fake_kernel.sha)
+        monkeypatch.setattr("kernels.utils.snapshot_download", _no_snapshot_download)
+
+    # The waiting installer reuses the installed variant.
+    thread.join(timeout=10)
+    assert result["variant_path"] == variant_path
+
+
+def test_install_lock_soft_fallback(fake_kernel, monkeypatch):
+    monkeypatch.setattr("kernels._cache._filesystem_type", lambda path: "nfs")
+
+    lock_path = _install_lock_path(fake_kernel.repo_id)
+    with CacheLock(lock_path) as lock:
+        assert isinstance(lock._lock, SoftFileLock)
+        # Waiters only wait briefly for a soft lock.
+        with CacheLock(lock_path, timeout=0.1) as waiter:
+            assert not waiter.is_locked
+
+    _, variant_path = install_kernel(
+        fake_kernel.repo_id, fake_kernel.sha, local_files_only=True
+    )
+    assert variant_path == fake_kernel.snapshot_path / "build" / fake_kernel.variant
+
+
+def test_install_lock_unsupported(fake_kernel, monkeypatch):
+    class UnsupportedFileLock:
+        def __init__(self, *args, **kwargs):
+            raise NotImplementedError("use SoftFileLock instead")
+
+    class ReadOnlySoftFileLock(SoftFileLock):
+        def acquire(self, *args, **kwargs):
+            raise PermissionError("Read-only file system")
+
+    lock_path = _install_lock_path(fake_kernel.repo_id)
+    monkeypatch.setattr("kernels._cache.FileLock", UnsupportedFileLock)
+    with CacheLock(lock_path) as lock:
+        assert isinstance(lock._lock, SoftFileLock)
+
+    # Without any working lock, installation continues uncoordinated.
+    monkeypatch.setattr("kernels._cache.SoftFileLock", ReadOnlySoftFileLock)
+    with CacheLock(lock_path) as lock:
+        assert not lock.is_locked
+
+    _, variant_path = install_kernel(
+        fake_kernel.repo_id, fake_kernel.sha, local_files_only=True
+    )
+    assert variant_path == fake_kernel.snapshot_path / "build" / fake_kernel.variant
+
+
+def test_write_json_permissions(tmp_path):
+    path = tmp_path / "entry.json"
+    write_json(path, {"key": "value"})
+    assert read_json(path) == {"key": "value"}
+
+    # Permissions are the same as for other files created by the process.
+    reference_path = tmp_path / "reference.json"
+    reference_path.write_text("{}")
+    assert stat.S_IMODE(path.stat().st_mode) == stat.S_IMODE(
+        reference_path.stat().st_mode
+    )
+
+
+def test_prune_kernel_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+
+    # Kernels with equal sizes, each with a distinct blob.
+    fake_kernels = [
+        create_fake_kernel(
+            tmp_path,
+            repo_id=f"kernels-test/kernel-{i}",
+            files={"__init__.py": f"def version():\n    return '0.{i}.0'\n"},
+        )
+        for i in range(4)
+    ]
+    for i, kernel in enumerate(fake_kernels):
+        install_kernel(kernel.repo_id, kernel.sha, local_files_only=True)
+        # Make the use order explicit.
+        used = time.time() + 60 * (i + 1)
+        os.utime(
+            usage_path(str(tmp_path), kernel.repo_id, kernel.sha, kernel.variant),
+            (used, used),
+        )
+
+    cache_info = scan_kernel_cache()
+    assert [kernel.repo_id for kernel in cache_info.kernels] == [
+        kernel.repo_id for kernel in fake_kernels
+    ]
+    kernel_size = cache_info.kernels[0].size_on_disk
+    assert cache_info.size_on_disk == 4 * kernel_size
+
+    # The least recently used kernel is pinned by a lockfile.
+    lockfile = tmp_path / "kernels.lock"
+    lockfile.write_text(
+        json.dumps(
+            [
+                {
+                    "repo_id": fake_kernels[0].repo_id,
+                    "sha": fake_kernels[0].sha,
+                    "variants": {},
+                }
+            ]
+        )
+    )
+
+    evicted = prune_kernel_cache(2 * kernel_size, lockfiles=[lockfile], dry_run=True)
+    assert [kernel.repo_id for kernel in evicted] == [
+        fake_kernels[1].repo_id,
+        fake_kernels[2].repo_id,
+    ]
+    assert len(scan_kernel_cache().kernels) == 4
+
+    monkeypatch.setenv("KERNELS_CACHE_MAX_SIZE", str(2 * kernel_size))
+    evicted = prune_kernel_cache(lockfiles=[lockfile])
+    assert [kernel.repo_id for kernel in evicted] == [
+        fake_kernels[1].repo_id,
+        fake_kernels[2].repo_id,
+    ]
+    assert [kernel.repo_id for kernel in scan_kernel_cache().kernels] == [
+        fake_kernels[0].repo_id,
+        fake_kernels[3].repo_id,
+    ]
+    assert not fake_kernels[1].snapshot_path.exists()
+
+    # Evicted kernels are not used from the index.
+    with pytest.raises(Exception):
+        install_kernel(
+            fake_kernels[1].repo_id, fake_kernels[1].sha, local_files_only=True
+        )
+
+
+def test_prune_kernel_cache_skips_installing_repos(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+
+    fake_kernels = [
+        create_fake_kernel(
+            tmp_path,
+            repo_id=f"kernels-test/kernel-{i}",
+            files={"__init__.py": f"def version():\n    return '0.{i}.0'\n"},
+        )
+        for i in range(3)
+    ]
+    for i, kernel in enumerate(fake_kernels):
+        install_kernel(kernel.repo_id, kernel.sha, local_files_only=True)
+        used = time.time() + 60 * (i + 1)
+        os.utime(
+            usage_path(str(tmp_path), kernel.repo_id, kernel.sha, kernel.variant),
+            (used, used),
+        )
+    kernel_size = scan_kernel_cache().kernels[0].size_on_disk
+
+    # The least recently used kernel is being installed by another process.
+    with CacheLock(_install_lock_path(fake_kernels[0].repo_id)) as lock:
+        assert lock.is_locked
+        evicted = prune_kernel_cache(2 * kernel_size)
+
+    assert [kernel.repo_id for kernel in evicted] == [fake_kernels[1].repo_id]
+    assert fake_kernels[0].snapshot_path.exists()
+    assert not fake_kernels[1].snapshot_path.exists()
+
+
+def test_parse_size():
+    assert parse_size("512") == 512
+    assert parse_size("1.5KB") == 1536
+    assert parse_size("10G") == 10 << 30
+    assert parse_size("2 GiB") == 2 << 30
+    with pytest.raises(ValueError):
+        parse_size("ten gigabytes")
+
+
+def test_install_kernel_downloads_best_variant(fake_kernel, monkeypatch):
+    monkeypatch.setattr("kernels.utils.HfApi", FakeHfApi)
+    noarch_variant = build_variants()[1]
+    create_fake_kernel(fake_kernel.cache_dir, variant=noarch_variant)
+    FakeHfApi.trees = {
+        fake_kernel.repo_id: [
+            f"build/{noarch_variant}/__init__.py",
+            "build/torch-universal/__init__.py",
+        ]
+    }
+
+    downloaded_patterns = []
+
+    def snapshot_download(repo_id, *, allow_patterns: list[str], **kwargs):
+        downloaded_patterns.extend(allow_patterns)
+        return str(fake_kernel.snapshot_path)
+
+    monkeypatch.setattr("kernels.utils.snapshot_download", snapshot_download)
+
+    # Only the best build variant of the repository is downloaded.
+    install_kernel(fake_kernel.repo_id, "main")
+    assert downloaded_patterns == [f"build/{noarch_variant}/*"]
+
+
+def test_install_kernel_outdated_tree(fake_kernel, monkeypatch):
+    monkeypatch.setattr("kernels.utils.HfApi", FakeHfApi)
+    noarch_variant = build_variants()[1]
+    # The cached tree lists a variant that was removed from the branch.
+    FakeHfApi.trees = {fake_kernel.repo_id: [f"build/{noarch_variant}/__init__.py"]}
+
+    downloaded_patterns = []
+
+    def snapshot_download(repo_id, *, allow_patterns: list[str], **kwargs):
+        downloaded_patterns.append(allow_patterns)
+        return str(fake_kernel.snapshot_path)
+
+    monkeypatch.setattr("kernels.utils.snapshot_download", snapshot_download)
+
+    # The installation falls back to downloading all candidate variants.
+    _, variant_path = install_kernel(fake_kernel.repo_id, "main")
+    assert variant_path == fake_kernel.snapshot_path / "build" / fake_kernel.variant
+    assert downloaded_patterns == [
+        [f"build/{noarch_variant}/*"],
+        [f"build/{variant}/*" for variant in build_variants()],
+    ]
+
+
+def test_prefetch_kernels_for_target(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+    # A CUDA-only kernel can be prefetched on a host without CUDA.
+    kernel = create_fake_kernel(tmp_path, variant="torch-cuda")
+    lock = KernelLock(
+        repo_id=kernel.repo_id,
+        sha=kernel.sha,
+        variants={kernel.variant: VariantLock(hash=kernel.hash)},
+    )
+    target = "torch28-cxx11-cu128-x86_64-linux"
+
+    (result,) = prefetch_kernels([lock], targets=[target], local_files_only=True)
+    assert result.ok
+    assert result.target == target
+    assert result.path == kernel.snapshot_path / "build" / "torch-cuda"
+
+    # Loading in the target environment uses the prefetched variant.
+    monkeypatch.setattr("kernels.utils.snapshot_download", _no_snapshot_download)
+    with use_environment(target):
+        _, variant_path = install_kernel(kernel.repo_id, kernel.sha)
+    assert variant_path == result.path
+
+    with pytest.raises(ValueError, match="Invalid build variant"):
+        prefetch_kernels([lock], targets=["torch-cuda"])
+
+
+def test_bundle_export_import(tmp_path, monkeypatch):
+    source_dir = tmp_path / "source"
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(source_dir))
+    kernel = create_fake_kernel(
+        source_dir,
+        files={
+            "__init__.py": "from .ops import version\n",
+            "ops.py": "def version():\n    return '0.1.0'\n",
+        },
+    )
+    lock = KernelLock(
+        repo_id=kernel.repo_id,
+        sha=kernel.sha,
+        variants={kernel.variant: VariantLock(hash=kernel.hash)},
+    )
+
+    bundle_path = tmp_path / "kernels.tar"
+    (bundled,) = export_bundle([lock], bundle_path, local_files_only=True)
+    assert bundled.repo_id == kernel.repo_id
+    assert bundled.variants == (kernel.variant,)
+
+    # Import the bundle on a "machine" without the kernel and without Hub access.
+    target_dir = tmp_path / "target"
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(target_dir))
+    monkeypatch.setattr("kernels.utils.snapshot_download", _no_snapshot_download)
+    with open(bundle_path, "rb") as f:
+        (imported,) = import_bundle(f, max_workers=2)
+    assert imported == bundled
+
+    _, variant_path = install_kernel(
+        kernel.repo_id, kernel.sha, variant_locks=lock.variants
+    )
+    assert variant_path.is_relative_to(target_dir)
+    assert (variant_path / "ops.py").is_symlink()
+    assert "0.1.0" in (variant_path / "ops.py").read_text()
+
+    # Importing again is a no-op.
+    assert import_bundle(bundle_path) == [bundled]
+
+
+def test_bundle_import_verifies_blobs(tmp_path, monkeypatch):
+    source_dir = tmp_path / "source"
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(source_dir))
+    kernel = create_fake_kernel(source_dir)
+    lock = KernelLock(
+        repo_id=kernel.repo_id,
+        sha=kernel.sha,
+        variants={kernel.variant: VariantLock(hash=kernel.hash)},
+    )
+    bundle = io.BytesIO()
+    export_bundle([lock], bundle, local_files_only=True)
+
+    # Replace the contents of the blob.
+    bundle.seek(0)
+    tampered = io.BytesIO()
+    with (
+        tarfile.open(fileobj=bundle) as src,
+        tarfile.open(fileobj=tampered, mode="w") as dst,
+    ):
+        for member in src:
+            data = src.extractfile(member).read()
+            if member.name.startswith("blobs/"):
+                data = b"import os\n"
+                member.size = len(data)
+            dst.addfile(member, io.BytesIO(data))
+
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path / "target"))
+    tampered.seek(0)
+    with pytest.raises(ValueError, match="in kernel bundle has hash"):
+        import_bundle(tampered)
+    assert not list((tmp_path / "target").rglob("*.incomplete"))
+
+
+def _rewrite_bundle_index(bundle, update_index):
+    bundle.seek(0)
+    rewritten = io.BytesIO()
+    with (
+        tarfile.open(fileobj=bundle) as src,
+        tarfile.open(fileobj=rewritten, mode="w") as dst,
+    ):
+        for member in src:
+            data = src.extractfile(member).read()
+            if member.name == "kernels-bundle.json":
+                index = json.loads(data)
+                update_index(index)
+                data = json.dumps(index).encode("utf-8")
+                member.size = len(data)
+            dst.addfile(member, io.BytesIO(data))
+    rewritten.seek(0)
+    return rewritten
+
+
+def test_bundle_import_verifies_index(tmp_path, monkeypatch):
+    source_dir = tmp_path / "source"
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(source_dir))
+    kernel = create_fake_kernel(source_dir)
+    lock = KernelLock(
+        repo_id=kernel.repo_id,
+        sha=kernel.sha,
+        variants={kernel.variant: VariantLock(hash=kernel.hash)},
+    )
+    bundle = io.BytesIO()
+    export_bundle([lock], bundle, local_files_only=True)
+
+    target_dir = tmp_path / "target"
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(target_dir))
+
+    def set_field(name, value):
+        return lambda index: index["kernels"][0].update({name: value})
+
+    with pytest.raises(ValueError, match="Invalid repository"):
+        import_bundle(_rewrite_bundle_index(bundle, set_field("repo_id", "../x")))
+    with pytest.raises(ValueError, match="Invalid commit SHA"):
+        import_bundle(_rewrite_bundle_index(bundle, set_field("sha", "main")))
+    assert not target_dir.exists()
+
+    # A bundle whose variant hashes match its own index is only accepted
+    # when it is not verified against locks.
+    other = create_fake_kernel(tmp_path / "other", files={"__init__.py": "x = 1\n"})
+    other_lock = KernelLock(
+        repo_id=kernel.repo_id,
+        sha=kernel.sha,
+        variants={kernel.variant: VariantLock(hash=other.hash)},
+    )
+    bundle.seek(0)
+    with pytest.raises(ValueError, match="but it is locked with hash"):
+        import_bundle(bundle, kernel_locks=[other_lock])
+    bundle.seek(0)
+    with pytest.raises(ValueError, match="unlocked"):
+        import_bundle(bundle, kernel_locks=[])
+    bundle.seek(0)
+    (imported,) = import_bundle(bundle, kernel_locks=[lock])
+    assert imported.repo_id == kernel.repo_id
+
+
+def test_dedupe_kernel_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+    files = {"__init__.py": "def version():\n    return '0.1.0'\n" * 64}
+    kernels = [
+        create_fake_kernel(tmp_path, repo_id=f"kernels-test/kernel-{i}", files=files)
+        for i in range(3)
+    ]
+    blob_paths = [
+        (kernel.snapshot_path / "build" / kernel.variant / "__init__.py").resolve()
+        for kernel in kernels
+    ]
+    blob_size = blob_paths[0].stat().st_size
+
+    assert dedupe_kernel_cache(dry_run=True) == 2 * blob_size
+    assert not os.path.samefile(blob_paths[0], blob_paths[1])
+
+    assert dedupe_kernel_cache() == 2 * blob_size
+    assert os.path.samefile(blob_paths[0], blob_paths[1])
+    assert os.path.samefile(blob_paths[0], blob_paths[2])
+    assert scan_kernel_cache().size_on_disk == blob_size
+    assert dedupe_kernel_cache(dry_run=True) == 0
+
+    # Kernels are deduplicated on download when enabled.
+    monkeypatch.setenv("KERNELS_CACHE_DEDUPE", "1")
+    new_kernel = create_fake_kernel(
+        tmp_path, repo_id="kernels-test/kernel-new", files=files
+    )
+    _, variant_path = install_kernel(
+        new_kernel.repo_id, new_kernel.sha, local_files_only=True
+    )
+    assert os.path.samefile(blob_paths[0], (variant_path / "__init__.py").resolve())
+
+    # Blobs are removed from the store when no kernel uses them anymore.
+    prune_kernel_cache(0)
+    assert scan_kernel_cache().kernels == []
+    assert list((tmp_path / ".kernels" / "blobs").iterdir()) == []
+
+
+def test_import_without_precompile_uses_default_loader(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+    monkeypatch.delenv("KERNELS_PRECOMPILE", raising=False)
+    kernel = create_fake_kernel(tmp_path, repo_id="kernels-test/fake-default")
+
+    meta_path = list(sys.meta_path)
+    module = _import_from_path("fake", kernel.snapshot_path / "build" / kernel.variant)
+    assert module.version() == "0.1.0"
+    assert not isinstance(module.__loader__, _CachedBytecodeLoader)
+    assert sys.meta_path == meta_path
+    assert not bytecode_dir(tmp_path / ".kernels").exists()
+
+
+def test_precompiled_bytecode(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path))
+    kernel = create_fake_kernel(
+        tmp_path,
+        files={
+            "__init__.py": "from .ops import version\n",
+            "ops.py": "def version():\n    return '0.1.0'\n",
+        },
+    )
+
+    (result,) = prefetch_kernels(
+        [KernelSpec(repo_id=kernel.repo_id, revision=kernel.sha)],
+        local_files_only=True,
+        precompile=True,
+    )
+    assert result.ok
+    pycache_dir = bytecode_dir(tmp_path / ".kernels")
+    assert len(list(pycache_dir.rglob("*.pyc"))) == 2
+
+    # The precompiled bytecode is used for the package and its submodules.
+    def source_to_code(*args, **kwargs):
+        raise AssertionError("kernel sources should not be compiled")
+
+    monkeypatch.setattr(_CachedBytecodeLoader, "source_to_code", source_to_code)
+    module = _import_from_path("fake", result.path)
+    assert module.version() == "0.1.0"
+
+    # No bytecode is written to the snapshot.
+    assert not list(kernel.snapshot_path.rglob("__pycache__"))
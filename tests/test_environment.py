@@ -0,0 +1,45 @@
+import pytest
+
+from kernels import EnvironmentFingerprint, current_environment, use_environment
+from kernels.utils import backend, build_variants
+
+
+@pytest.mark.parametrize(
+    "variant,backend,noarch",
+    [
+        ("torch28-cxx11-cu128-x86_64-linux", "cuda", "torch-cuda"),
+        ("torch27-cxx98-rocm63-x86_64-linux", "hip", "torch-rocm"),
+        ("torch28-cxx11-xpu20251-x86_64-linux", "xpu", "torch-xpu"),
+        ("torch28-cxx11-cpu-aarch64-linux", "cpu", "torch-cpu"),
+        ("torch28-metal-aarch64-darwin", "metal", "torch-metal"),
+        ("torch29-cu128-x86_64-windows", "cuda", "torch-cuda"),
+    ],
+)
+def test_from_build_variant(variant, backend, noarch):
+    env = EnvironmentFingerprint.from_build_variant(variant)
+    assert env.backend == backend
+    assert env.build_variants == [variant, noarch, "torch-universal"]
+
+
+def test_invalid_build_variant():
+    with pytest.raises(ValueError, match="Invalid build variant"):
+        EnvironmentFingerprint.from_build_variant("torch-cuda")
+
+
+def test_current_environment_is_cached():
+    assert current_environment() is current_environment()
+    assert build_variants() == current_environment().build_variants
+
+
+def test_use_environment():
+    detected = current_environment()
+
+    with use_environment("torch28-cxx11-rocm63-x86_64-linux"):
+        assert backend() == "hip"
+        assert build_variants() == [
+            "torch28-cxx11-rocm63-x86_64-linux",
+            "torch-rocm",
+            "torch-universal",
+        ]
+
+    assert current_environment() is detected
@@ -1,3 +1,8 @@
+import importlib
+import importlib.metadata
+import json
+import os
+import sys
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -15,6 +20,8 @@ from kernels import (
     use_kernel_mapping,
 )
 from kernels.cli import download_kernels
+from kernels.lockfile import LockfileIndex
+from kernels.utils import _get_caller_locked_kernel
 
 
 # Mock download arguments class.
@@ -22,6 +29,9 @@ from kernels.cli import download_kernels
 class DownloadArgs:
     all_variants: bool
     project_dir: Path
+    jobs: int = 1
+    target: list[str] | None = None
+    precompile: bool = False
 
 
 def test_download_all_hash_validation():
@@ -130,3 +140,105 @@ def test_func_locked(device):
         model = kernelize(model, mode=Mode.INFERENCE, device=device)
 
     assert version() == "0.0.0"
+
+
+@pytest.fixture
+def locked_package(tmp_path, monkeypatch):
+    package_path = tmp_path / "locked_package"
+    package_path.mkdir()
+    (package_path / "__init__.py").write_text(
+        "from kernels import LockedLayerRepository\n"
+        "from kernels.utils import _get_caller_locked_kernel\n"
+        "\n"
+        "def locked_sha(repo_id):\n"
+        "    return _get_caller_locked_kernel(repo_id)\n"
+        "\n"
+        "def locked_layer(repo_id):\n"
+        "    return LockedLayerRepository(repo_id, layer_name='Layer')\n"
+    )
+
+    dist_info = tmp_path / "locked_package-0.1.0.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text(
+        "Metadata-Version: 2.1\nName: locked-package\nVersion: 0.1.0\n"
+    )
+    (dist_info / "top_level.txt").write_text("locked_package\n")
+    (dist_info / "kernels.lock").write_text(
+        (Path(__file__).parent / "layer_locking" / "kernels.lock").read_text()
+    )
+
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "locked_package", raising=False)
+    yield importlib.import_module("locked_package")
+    sys.modules.pop("locked_package", None)
+
+
+def test_caller_locked_kernel(locked_package, monkeypatch):
+    lock_json = json.loads(
+        (Path(__file__).parent / "layer_locking" / "kernels.lock").read_text()
+    )
+    locked_sha = lock_json[0]["sha"]
+
+    assert locked_package.locked_sha("kernels-test/versions") == locked_sha
+    assert locked_package.locked_sha("kernels-test/non-existing") is None
+    # Locked repositories use the lock of the package that creates them.
+    assert (
+        locked_package.locked_layer("kernels-test/versions")._resolve_revision()
+        == locked_sha
+    )
+
+    # The test module is not part of a distribution.
+    assert _get_caller_locked_kernel("kernels-test/versions") is None
+
+    # The distribution index is only rebuilt when sys.path changes.
+    n_scans = 0
+    packages_distributions = importlib.metadata.packages_distributions
+
+    def counting_packages_distributions():
+        nonlocal n_scans
+        n_scans += 1
+        return packages_distributions()
+
+    monkeypatch.setattr(
+        importlib.metadata, "packages_distributions", counting_packages_distributions
+    )
+    monkeypatch.syspath_prepend(str(Path(__file__).parent))
+    for _ in range(3):
+        assert locked_package.locked_sha("kernels-test/versions") == locked_sha
+    assert n_scans == 1
+
+
+def test_lockfile_index(tmp_path):
+    lockfile = tmp_path / "kernels.lock"
+    lockfile.write_text(
+        (Path(__file__).parent / "layer_locking" / "kernels.lock").read_text()
+    )
+
+    index = LockfileIndex.load(lockfile)
+    assert "kernels-test/versions" in index
+    assert index.get("kernels-test/non-existing") is None
+    # The lockfile is only parsed once.
+    assert LockfileIndex.load(lockfile) is index
+
+    lockfile.write_text("[]")
+    os.utime(lockfile, ns=(0, 0))
+    assert len(LockfileIndex.load(lockfile)) == 0
+
+
+def test_locked_repository_is_lazy(tmp_path):
+    lockfile = tmp_path / "kernels.lock"
+
+    # Constructing locked repositories does not read the lockfile.
+    layer_repo = LockedLayerRepository(
+        repo_id="kernels-test/versions", layer_name="Version", lockfile=lockfile
+    )
+    func_repo = LockedFuncRepository(
+        repo_id="kernels-test/versions", func_name="version", lockfile=lockfile
+    )
+
+    lockfile.write_text(
+        (Path(__file__).parent / "layer_locking" / "kernels.lock").read_text()
+    )
+    locked_sha = LockfileIndex.load(lockfile).get("kernels-test/versions").sha
+    assert layer_repo._resolve_revision() == locked_sha
+    assert func_repo._resolve_revision() == locked_sha
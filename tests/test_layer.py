@@ -1,4 +1,7 @@
+import json
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import nullcontext
 
 import pytest
@@ -6,19 +9,25 @@ import torch
 import torch.nn as nn
 from torch.nn import functional as F
 
+from conftest import create_fake_kernel
 from kernels import (
     CUDAProperties,
     Device,
     FuncRepository,
     LayerRepository,
     LocalLayerRepository,
+    LockedLayerRepository,
     Mode,
+    ModulePlan,
     kernelize,
+    plan_kernelize,
+    prefetch_layers,
     register_kernel_mapping,
     use_kernel_forward_from_hub,
     use_kernel_mapping,
 )
 from kernels.layer.layer import (
+    _CACHED_LAYER,
     _KERNEL_MAPPING,
     _validate_layer,
 )
@@ -1143,3 +1152,416 @@ def test_layer_versions(device):
                 }
             }
         )
+
+
+class _CountingRepository:
+    """Repository that returns a local layer and counts how often it is loaded."""
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.n_loads = 0
+
+    def load(self):
+        self.n_loads += 1
+        return self.layer
+
+
+def test_kernelize_resolves_once_per_class(monkeypatch):
+    class SiluAndMulKernel(nn.Module):
+        def forward(self, input: torch.Tensor) -> torch.Tensor:
+            return F.silu(input)
+
+    @use_kernel_forward_from_hub("SiluAndMulManyInstances")
+    class SiluAndMulManyInstances(SiluAndMul):
+        pass
+
+    # `kernels.layer.kernelize` is shadowed by the function of the same name.
+    kernelize_module = sys.modules["kernels.layer.kernelize"]
+
+    n_resolves = 0
+    resolve_layer = kernelize_module._resolve_layer
+
+    def counting_resolve_layer(*args, **kwargs):
+        nonlocal n_resolves
+        n_resolves += 1
+        return resolve_layer(*args, **kwargs)
+
+    monkeypatch.setattr(kernelize_module, "_resolve_layer", counting_resolve_layer)
+
+    repo = _CountingRepository(SiluAndMulKernel)
+    model = nn.Sequential(*[SiluAndMulManyInstances() for _ in range(64)])
+    with use_kernel_mapping({"SiluAndMulManyInstances": {"cpu": repo}}):
+        kernelize(model, mode=Mode.INFERENCE, device="cpu")
+
+    assert n_resolves == 1
+    assert repo.n_loads == 1
+    X = torch.randn(4, 8)
+    for module in model:
+        torch.testing.assert_close(module(X), F.silu(X))
+        assert module.n_calls == 0
+
+
+class _BarrierRepository(_CountingRepository):
+    """Repository whose load only finishes when all repositories are loading."""
+
+    def __init__(self, layer, barrier: threading.Barrier):
+        super().__init__(layer)
+        self.barrier = barrier
+
+    def load(self):
+        self.barrier.wait()
+        return super().load()
+
+
+def test_kernelize_loads_layers_concurrently():
+    class SiluKernel(nn.Module):
+        def forward(self, input: torch.Tensor) -> torch.Tensor:
+            return F.silu(input)
+
+    @use_kernel_forward_from_hub("SiluAndMulConcurrent1")
+    class SiluAndMulConcurrent1(SiluAndMul):
+        pass
+
+    @use_kernel_forward_from_hub("SiluAndMulConcurrent2")
+    class SiluAndMulConcurrent2(SiluAndMul):
+        pass
+
+    # Loading deadlocks (and the barrier times out) if the layers are
+    # loaded one after the other.
+    barrier = threading.Barrier(2, timeout=10)
+    repo1 = _BarrierRepository(SiluKernel, barrier)
+    repo2 = _BarrierRepository(SiluKernel, barrier)
+    model = nn.Sequential(SiluAndMulConcurrent1(), SiluAndMulConcurrent2())
+    with use_kernel_mapping(
+        {
+            "SiluAndMulConcurrent1": {"cpu": repo1},
+            "SiluAndMulConcurrent2": {"cpu": repo2},
+        }
+    ):
+        kernelize(model, mode=Mode.INFERENCE, device="cpu", max_workers=2)
+
+    assert repo1.n_loads == 1
+    assert repo2.n_loads == 1
+    X = torch.randn(4, 8)
+    for module in model:
+        torch.testing.assert_close(module(X), F.silu(X))
+
+
+def test_prefetch_layers():
+    class SiluKernel(nn.Module):
+        def forward(self, input: torch.Tensor) -> torch.Tensor:
+            return F.silu(input)
+
+    @use_kernel_forward_from_hub("SiluAndMulPrefetch1")
+    class SiluAndMulPrefetch1(SiluAndMul):
+        pass
+
+    @use_kernel_forward_from_hub("SiluAndMulPrefetch2")
+    class SiluAndMulPrefetch2(SiluAndMul):
+        pass
+
+    repo1 = _CountingRepository(SiluKernel)
+    repo2 = _CountingRepository(SiluKernel)
+    with torch.device("meta"):
+        meta_model = nn.Sequential(SiluAndMulPrefetch1(), SiluAndMulPrefetch2())
+    with use_kernel_mapping(
+        {
+            "SiluAndMulPrefetch1": {"cpu": repo1},
+            "SiluAndMulPrefetch2": {"cpu": repo2},
+        }
+    ):
+        prefetch = prefetch_layers(meta_model, mode=Mode.INFERENCE, device="cpu")
+        assert prefetch.result(timeout=10) is None
+        assert repo1.n_loads == 1
+        assert repo2.n_loads == 1
+
+        model = nn.Sequential(SiluAndMulPrefetch1(), SiluAndMulPrefetch2())
+        kernelize(model, mode=Mode.INFERENCE, device="cpu")
+
+    # The prefetched layers are used without loading them again.
+    assert repo1.n_loads == 1
+    assert repo2.n_loads == 1
+    X = torch.randn(4, 8)
+    for module in model:
+        torch.testing.assert_close(module(X), F.silu(X))
+
+
+def test_plan_kernelize():
+    @use_kernel_forward_from_hub("SiluAndMulPlan")
+    class SiluAndMulPlan(SiluAndMul):
+        pass
+
+    @use_kernel_forward_from_hub("SiluAndMulPlanUnmapped")
+    class SiluAndMulPlanUnmapped(SiluAndMul):
+        pass
+
+    repo_sm80 = _CountingRepository(SiluAndMul)
+    repo_sm90 = _CountingRepository(SiluAndMul)
+    model = nn.Sequential(
+        SiluAndMulPlan(),
+        nn.Sequential(SiluAndMulPlan(), SiluAndMulPlanUnmapped()),
+    )
+    with use_kernel_mapping(
+        {
+            "SiluAndMulPlan": {
+                Device(
+                    type="cuda",
+                    properties=CUDAProperties(min_capability=80, max_capability=89),
+                ): repo_sm80,
+                Device(
+                    type="cuda",
+                    properties=CUDAProperties(min_capability=90, max_capability=100),
+                ): {Mode.TRAINING: repo_sm90},
+            }
+        }
+    ):
+        plan = plan_kernelize(model, mode=Mode.INFERENCE, device="cuda", capability=90)
+        no_kernel_plan = plan_kernelize(
+            model, mode=Mode.INFERENCE, device="cuda", capability=75
+        )
+
+    assert set(plan.modules) == {"0", "1.0", "1.1"}
+    assert plan.modules["0"] == ModulePlan(
+        layer_name="SiluAndMulPlan",
+        repo=repo_sm90,
+        repo_mode=Mode.TRAINING,
+        capability_interval=(90, 100),
+        fallback_reason=None,
+    )
+    assert plan.modules["1.0"] == plan.modules["0"]
+    assert plan.modules["1.1"].repo is None
+    assert plan.modules["1.1"].fallback_reason == (
+        "No layer mapping for `SiluAndMulPlanUnmapped`"
+    )
+    assert plan.n_kernelized == 2
+    assert plan.n_fallback == 1
+    assert plan.repos == {repo_sm90: 2}
+
+    assert no_kernel_plan.n_kernelized == 0
+    assert no_kernel_plan.fallback_reasons == {
+        "No layer mapping for `SiluAndMulPlan` device `Device(type='cuda', properties=None)` with the right properties": 2,
+        "No layer mapping for `SiluAndMulPlanUnmapped`": 1,
+    }
+
+    # Planning does not load kernels.
+    assert repo_sm80.n_loads == 0
+    assert repo_sm90.n_loads == 0
+
+
+def test_kernelize_plan_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path / "cache"))
+    kernel = create_fake_kernel(
+        tmp_path / "cache",
+        repo_id="kernels-test/plan-cache",
+        files={
+            "__init__.py": "from . import layers\n",
+            "layers.py": (
+                "import torch\n"
+                "from torch import nn\n"
+                "from torch.nn import functional as F\n\n\n"
+                "class Silu(nn.Module):\n"
+                "    def forward(self, input: torch.Tensor) -> torch.Tensor:\n"
+                "        return F.silu(input)\n"
+            ),
+        },
+    )
+    install_kernel(kernel.repo_id, kernel.sha, local_files_only=True)
+
+    @use_kernel_forward_from_hub("SiluAndMulPlanCache")
+    class SiluAndMulPlanCache(SiluAndMul):
+        pass
+
+    @use_kernel_forward_from_hub("SiluAndMulPlanCacheUnmapped")
+    class SiluAndMulPlanCacheUnmapped(SiluAndMul):
+        pass
+
+    # `kernels.layer.kernelize` is shadowed by the function of the same name.
+    kernelize_module = sys.modules["kernels.layer.kernelize"]
+    n_resolves = 0
+    resolve_layer = kernelize_module._resolve_layer
+
+    def counting_resolve_layer(*args, **kwargs):
+        nonlocal n_resolves
+        n_resolves += 1
+        return resolve_layer(*args, **kwargs)
+
+    monkeypatch.setattr(kernelize_module, "_resolve_layer", counting_resolve_layer)
+
+    plan_path = tmp_path / "plan.json"
+    mapping = {
+        "SiluAndMulPlanCache": {
+            "cpu": LayerRepository(
+                repo_id=kernel.repo_id, layer_name="Silu", revision=kernel.sha
+            )
+        }
+    }
+
+    def kernelize_model():
+        model = nn.Sequential(SiluAndMulPlanCache(), SiluAndMulPlanCacheUnmapped())
+        kernelize(model, mode=Mode.INFERENCE, device="cpu", plan_cache=plan_path)
+        X = torch.randn(4, 8)
+        torch.testing.assert_close(model[0](X), F.silu(X))
+        assert model[0].n_calls == 0
+        model[1](X)
+        assert model[1].n_calls == 1
+
+    with use_kernel_mapping(mapping):
+        kernelize_model()
+    assert n_resolves == 2
+
+    plan = json.loads(plan_path.read_text())
+    layers = plan["layers"]
+    assert layers[f"{__name__}.{SiluAndMulPlanCache.__qualname__}"] == {
+        "repo_id": kernel.repo_id,
+        "sha": kernel.sha,
+        "variant": kernel.variant,
+        "layer_name": "Silu",
+        "mode": Mode.FALLBACK.value,
+    }
+    assert layers[f"{__name__}.{SiluAndMulPlanCacheUnmapped.__qualname__}"] == {
+        "fallback": True
+    }
+
+    # Replaying the plan neither resolves nor validates layers.
+    with use_kernel_mapping(mapping), pytest.MonkeyPatch.context() as m:
+        m.setattr("kernels.layer.layer._validate_layer", None)
+        kernelize_model()
+    assert n_resolves == 2
+
+    # The plan is invalidated when the mapping changes.
+    with (
+        use_kernel_mapping(mapping),
+        use_kernel_mapping(
+            {"SiluAndMulPlanCacheOther": mapping["SiluAndMulPlanCache"]}
+        ),
+    ):
+        kernelize_model()
+    assert n_resolves == 4
+
+
+def test_kernelize_plan_cache_locked_repository(tmp_path, monkeypatch):
+    monkeypatch.setattr("kernels.utils.CACHE_DIR", str(tmp_path / "cache"))
+    layers_py = (
+        "import torch\n"
+        "from torch import nn\n"
+        "from torch.nn import functional as F\n\n\n"
+        "class Silu(nn.Module):\n"
+        "    def forward(self, input: torch.Tensor) -> torch.Tensor:\n"
+        "        return F.silu(input)\n"
+    )
+    kernels = [
+        create_fake_kernel(
+            tmp_path / "cache",
+            repo_id="kernels-test/plan-cache-locked",
+            sha=sha,
+            files={"__init__.py": "from . import layers\n", "layers.py": layers_py},
+        )
+        for sha in ["1" * 40, "2" * 40]
+    ]
+    for kernel in kernels:
+        install_kernel(kernel.repo_id, kernel.sha, local_files_only=True)
+
+    @use_kernel_forward_from_hub("SiluAndMulPlanCacheLocked")
+    class SiluAndMulPlanCacheLocked(SiluAndMul):
+        pass
+
+    lockfile = tmp_path / "kernels.lock"
+    plan_path = tmp_path / "plan.json"
+    mapping = {
+        "SiluAndMulPlanCacheLocked": {
+            "cpu": LockedLayerRepository(
+                repo_id=kernels[0].repo_id, lockfile=lockfile, layer_name="Silu"
+            )
+        }
+    }
+
+    for kernel in kernels:
+        lockfile.write_text(
+            json.dumps(
+                [
+                    {
+                        "repo_id": kernel.repo_id,
+                        "sha": kernel.sha,
+                        "variants": {kernel.variant: {"hash": kernel.hash}},
+                    }
+                ]
+            )
+        )
+        # Start from a clean slate, like a new process would.
+        LockedLayerRepository._resolve_revision.cache_clear()
+        _CACHED_LAYER.clear()
+
+        model = nn.Sequential(SiluAndMulPlanCacheLocked())
+        with use_kernel_mapping(mapping):
+            kernelize(model, mode=Mode.INFERENCE, device="cpu", plan_cache=plan_path)
+        X = torch.randn(4, 8)
+        torch.testing.assert_close(model[0](X), F.silu(X))
+
+        # The plan is invalidated when the locked revision changes.
+        layers = json.loads(plan_path.read_text())["layers"]
+        entry = layers[f"{__name__}.{SiluAndMulPlanCacheLocked.__qualname__}"]
+        assert entry["sha"] == kernel.sha
+        assert sys.modules[model[0].forward.__module__].__file__.startswith(
+            str(kernel.snapshot_path)
+        )
+
+
+def test_mapping_contexts_share_structure():
+    repo = _CountingRepository(SiluAndMul)
+    override_repo = _CountingRepository(SiluAndMul)
+
+    with use_kernel_mapping({"SiluAndMulShared": {"cpu": repo}}):
+        outer = _KERNEL_MAPPING.get()
+
+        with use_kernel_mapping({"SiluAndMulOverride": {"cpu": override_repo}}):
+            inner = _KERNEL_MAPPING.get()
+            assert inner is not outer
+            assert {"SiluAndMulShared", "SiluAndMulOverride"} <= set(inner)
+            # Layers that are not overridden are shared, not copied.
+            assert inner["SiluAndMulShared"] is outer["SiluAndMulShared"]
+            assert inner["SiluAndMulShared"]["cpu"].repos[Mode.FALLBACK] is repo
+
+            with use_kernel_mapping({"SiluAndMulShared": {"cpu": override_repo}}):
+                innermost = _KERNEL_MAPPING.get()
+                assert (
+                    innermost["SiluAndMulShared"]["cpu"].repos[Mode.FALLBACK]
+                    is override_repo
+                )
+
+            # Overrides do not modify the mappings of outer contexts.
+            assert inner["SiluAndMulShared"]["cpu"].repos[Mode.FALLBACK] is repo
+
+        assert _KERNEL_MAPPING.get() is outer
+        assert "SiluAndMulOverride" not in outer
+
+    assert "SiluAndMulShared" not in _KERNEL_MAPPING.get()
+
+
+def test_mapping_context_cuda_capabilities_copy_on_write():
+    repo_sm80 = _CountingRepository(SiluAndMul)
+    repo_sm90 = _CountingRepository(SiluAndMul)
+    device_sm80 = Device(
+        type="cuda", properties=CUDAProperties(min_capability=80, max_capability=89)
+    )
+    device_sm90 = Device(
+        type="cuda", properties=CUDAProperties(min_capability=90, max_capability=100)
+    )
+
+    with use_kernel_mapping({"SiluAndMulCapabilities": {device_sm80: repo_sm80}}):
+        outer = _KERNEL_MAPPING.get()["SiluAndMulCapabilities"]["cuda"]
+        with use_kernel_mapping({"SiluAndMulCapabilities": {device_sm90: repo_sm90}}):
+            inner = _KERNEL_MAPPING.get()["SiluAndMulCapabilities"]["cuda"]
+            assert [interval for interval, _ in inner.entries()] == [
+                (80, 89),
+                (90, 100),
+            ]
+        assert [interval for interval, _ in outer.entries()] == [(80, 89)]
+
+
+def test_register_kernel_mapping_visible_in_threads():
+    repo = _CountingRepository(SiluAndMul)
+    register_kernel_mapping({"SiluAndMulThreads": {"cpu": repo}})
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        mapping = executor.submit(_KERNEL_MAPPING.get).result()
+    assert mapping["SiluAndMulThreads"]["cpu"].repos[Mode.FALLBACK] is repo
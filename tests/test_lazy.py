@@ -0,0 +1,118 @@
+import subprocess
+import sys
+import threading
+from types import ModuleType
+
+import pytest
+
+import kernels
+
+from kernels import get_kernel
+from kernels.layer.func import FuncRepository, _get_kernel_func
+from kernels.layer.layer import LayerRepository, _get_kernel_layer
+from kernels.utils import LazyKernel
+
+
+def _counting_loader(files: dict):
+    n_loads = 0
+
+    def load():
+        nonlocal n_loads
+        n_loads += 1
+        module = ModuleType("fake_kernel")
+        module.__dict__.update(files)
+        return module
+
+    return load, lambda: n_loads
+
+
+def test_lazy_kernel_is_not_loaded():
+    def load():
+        raise AssertionError("kernel should not be loaded")
+
+    kernel = get_kernel("kernels-test/non-existing", lazy=True)
+    assert isinstance(kernel, ModuleType)
+    assert "not loaded" in repr(kernel)
+
+    kernel = LazyKernel("kernels-test/non-existing", load)
+    assert "not loaded" in repr(kernel)
+
+
+def test_lazy_kernel_loads_once():
+    load, n_loads = _counting_loader({"version": lambda: "0.1.0"})
+    kernel = LazyKernel("kernels-test/fake", load)
+
+    threads = [threading.Thread(target=lambda: kernel.version()) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert kernel.version() == "0.1.0"
+    assert "version" in dir(kernel)
+    assert n_loads() == 1
+
+    with pytest.raises(AttributeError):
+        kernel.non_existing
+
+
+def test_lazy_kernel_layers_and_funcs():
+    class Layers:
+        class SiluAndMul:
+            pass
+
+    def silu_and_mul(x):
+        return x
+
+    load, n_loads = _counting_loader({"layers": Layers, "silu_and_mul": silu_and_mul})
+    kernel = LazyKernel("kernels-test/fake", load)
+
+    layer_repo = LayerRepository("kernels-test/fake", layer_name="SiluAndMul")
+    assert _get_kernel_layer(layer_repo, kernel) is Layers.SiluAndMul
+
+    func_repo = FuncRepository("kernels-test/fake", func_name="silu_and_mul")
+    assert _get_kernel_func(func_repo, kernel)().forward(42) == 42
+
+    with pytest.raises(ValueError, match="not found"):
+        _get_kernel_func(
+            FuncRepository("kernels-test/fake", func_name="non_existing"), kernel
+        )
+
+    assert n_loads() == 1
+
+
+def test_import_kernels_is_lazy():
+    # Run in a fresh interpreter, since the test session already imported
+    # most modules.
+    heavy_modules = [
+        "huggingface_hub",
+        "kernels.benchmark",
+        "kernels.doc",
+        "kernels.layer",
+        "kernels.utils",
+        "packaging",
+        "requests",
+        "torch",
+    ]
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, kernels; "
+            f"print(','.join(m for m in {heavy_modules!r} if m in sys.modules))",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+    assert loaded == ""
+
+
+def test_lazy_public_api():
+    assert set(kernels._LAZY_IMPORTS) == set(kernels.__all__) - {"__version__"}
+    assert set(kernels.__all__) <= set(dir(kernels))
+    for name in kernels.__all__:
+        assert getattr(kernels, name) is not None
+
+    with pytest.raises(AttributeError, match="has no attribute"):
+        kernels.non_existing
@@ -0,0 +1,112 @@
+import json
+import threading
+
+import pytest
+
+from kernels import (
+    get_kernel,
+    invalidate_loaded_kernels,
+    load_kernel,
+    loaded_kernels_stats,
+)
+from kernels._registry import KernelKey, KernelRegistry
+from kernels.utils import install_kernel
+
+
+@pytest.fixture
+def lockfile(fake_kernel, tmp_path):
+    lockfile = tmp_path / "kernels.lock"
+    lockfile.write_text(
+        json.dumps(
+            [
+                {
+                    "repo_id": fake_kernel.repo_id,
+                    "sha": fake_kernel.sha,
+                    "variants": {fake_kernel.variant: {"hash": fake_kernel.hash}},
+                }
+            ]
+        )
+    )
+    yield lockfile
+    invalidate_loaded_kernels()
+
+
+def test_registry_reuses_module(fake_kernel, lockfile):
+    invalidate_loaded_kernels()
+    before = loaded_kernels_stats()
+
+    kernel = load_kernel(fake_kernel.repo_id, lockfile=lockfile)
+    assert kernel.version() == "0.1.0"
+    assert load_kernel(fake_kernel.repo_id, lockfile=lockfile) is kernel
+    # Commit SHAs are looked up without downloading the snapshot.
+    assert get_kernel(fake_kernel.repo_id, revision=fake_kernel.sha) is kernel
+
+    after = loaded_kernels_stats()
+    assert after.misses - before.misses == 1
+    assert after.hits - before.hits == 2
+    assert after.size == 1
+
+
+def test_registry_invalidation(fake_kernel, lockfile):
+    kernel = load_kernel(fake_kernel.repo_id, lockfile=lockfile)
+
+    assert invalidate_loaded_kernels("kernels-test/other") == 0
+    assert load_kernel(fake_kernel.repo_id, lockfile=lockfile) is kernel
+
+    assert invalidate_loaded_kernels(fake_kernel.repo_id) == 1
+    assert loaded_kernels_stats().size == 0
+    assert load_kernel(fake_kernel.repo_id, lockfile=lockfile) is not kernel
+
+
+def test_registry_concurrent_loads(fake_kernel, lockfile):
+    invalidate_loaded_kernels()
+    before = loaded_kernels_stats()
+
+    kernels = []
+
+    def load():
+        kernels.append(load_kernel(fake_kernel.repo_id, lockfile=lockfile))
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(kernels) == 8
+    assert all(kernel is kernels[0] for kernel in kernels)
+    assert loaded_kernels_stats().misses - before.misses == 1
+
+
+def test_registry_resolves_installed_branch(fake_kernel, lockfile, monkeypatch):
+    # Installing a branch records the commit that it resolved to.
+    install_kernel(fake_kernel.repo_id, "main", local_files_only=True)
+    kernel = get_kernel(fake_kernel.repo_id, revision=fake_kernel.sha)
+
+    def snapshot_download(*args, **kwargs):
+        raise AssertionError("snapshot_download should not be called")
+
+    monkeypatch.setattr("kernels.utils.snapshot_download", snapshot_download)
+
+    # The branch is looked up in the registry without contacting the Hub.
+    assert get_kernel(fake_kernel.repo_id) is kernel
+    assert get_kernel(fake_kernel.repo_id, revision="main") is kernel
+
+    # Expired branches are resolved again.
+    monkeypatch.setenv("KERNELS_METADATA_TTL", "0")
+    with pytest.raises(AssertionError):
+        get_kernel(fake_kernel.repo_id)
+
+
+def test_registry_failed_load_releases_key_lock():
+    registry = KernelRegistry()
+    key = KernelKey(repo_id="kernels-test/broken", sha="0" * 40, variant="torch-cpu")
+
+    def load():
+        raise ImportError("broken kernel")
+
+    with pytest.raises(ImportError, match="broken kernel"):
+        registry.get_or_load(key, load)
+
+    assert registry._key_locks == {}
+    assert registry.stats().size == 0
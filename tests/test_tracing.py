@@ -0,0 +1,88 @@
+import io
+import json
+
+from kernels import invalidate_loaded_kernels, load_kernel
+from kernels import tracing
+from kernels.lockfile import VariantLock
+from kernels.tracing import LoadEvent, LoadEventRecorder, print_load_summary
+from kernels.utils import install_kernel
+
+
+def test_load_events(fake_kernel, tmp_path):
+    lockfile = tmp_path / "kernels.lock"
+    lockfile.write_text(
+        json.dumps(
+            [
+                {
+                    "repo_id": fake_kernel.repo_id,
+                    "sha": fake_kernel.sha,
+                    "variants": {fake_kernel.variant: {"hash": fake_kernel.hash}},
+                }
+            ]
+        )
+    )
+
+    invalidate_loaded_kernels()
+    with LoadEventRecorder() as recorder:
+        install_kernel(
+            fake_kernel.repo_id,
+            fake_kernel.sha,
+            local_files_only=True,
+            variant_locks={fake_kernel.variant: VariantLock(hash=fake_kernel.hash)},
+        )
+        load_kernel(fake_kernel.repo_id, lockfile=lockfile)
+    invalidate_loaded_kernels()
+
+    events = {event.phase: event for event in recorder.events}
+    assert set(events) >= {"download", "validate_kernel", "import"}
+    for event in events.values():
+        assert event.repo_id == fake_kernel.repo_id
+        assert event.revision == fake_kernel.sha
+        assert event.duration >= 0
+        assert event.error is None
+    assert events["validate_kernel"].variant == fake_kernel.variant
+    assert events["validate_kernel"].bytes > 0
+
+    output = io.StringIO()
+    recorder.print_summary(file=output)
+    assert output.getvalue().startswith("PHASE")
+    assert "validate_kernel" in output.getvalue()
+
+
+def test_span_is_noop_without_hooks():
+    assert not tracing._HOOKS
+    with tracing.span("download", repo_id="kernels-test/fake") as span:
+        assert not span.enabled
+
+
+def test_span_records_errors():
+    with LoadEventRecorder() as recorder:
+        try:
+            with tracing.span("import", repo_id="kernels-test/fake"):
+                raise ImportError("missing symbol")
+        except ImportError:
+            pass
+
+    (event,) = recorder.events
+    assert event.error == "ImportError: missing symbol"
+
+
+def test_json_lines_sink(tmp_path):
+    path = tmp_path / "events.jsonl"
+    sink = tracing._JsonLinesSink(str(path))
+    tracing.add_load_hook(sink)
+    try:
+        with tracing.span("download", repo_id="kernels-test/fake") as span:
+            span.set(bytes=42)
+    finally:
+        tracing.remove_load_hook(sink)
+
+    (line,) = path.read_text().splitlines()
+    event = LoadEvent(**json.loads(line))
+    assert event.phase == "download"
+    assert event.bytes == 42
+
+    output = io.StringIO()
+    print_load_summary([event, event], file=output)
+    header, row = output.getvalue().splitlines()
+    assert row.split()[:3] == ["download", "2", "0"]